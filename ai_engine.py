@@ -1,17 +1,16 @@
-import google.generativeai as genai
 import os
 from dotenv import load_dotenv
 from sklearn.linear_model import LinearRegression
 import numpy as np
 
+from llm_gateway import get_gateway
+
 # 1. Load Environment Variables
 load_dotenv()
 api_key = os.getenv("GEMINI_API_KEY")
 
-# 2. Configure Gemini
-if api_key:
-    genai.configure(api_key=api_key)
-else:
+# 2. Gemini is configured lazily by the shared LLM gateway
+if not api_key:
     print("⚠️ Warning: GEMINI_API_KEY not found. AI features will fail.")
 
 # --- THE AI AGENT FUNCTION ---
@@ -23,9 +22,6 @@ def chat_with_agent(query, current_release, batch_context):
         return "Error: AI Key missing. Check .env file."
 
     try:
-        # Initialize Model
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
         # Construct the Prompt
         system_prompt = f"""
         You are a Music Marketing AI.
@@ -46,9 +42,8 @@ def chat_with_agent(query, current_release, batch_context):
         Keep it concise. Do not use markdown. Just raw text.
         """
         
-        # Generate Content
-        response = model.generate_content(system_prompt)
-        return response.text
+        # Generate Content (shared gateway: retries, coalescing, response cache)
+        return get_gateway().generate_blocking(system_prompt, model='gemini-1.5-flash')
         
     except Exception as e:
         return f"Gemini Error: {str(e)}"
@@ -0,0 +1,321 @@
+import io
+import os
+import json
+import zlib
+import struct
+import asyncio
+import hashlib
+import tempfile
+import threading
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+
+from PIL import Image
+
+# --- STYLE REGISTRY ---
+GENRE_STYLES = {
+    "Melodic Techno": "neon lights, futuristic, purple haze, abstract geometric, 4k render",
+    "Deep House": "sunset, ibiza beach, luxury yacht, cocktail, cinematic lighting",
+    "Cyberpunk Bass": "cyberpunk city, glitch art, matrix code, neon rain, sci-fi",
+    "Liquid DnB": "fluid art, blue water, abstract flow, motion blur, smooth",
+    "Lo-Fi Beats": "anime aesthetic, rainy window, cozy room, cat, coffee",
+    "Synthwave": "retro car, 80s grid, palm trees, vaporwave, neon pink sun",
+    "Industrial Techno": "concrete texture, factory smoke, dark warehouse, industrial",
+    "Future Bass": "colorful smoke, festival crowd, lasers, vibrant clouds",
+    "Trap": "urban city night, gold chain, luxury sports car, street lights",
+    "Ambient": "nebula, stars, galaxy, aurora borealis, peaceful nature",
+    "Trance": "laser light show, tunnel, speed lines, energy, euphoria",
+    "Dubstep": "speaker system, shockwave, lightning, explosion, dark energy",
+    "Indie Dance": "disco ball, dance floor, retro fashion, vinyl record",
+    "Nu-Disco": "glitter, roller skates, 70s style, funk, vibrant colors",
+    "Hardstyle": "red lasers, massive stage, fireworks, hardstyle festival"
+}
+
+IMAGE_HOST = "https://image.pollinations.ai/prompt/"
+SIZES = {"thumb": (320, 180), "medium": (640, 360), "full": (1280, 720)}
+SOURCE_SIZE = "full"   # the one size generated upstream; the others are downscaled from it
+
+
+def _compile(style):
+    # (keywords, URL path segment); commas stay literal, as in the original URLs
+    return style, urllib.parse.quote(style, safe=",")
+
+
+# Prompts are compiled once, not per request
+_PROMPTS = {genre: _compile(style) for genre, style in GENRE_STYLES.items()}
+
+
+def prompt_for(genre):
+    compiled = _PROMPTS.get(genre)
+    if compiled is None:
+        compiled = _compile(f"{genre} music abstract art")
+    return compiled
+
+
+def asset_seed(release_id, version):
+    """Same (release, version) -> same seed -> same image upstream and in every cache."""
+    digest = hashlib.sha256(f"{release_id}\0{version}".encode()).digest()
+    return 1000 + int.from_bytes(digest[:4], "big") % 9000
+
+
+def source_url(genre, seed):
+    width, height = SIZES[SOURCE_SIZE]
+    return f"{IMAGE_HOST}{prompt_for(genre)[1]}?width={width}&height={height}&nologo=true&seed={seed}"
+
+
+def downscale(body, size):
+    """(bytes, content type) of the image resized to SIZES[size], in its original format."""
+    with Image.open(io.BytesIO(body)) as image:
+        fmt = image.format or "PNG"
+        resized = image.resize(SIZES[size], Image.LANCZOS)
+    if fmt == "JPEG" and resized.mode not in ("RGB", "L"):
+        resized = resized.convert("RGB")
+    out = io.BytesIO()
+    resized.save(out, fmt, **({"quality": 85, "optimize": True} if fmt == "JPEG" else {}))
+    return out.getvalue(), Image.MIME.get(fmt, "application/octet-stream")
+
+
+# --- FETCHERS ---
+class HttpFetcher:
+    """Downloads the generated image (blocking; called from a worker thread)."""
+
+    def __init__(self, timeout=60.0):
+        self.timeout = timeout
+        self.calls = 0
+
+    def fetch(self, url):
+        self.calls += 1
+        with urllib.request.urlopen(url, timeout=self.timeout) as response:
+            return response.read(), response.headers.get_content_type()
+
+
+class StubFetcher:
+    """Offline fetcher for tests and benchmarks: a solid PNG of the requested size, coloured by the URL."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def fetch(self, url):
+        self.calls += 1
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+        width = int(query.get("width", ["64"])[0])
+        height = int(query.get("height", ["64"])[0])
+        return _solid_png(width, height, hashlib.sha256(url.encode()).digest()[:3]), "image/png"
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def _solid_png(width, height, rgb):
+    row = b"\x00" + bytes(rgb) * width
+    return (b"\x89PNG\r\n\x1a\n"
+            + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + _png_chunk(b"IDAT", zlib.compress(row * height))
+            + _png_chunk(b"IEND", b""))
+
+
+# --- DISK CACHE ---
+class AssetCache:
+    """
+    Content-addressed image cache on local disk.
+
+    - Blobs live at objects/<sha256 of the bytes>, so identical images are
+      stored once; refs/<key> maps a request key (the upstream URL hash) to
+      its blob and content type.
+    - Total blob size is bounded by `max_bytes`; the least recently served
+      blobs are evicted first. A ref whose blob was evicted is a miss.
+    - Writes go through a temp file + rename, so several workers can share
+      one directory and never serve a partial file.
+    """
+
+    def __init__(self, root, max_bytes=512 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._objects = os.path.join(root, "objects")
+        self._refs = os.path.join(root, "refs")
+        os.makedirs(self._objects, exist_ok=True)
+        os.makedirs(self._refs, exist_ok=True)
+        self._lru = OrderedDict()   # digest -> size, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self._scan()
+
+    def _scan(self):
+        # Rebuild the LRU order from blob mtimes (bumped on every hit)
+        blobs = []
+        for name in os.listdir(self._objects):
+            if name.startswith("."):
+                continue  # a write in progress
+            try:
+                st = os.stat(os.path.join(self._objects, name))
+            except FileNotFoundError:
+                continue
+            blobs.append((st.st_mtime, name, st.st_size))
+        for _, digest, size in sorted(blobs):
+            self._lru[digest] = size
+            self._bytes += size
+
+    def blob_path(self, digest):
+        return os.path.join(self._objects, digest)
+
+    def _write(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def get(self, key):
+        """(blob path, digest, content type) or None."""
+        try:
+            with open(os.path.join(self._refs, key)) as f:
+                ref = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        path = self.blob_path(ref["digest"])
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted (possibly by another worker): drop the dangling ref
+            try:
+                os.unlink(os.path.join(self._refs, key))
+            except FileNotFoundError:
+                pass
+            return None
+        with self._lock:
+            if ref["digest"] in self._lru:
+                self._lru.move_to_end(ref["digest"])
+        return path, ref["digest"], ref["content_type"]
+
+    def put(self, key, body, content_type):
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            self._write(path, body)
+        self._write(os.path.join(self._refs, key), json.dumps({"digest": digest, "content_type": content_type}).encode())
+        with self._lock:
+            if digest in self._lru:
+                self._lru.move_to_end(digest)
+            else:
+                self._lru[digest] = len(body)
+                self._bytes += len(body)
+            self._evict(keep=digest)
+        return path, digest, content_type
+
+    def _evict(self, keep):
+        while self._bytes > self.max_bytes and len(self._lru) > 1:
+            digest, size = next(iter(self._lru.items()))
+            if digest == keep:
+                break
+            del self._lru[digest]
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.unlink(self.blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"root": self.root, "blobs": len(self._lru), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+
+# --- SERVICE ---
+class AssetService:
+    """
+    Release artwork: deterministic prompt + seed per (release, version).
+    Only the full size is generated upstream, once; thumb and medium are
+    downscaled from it, so every size is the same picture. All of them are
+    served from the disk cache, and concurrent misses for the same image
+    share one download (or resize).
+    """
+
+    def __init__(self, cache, fetcher):
+        self.cache = cache
+        self.fetcher = fetcher
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.derived = 0
+        self.failures = 0
+
+    @staticmethod
+    def version_of(release, version=None):
+        # Bump `asset_version` on a release (or pass ?version=) for new artwork
+        return version if version is not None else release.get('asset_version', 1)
+
+    def describe(self, release, version=None):
+        version = self.version_of(release, version)
+        genre = release.get('genre', 'Unknown')
+        seed = asset_seed(release['id'], version)
+        return {"keywords": prompt_for(genre)[0], "seed": seed, "version": version,
+                "source_url": source_url(genre, seed)}
+
+    async def get(self, release, size=SOURCE_SIZE, version=None):
+        """(path, digest, content type) of the cached image, downloading (or resizing) it on a miss."""
+        version = self.version_of(release, version)
+        url = source_url(release.get('genre', 'Unknown'), asset_seed(release['id'], version))
+        if size == SOURCE_SIZE:
+            return await self._get(hashlib.sha256(url.encode()).hexdigest(), lambda key: self._fetch(key, url))
+        key = hashlib.sha256(f"{url}\0{size}".encode()).hexdigest()
+        return await self._get(key, lambda key: self._derive(key, release, size, version))
+
+    async def _get(self, key, produce):
+        hit = await asyncio.to_thread(self.cache.get, key)
+        if hit is not None:
+            self.hits += 1
+            return hit
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+        self.misses += 1
+        # Shielded: a client that disconnects doesn't cancel the download for the others
+        task = self._inflight[key] = asyncio.ensure_future(produce(key))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key, url):
+        try:
+            body, content_type = await asyncio.to_thread(self.fetcher.fetch, url)
+            return await asyncio.to_thread(self.cache.put, key, body, content_type)
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _derive(self, key, release, size, version):
+        try:
+            path, _, _ = await self.get(release, SOURCE_SIZE, version)
+            body, content_type = await asyncio.to_thread(self._resize, path, size)
+            self.derived += 1
+            return await asyncio.to_thread(self.cache.put, key, body, content_type)
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _resize(path, size):
+        with open(path, "rb") as f:
+            return downscale(f.read(), size)
+
+    def stats(self):
+        return {**self.cache.stats(), "hits": self.hits, "misses": self.misses,
+                "coalesced": self.coalesced, "derived": self.derived, "failures": self.failures,
+                "fetcher": type(self.fetcher).__name__}
+
+
+def from_env():
+    """ASSET_CACHE_DIR, ASSET_CACHE_MAX_MB (512), ASSET_FETCHER=stub for offline use."""
+    fetcher = StubFetcher() if os.getenv("ASSET_FETCHER", "http").lower() == "stub" else HttpFetcher()
+    cache = AssetCache(os.getenv("ASSET_CACHE_DIR", ".asset-cache"),
+                       max_bytes=int(float(os.getenv("ASSET_CACHE_MAX_MB", "512")) * 1024 * 1024))
+    return AssetService(cache, fetcher)
@@ -0,0 +1,417 @@
+import os
+import time
+import asyncio
+import logging
+
+import numpy as np
+
+import forecasting
+from columnar import HistoryColumns
+from executor import ExecutorSaturated, JobTimeout
+from forecasting import DEFAULT_HORIZON, EWMA_ALPHA, MA_WINDOW, POLY_DEGREES
+from model_cache import history_fingerprint
+
+log = logging.getLogger("backtest")
+
+FOLDS = 3           # rolling origins per release: the last FOLDS horizons are held out in turn
+MIN_TRAIN = 7       # days a fold must train on (releases with fewer days can't be scored)
+METRICS = ("mape", "rmse")
+DEFAULT_ALGO = "linear"   # served by algo=auto until a release has scores
+CHEAP_CHUNK = 20000       # releases per job for the vectorized algorithms
+GBR_CHUNK = 8             # releases per gradient-boosting job (FOLDS fits each)
+SHARED_POLL = 5.0         # seconds between a follower's checks for newly persisted scores
+
+
+# --- FOLDS ---
+def fold_days(lengths, horizon=DEFAULT_HORIZON, folds=FOLDS, min_train=MIN_TRAIN):
+    """
+    Days each series' folds score: the full horizon when one fits after
+    `min_train` days, otherwise the days past `min_train` split across up to
+    `folds` folds (at least one day), so short histories still get scored.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    short = np.maximum(1, (lengths - min_train) // max(folds, 1))
+    return np.where(lengths - min_train >= horizon, horizon, np.minimum(short, horizon))
+
+
+def fold_cases(lengths, horizon=DEFAULT_HORIZON, folds=FOLDS, min_train=MIN_TRAIN):
+    """
+    Rolling-origin cases as (row, origin, days) arrays: for each series, train
+    on [0, origin) and score the next `days` days (fold_days), with
+    origin = n - k * days for k = 1..folds while at least `min_train` days
+    remain to train on.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    days = fold_days(lengths, horizon, folds, min_train)
+    origins = lengths[:, None] - days[:, None] * np.arange(1, folds + 1)[None, :]
+    rows, k = np.nonzero(origins >= min_train)
+    return rows, origins[rows, k], days[rows]
+
+
+def _cases(histories, rows, origins, days, horizon):
+    """(training prefixes as HistoryColumns, (cases, horizon) actuals, NaN past each case's `days`)."""
+    starts = histories.offsets[rows]
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(origins, out=offsets[1:])
+    index = np.repeat(starts - offsets[:-1], origins) + np.arange(offsets[-1])
+    train = HistoryColumns(histories.values[index], offsets)
+    held_out = np.arange(horizon)[None, :] < days[:, None]
+    at = np.where(held_out, (starts + origins)[:, None] + np.arange(horizon)[None, :], 0)
+    actual = np.where(held_out, histories.values[at], np.nan)
+    return train, actual
+
+
+# --- VECTORIZED FORECASTS ---
+# Same numbers as forecasting.forecast for many training prefixes at once (the batched
+# polynomial fits agree up to float rounding, as in forecasting.batch_forecast)
+def _moving_average(train, horizon):
+    csum = np.concatenate([[0.0], np.cumsum(train.flat, dtype=float)])
+    ends = train.offsets[1:]
+    total = csum[ends] - csum[np.maximum(train.offsets[:-1], ends - MA_WINDOW)]
+    return forecasting._clip_matrix(total[:, None] / MA_WINDOW * (1 + 0.01 * np.arange(horizon))[None, :])
+
+
+def _exponential(train, horizon):
+    lengths = train.lengths
+    Y = forecasting._pad(train, lengths, max(1, int(lengths.max())))
+    level = Y[:, 0].copy()
+    for t in range(1, Y.shape[1]):
+        active = t < lengths
+        level[active] = EWMA_ALPHA * Y[active, t] + (1 - EWMA_ALPHA) * level[active]
+    return forecasting._clip_matrix(np.repeat(level[:, None], horizon, axis=1))
+
+
+def forecast_cases(train, algo, horizon=DEFAULT_HORIZON):
+    if algo in POLY_DEGREES:
+        return forecasting.batch_polyfit_forecast(train, POLY_DEGREES[algo], horizon)
+    if algo == "moving_average":
+        return _moving_average(train, horizon)
+    if algo == "exponential":
+        return _exponential(train, horizon)
+    return np.array([forecasting.forecast(h.tolist(), algo, horizon) for h in train], dtype=np.int64).reshape(-1, horizon)
+
+
+# --- SCORING ---
+def score_cases(predicted, actual):
+    """Per-case MAPE (%, over days with sales; NaN if none) and RMSE over the days held out (actual not NaN)."""
+    error = predicted - actual
+    rmse = np.sqrt(np.nanmean(error * error, axis=1))
+    sold = actual > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ape = np.where(sold, np.abs(error) / np.where(sold, actual, 1), 0)
+        mape = 100 * ape.sum(axis=1) / sold.sum(axis=1)
+    return mape, rmse
+
+
+def _per_series(values, rows, n):
+    # Mean over each series' cases, NaNs (and series without cases) ignored
+    ok = ~np.isnan(values)
+    counts = np.bincount(rows[ok], minlength=n)
+    sums = np.bincount(rows[ok], weights=values[ok], minlength=n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def score_chunk(histories, algos, horizon=DEFAULT_HORIZON, folds=FOLDS, min_train=MIN_TRAIN):
+    """
+    Rolling-origin backtest of `algos` over every series of `histories`
+    (HistoryColumns or lists). Returns (folds per series, days per fold per
+    series, {algo: {metric: per-series mean}}). CPU-bound; run it on the ML
+    executor.
+    """
+    if not hasattr(histories, "offsets"):
+        histories = HistoryColumns.from_histories(histories)
+    n = len(histories)
+    rows, origins, days = fold_cases(histories.lengths, horizon, folds, min_train)
+    scores = {}
+    if len(rows):
+        train, actual = _cases(histories, rows, origins, days, horizon)
+    for algo in algos:
+        if not len(rows):
+            scores[algo] = {metric: np.full(n, np.nan) for metric in METRICS}
+            continue
+        mape, rmse = score_cases(forecast_cases(train, algo, horizon).astype(float), actual)
+        scores[algo] = {"mape": _per_series(mape, rows, n), "rmse": _per_series(rmse, rows, n)}
+    return np.bincount(rows, minlength=n), fold_days(histories.lengths, horizon, folds, min_train), scores
+
+
+def pick_best(scores, metric="mape"):
+    """Algorithm with the lowest `metric` (RMSE breaks ties and stands in where MAPE is undefined)."""
+    ranked = [(algo, s.get(metric), s.get("rmse")) for algo, s in scores.items()]
+    ranked = [(algo, m, r) for algo, m, r in ranked if m is not None or r is not None]
+    if not ranked:
+        return None
+    if all(m is not None for _, m, _ in ranked):
+        return min(ranked, key=lambda x: (x[1], x[2] if x[2] is not None else np.inf))[0]
+    return min(ranked, key=lambda x: x[2] if x[2] is not None else np.inf)[0]
+
+
+def _number(value):
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+# --- ENGINE ---
+class Backtester:
+    """
+    Scores every algorithm on every release in the background and remembers
+    the winner, so algo=auto is a dict lookup at request time.
+
+    - On each new snapshot only releases whose history changed are rescored;
+      the previous scores (and winner) keep being served until then.
+    - The vectorized algorithms are scored first, in large jobs; gradient
+      boosting follows in small ones. Jobs run in parallel on the ML executor
+      (up to `parallel` at a time, leaving room for interactive requests).
+    - Scores are persisted next to the catalog (backend.save_backtest_scores),
+      so a restart only rescores what changed while it was down.
+    - Under serve.py only one worker scores; the others start with
+      follow=True and re-read the persisted scores when they change.
+    """
+
+    def __init__(self, store, executor, algos=forecasting.ALGORITHMS, metric="mape", horizon=DEFAULT_HORIZON,
+                 folds=FOLDS, min_train=MIN_TRAIN, parallel=None, poll=SHARED_POLL):
+        self.store = store
+        self.executor = executor
+        self.algos = tuple(a for a in algos if a in forecasting.ALGORITHMS)
+        self.metric = metric if metric in METRICS else "mape"
+        self.horizon = horizon
+        self.folds = folds
+        self.min_train = min_train
+        self.parallel = parallel or max(1, min(executor.workers, executor.max_pending // 2))
+        self.poll = poll
+        self.follow = False
+        self.shared_seen = None
+        self.scores = {}        # release id -> {"fingerprint", "folds", "fold_days", "best", "mape": {}, "rmse": {}}
+        self.best = {}          # release id -> algorithm
+        self.version = None
+        self.loaded = False
+        self.running = False
+        self.runs = 0
+        self.scored = 0
+        self.last_run_s = None
+        self.last_error = None
+        self._dirty = set()
+        self._removed = set()
+        self._wakeup = None
+        self._task = None
+
+    # --- PERSISTENCE ---
+    def load(self):
+        self.shared_seen = self.store.backend.shared_fingerprint("backtest")
+        self.scores = self.store.backend.load_backtest_scores()
+        self.best = {rid: s["best"] for rid, s in self.scores.items() if s.get("best")}
+        self.loaded = True
+        return len(self.scores)
+
+    def flush(self):
+        changed = {rid: self.scores[rid] for rid in self._dirty if rid in self.scores}
+        removed = list(self._removed)
+        self._dirty.clear()
+        self._removed.clear()
+        if changed or removed:
+            self.store.backend.save_backtest_scores(changed, removed)
+        return len(changed) + len(removed)
+
+    def sync_shared(self):
+        """Follower: re-read the scores if another process wrote some."""
+        if self.store.backend.shared_fingerprint("backtest") != self.shared_seen:
+            self.load()
+
+    # --- LIFECYCLE ---
+    def start(self, follow=False):
+        self.follow = follow
+        if not self.algos:
+            return
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        self.store.subscribe(lambda snap: loop.call_soon_threadsafe(self._wakeup.set))
+        self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def promote(self):
+        """Start scoring instead of following (from the latest persisted scores)."""
+        self.follow = False
+        self.loaded = False
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            if self.follow:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                if not self.loaded:
+                    await asyncio.to_thread(self.load)
+                if self.follow:
+                    await asyncio.to_thread(self.sync_shared)
+                else:
+                    await self.run(self.store.current())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                log.exception("backtest failed")
+
+    # --- RUN ---
+    def _plan(self, snap):
+        """Forgets removed releases; returns (ids, fingerprints, rows whose history changed since scoring)."""
+        ids = [r['id'] for r in snap.data.get('releases', [])]
+        fingerprints = [history_fingerprint(h) for h in snap.columns.histories]
+        for rid in self.scores.keys() - set(ids):
+            del self.scores[rid]
+            self.best.pop(rid, None)
+            self._dirty.discard(rid)
+            self._removed.add(rid)
+        # Scores saved before folds were scaled to short histories lack fold_days: rescore those too
+        changed = {i for i, (rid, fp) in enumerate(zip(ids, fingerprints))
+                   if self.scores.get(rid, {}).get("fingerprint") != fp or "fold_days" not in self.scores[rid]}
+        return ids, fingerprints, changed
+
+    def _pending(self, ids, changed, algos):
+        # Changed rows, plus rows an interrupted run never got to for these algorithms
+        return [i for i, rid in enumerate(ids)
+                if i in changed or any(a not in self.scores.get(rid, {}).get("mape", {}) for a in algos)]
+
+    async def run(self, snap):
+        started = time.perf_counter()
+        self.running = True
+        try:
+            ids, fingerprints, changed = await asyncio.to_thread(self._plan, snap)
+            histories = snap.columns.histories
+            cheap = tuple(a for a in self.algos if a != "gradient_boosting")
+            phases = [(cheap, CHEAP_CHUNK)] if cheap else []
+            if "gradient_boosting" in self.algos:
+                phases.append((("gradient_boosting",), GBR_CHUNK))
+            for algos, chunk in phases:
+                rows = await asyncio.to_thread(self._pending, ids, changed, algos)
+                chunks = [rows[i:i + chunk] for i in range(0, len(rows), chunk)]
+                done = await self._score_chunks(histories, chunks, algos, ids, fingerprints)
+                await asyncio.to_thread(self.flush)
+                if not done:
+                    return  # a newer snapshot is waiting; finished rows are kept
+            self.version = snap.version
+            self.runs += 1
+            self.last_run_s = round(time.perf_counter() - started, 3)
+            self.last_error = None
+        finally:
+            self.running = False
+
+    async def _score_chunks(self, histories, chunks, algos, ids, fingerprints):
+        queue = list(reversed(chunks))
+
+        async def worker():
+            while queue:
+                if self._wakeup is not None and self._wakeup.is_set():
+                    return False
+                rows = queue.pop()
+                while True:
+                    try:
+                        result = await self.executor.run(score_chunk, histories.take(rows), algos, self.horizon,
+                                                         self.folds, self.min_train)
+                        break
+                    except ExecutorSaturated:
+                        await asyncio.sleep(1.0)  # interactive requests come first
+                    except JobTimeout:
+                        result = None
+                        break
+                if result is not None:
+                    self._record(rows, result, ids, fingerprints)
+            return True
+
+        results = await asyncio.gather(*(worker() for _ in range(min(self.parallel, len(chunks)))))
+        return all(results)
+
+    def _record(self, rows, result, ids, fingerprints):
+        folds, days, scores = result
+        for j, i in enumerate(rows):
+            rid = ids[i]
+            entry = self.scores.get(rid)
+            if entry is None or entry.get("fingerprint") != fingerprints[i] or "fold_days" not in entry:
+                entry = self.scores[rid] = {"fingerprint": fingerprints[i], "folds": int(folds[j]),
+                                            "fold_days": int(days[j]), "best": None, "mape": {}, "rmse": {}}
+            for algo, metrics in scores.items():
+                for metric, values in metrics.items():
+                    entry[metric][algo] = _number(values[j])
+            entry["best"] = pick_best({a: {m: entry[m].get(a) for m in METRICS} for a in entry["mape"]}, self.metric)
+            if entry["best"]:
+                self.best[rid] = entry["best"]
+            else:
+                self.best.pop(rid, None)
+            self._dirty.add(rid)
+        self.scored += len(rows)
+
+    # --- READS ---
+    def choose(self, release_id):
+        """The algorithm algo=auto serves for a release: O(1), never computes."""
+        return self.best.get(release_id, DEFAULT_ALGO)
+
+    def report(self, release_id):
+        entry = self.scores.get(release_id)
+        if entry is None:
+            return None
+        return {"best": entry["best"], "metric": self.metric, "folds": entry["folds"],
+                "fold_days": entry.get("fold_days", self.horizon), "horizon": self.horizon,
+                "mape": entry["mape"], "rmse": entry["rmse"]}
+
+    def summary(self):
+        """How often each algorithm wins, and its mean scores across the catalog."""
+        wins = {algo: 0 for algo in self.algos}
+        for algo in self.best.values():
+            wins[algo] = wins.get(algo, 0) + 1
+        means = {}
+        for metric in METRICS:
+            means[metric] = {}
+            for algo in self.algos:
+                values = [s[metric].get(algo) for s in self.scores.values()]
+                values = [v for v in values if v is not None]
+                means[metric][algo] = round(sum(values) / len(values), 4) if values else None
+        return {"metric": self.metric, "releases": len(self.scores), "wins": wins, "mean": means,
+                "min_history_days": self.min_train + 1}
+
+    def stats(self):
+        return {
+            "algorithms": list(self.algos),
+            "follow": self.follow,
+            "metric": self.metric,
+            "folds": self.folds,
+            "horizon": self.horizon,
+            "min_history_days": self.min_train + 1,
+            "version": self.version,
+            "releases_scored": len(self.scores),
+            "with_winner": len(self.best),
+            "running": self.running,
+            "parallel": self.parallel,
+            "runs": self.runs,
+            "scored": self.scored,
+            "last_run_s": self.last_run_s,
+            "last_error": self.last_error,
+        }
+
+
+def from_env(store, executor):
+    """BACKTEST: 'all' (default), 'off', or a comma separated list of algorithms; BACKTEST_METRIC (mape|rmse), BACKTEST_FOLDS."""
+    setting = os.getenv("BACKTEST", "all").strip().lower()
+    if setting in ("off", "0", "none", ""):
+        algos = ()
+    elif setting == "all":
+        algos = forecasting.ALGORITHMS
+    else:
+        algos = tuple(a.strip() for a in setting.split(","))
+    return Backtester(store, executor, algos, metric=os.getenv("BACKTEST_METRIC", "mape").lower(),
+                      folds=int(os.getenv("BACKTEST_FOLDS", str(FOLDS))),
+                      parallel=int(os.getenv("BACKTEST_PARALLEL", "0")) or None,
+                      poll=float(os.getenv("BACKTEST_SHARED_POLL", str(SHARED_POLL))))
@@ -0,0 +1,382 @@
+"""
+Offline benchmark for every API endpoint at several data scales.
+
+    python benchmark.py                              # 1k and 10k, in-process and over HTTP
+    python benchmark.py --scales 1k,10k,100k,1m --mode http
+    python benchmark.py --save-baseline              # store results as the new baseline
+    python benchmark.py --baseline bench_baseline.json --threshold 0.25
+
+Each scale runs against a generated catalog (generate_large_db.py, cached
+under .bench/) with the LLM stubbed (LLM_BACKEND=stub), so no API key or
+network is needed. In-process mode drives the ASGI app directly in a fresh
+interpreter per scale; HTTP mode starts uvicorn and drives it over a socket.
+
+Per endpoint: p50/p95/p99 latency, throughput, errors, CPU seconds (server
+process plus ML pool workers) and the server's peak RSS. Results go to a
+JSON file; with a baseline, endpoints whose p95 got more than `threshold`
+slower are flagged and the exit status is 1.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCALES = {"1k": 1000, "10k": 10000, "100k": 100000, "1m": 1000000}
+DATA_EXT = {"json": "json", "sqlite": "db"}
+FULL_DUMP_MAX = 100000   # /api/database without parameters is skipped above this many records
+NOISE_FLOOR_MS = 1.0     # p95 changes smaller than this are never a regression
+
+QUESTIONS = [
+    "Which {genre} releases should we push this week?",
+    "How is {artist} performing compared to the rest of the catalog?",
+    "Which customers would buy a {bpm} BPM track?",
+    "Summarize the risks for {track}.",
+    "What is trending on TikTok in {genre}?",
+]
+
+
+# --- ENDPOINTS ---
+# name -> (method, build(rng, release) -> (path, json_body), share of --requests)
+def _chat_body(rng, release):
+    question = rng.choice(QUESTIONS).format(genre=release.get('genre'), artist=release.get('artist'),
+                                            bpm=release.get('bpm'), track=release.get('track_name'))
+    return {"message": question, "context_id": release['id']}
+
+
+ENDPOINTS = {
+    "database": ("GET", lambda rng, r: ("/api/database", None), 0.1),
+    "database_page": ("GET", lambda rng, r: ("/api/database?collection=releases&limit=100", None), 1.0),
+    "release": ("GET", lambda rng, r: (f"/api/release/{r['id']}", None), 1.0),
+    "forecast_linear": ("GET", lambda rng, r: (f"/api/forecast/{r['id']}?algo=linear", None), 1.0),
+    "forecast_polynomial": ("GET", lambda rng, r: (f"/api/forecast/{r['id']}?algo=polynomial", None), 1.0),
+    "forecast_gradient_boosting": ("GET", lambda rng, r: (f"/api/forecast/{r['id']}?algo=gradient_boosting", None), 1.0),
+    "forecast_moving_average": ("GET", lambda rng, r: (f"/api/forecast/{r['id']}?algo=moving_average", None), 1.0),
+    "forecast_exponential": ("GET", lambda rng, r: (f"/api/forecast/{r['id']}?algo=exponential", None), 1.0),
+    "clusters": ("GET", lambda rng, r: ("/api/clusters", None), 1.0),
+    "triggers": ("GET", lambda rng, r: (f"/api/triggers/{r['id']}", None), 1.0),
+    "chat": ("POST", lambda rng, r: ("/api/chat", _chat_body(rng, r)), 1.0),
+}
+
+
+# --- PROCESS METRICS (Linux /proc; None elsewhere) ---
+CLK_TCK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def _stat_fields(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        # comm can contain spaces: everything after the closing paren is space separated
+        return f.read().rsplit(')', 1)[1].split()
+
+
+def _children(pid):
+    out = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                if int(_stat_fields(entry)[1]) == pid:
+                    out.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    return out
+
+
+def cpu_seconds(pid):
+    """CPU time of `pid` and its live children (the ML process pool)."""
+    try:
+        total = 0
+        for p in [pid] + _children(pid):
+            fields = _stat_fields(p)
+            total += int(fields[11]) + int(fields[12])  # utime, stime
+        return total / CLK_TCK
+    except OSError:
+        if pid == os.getpid():
+            return time.process_time()
+        return None
+
+
+def peak_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if pid == os.getpid():
+        import resource
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return None
+
+
+# --- DRIVER ---
+def _summary(latencies, errors, wall, cpu):
+    ms = np.array(latencies) * 1000
+    pct = lambda p: round(float(np.percentile(ms, p)), 3) if len(ms) else None
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": pct(50), "p95_ms": pct(95), "p99_ms": pct(99),
+        "mean_ms": round(float(ms.mean()), 3) if len(ms) else None,
+        "throughput_rps": round(len(latencies) / wall, 2) if wall > 0 else None,
+        "cpu_s": round(cpu, 3) if cpu is not None else None,
+    }
+
+
+async def _request(client, method, path, body):
+    response = await client.request(method, path, json=body)
+    await response.aread()
+    return response.status_code
+
+
+async def run_endpoint(client, name, releases, requests, concurrency, warmup, server_pid, seed):
+    method, build, share = ENDPOINTS[name]
+    rng = random.Random(f"{seed}:{name}")
+    n = max(5, int(requests * share))
+    calls = [build(rng, rng.choice(releases)) for _ in range(warmup + n)]
+
+    for path, body in calls[:warmup]:
+        await _request(client, method, path, body)
+
+    latencies, errors = [], 0
+    pending = iter(calls[warmup:])
+
+    async def worker():
+        nonlocal errors
+        for path, body in pending:
+            started = time.perf_counter()
+            try:
+                status = await _request(client, method, path, body)
+            except Exception:
+                status = 599
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors += 1
+
+    cpu_before = cpu_seconds(server_pid)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    cpu_after = cpu_seconds(server_pid)
+    result = _summary(latencies, errors, wall, None if cpu_before is None or cpu_after is None else cpu_after - cpu_before)
+    result["peak_rss_mb"] = peak_rss_mb(server_pid)
+    return result
+
+
+async def run_suite(client, args, records, server_pid):
+    # Sample real ids from the running app so any dataset works
+    page = (await client.get("/api/database?collection=releases&limit=1000")).json()
+    releases = page["items"]
+    results = {}
+    for name in args.endpoints:
+        if name == "database" and records > FULL_DUMP_MAX:
+            results[name] = {"skipped": f"full dump above {FULL_DUMP_MAX} records"}
+            continue
+        results[name] = await run_endpoint(client, name, releases, args.requests, args.concurrency,
+                                           args.warmup, server_pid, args.seed)
+        print(f"  {name:28s} p50 {results[name]['p50_ms']:>9} ms  p95 {results[name]['p95_ms']:>9} ms  "
+              f"{results[name]['throughput_rps']:>8} req/s  errors {results[name]['errors']}", flush=True)
+    return results
+
+
+# --- DATASETS & ENVIRONMENT ---
+def dataset_path(records, args):
+    from generate_large_db import generate_large_database
+    directory = os.path.join(HERE, ".bench")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"catalog-{records}-{args.seed}.{DATA_EXT[args.backend]}")
+    if not os.path.exists(path):
+        generate_large_database(records, records, path, args.backend, args.seed)
+    return path
+
+
+def server_env(path, args):
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_PATH": path,
+        "DATA_BACKEND": args.backend,
+        "LLM_BACKEND": "stub",
+        "LLM_STUB_LATENCY": str(args.llm_latency),
+    })
+    if args.ml_executor:
+        env["ML_EXECUTOR"] = args.ml_executor
+    return env
+
+
+# --- MODES ---
+def run_inprocess(records, path, args):
+    """Fresh interpreter per scale: main.py reads its configuration at import time."""
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        out = f.name
+    try:
+        cmd = [sys.executable, os.path.abspath(__file__), "--_child", out, "--records", str(records)]
+        cmd += _passthrough(args)
+        subprocess.run(cmd, env=server_env(path, args), cwd=HERE, check=True)
+        with open(out) as f:
+            return json.load(f)
+    finally:
+        os.unlink(out)
+
+
+async def _child_main(args):
+    import httpx
+    started = time.perf_counter()
+    import main
+    async with main.app.router.lifespan_context(main.app):
+        main.store.current()
+        startup = time.perf_counter() - started
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            results = await run_suite(client, args, args.records, os.getpid())
+    return {"startup_s": round(startup, 3), "endpoints": results}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_http(records, path, args):
+    import httpx
+    port = _free_port()
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--log-level", "warning"]
+    started = time.perf_counter()
+    server = subprocess.Popen(cmd, env=server_env(path, args), cwd=HERE)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {server.returncode}")
+            try:
+                # /api/system/data forces the first snapshot load
+                if httpx.get(f"{base_url}/api/system/data", timeout=5).status_code == 200:
+                    break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        startup = time.perf_counter() - started
+
+        async def drive():
+            limits = httpx.Limits(max_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+                return await run_suite(client, args, records, server.pid)
+        return {"startup_s": round(startup, 3), "endpoints": asyncio.run(drive())}
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+MODES = {"inprocess": run_inprocess, "http": run_http}
+
+
+# --- BASELINE ---
+def find_regressions(results, baseline, threshold):
+    flagged = []
+    for key, run in results.items():
+        base_run = baseline.get("results", {}).get(key)
+        if not base_run:
+            continue
+        for name, current in run["endpoints"].items():
+            base = base_run["endpoints"].get(name)
+            if not base or "p95_ms" not in current or "p95_ms" not in base:
+                continue
+            slower = current["p95_ms"] - base["p95_ms"]
+            if slower > NOISE_FLOOR_MS and current["p95_ms"] > base["p95_ms"] * (1 + threshold):
+                flagged.append({"run": key, "endpoint": name, "baseline_p95_ms": base["p95_ms"],
+                                "p95_ms": current["p95_ms"], "change": round(current["p95_ms"] / base["p95_ms"] - 1, 3)})
+    return flagged
+
+
+def _passthrough(args):
+    return ["--requests", str(args.requests), "--concurrency", str(args.concurrency),
+            "--warmup", str(args.warmup), "--seed", str(args.seed), "--endpoints", ",".join(args.endpoints)]
+
+
+def _scale(value):
+    return SCALES.get(value.lower()) or int(value)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every API endpoint offline at several data scales")
+    parser.add_argument("--scales", default="1k,10k", help=f"comma separated: {', '.join(SCALES)} or a record count")
+    parser.add_argument("--mode", choices=["inprocess", "http", "both"], default="both")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma separated subset")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--backend", choices=sorted(DATA_EXT), default="json")
+    parser.add_argument("--ml-executor", choices=["process", "thread"], default=None)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="stub LLM latency in seconds")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", default="bench_baseline.json")
+    parser.add_argument("--threshold", type=float, default=0.2, help="flag p95 slowdowns above this fraction")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--_child", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--records", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.endpoints = [e for e in args.endpoints.split(",") if e]
+    unknown = [e for e in args.endpoints if e not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args._child:
+        result = asyncio.run(_child_main(args))
+        with open(args._child, "w") as f:
+            json.dump(result, f)
+        return 0
+
+    modes = list(MODES) if args.mode == "both" else [args.mode]
+    results = {}
+    for records in (_scale(s) for s in args.scales.split(",") if s):
+        path = dataset_path(records, args)
+        for mode in modes:
+            key = f"{records}/{mode}"
+            print(f"--- {records} releases + {records} customers ({mode}) ---", flush=True)
+            results[key] = MODES[mode](records, path, args)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if not k.startswith("_") and k != "records"},
+        },
+        "results": results,
+    }
+    if args.baseline and os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = find_regressions(results, json.load(f), args.threshold)
+        for r in report["regressions"]:
+            print(f"⚠️ REGRESSION {r['run']} {r['endpoint']}: p95 {r['baseline_p95_ms']} -> {r['p95_ms']} ms")
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {args.out}")
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Baseline saved to {args.baseline}")
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
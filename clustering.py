@@ -0,0 +1,167 @@
+import asyncio
+
+import numpy as np
+
+N_SEGMENTS = 3
+MINIBATCH_THRESHOLD = 10000   # above this many customers, fit with MiniBatchKMeans
+REFIT_FRACTION = 0.2          # refit from scratch when more than this share changed
+
+
+def fit_segments(X, n_clusters=N_SEGMENTS):
+    """
+    Uses K-Means to group customers into segments based on:
+    1. Average Order Value (Money)
+    2. BPM Preference (Taste)
+    Returns (labels, centers, counts, mean, scale) with centers in scaled space.
+    Labels are ordered by centroid order value (0 = lowest spend) so colours stay
+    stable across refits. CPU-bound; run it on the ML executor.
+    """
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    # Scale Data (Important for K-Means)
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    X_scaled = (X - mean) / scale
+
+    # Run K-Means (3 Clusters: e.g., Low, Mid, High value)
+    k = min(n_clusters, len(X))
+    if len(X) > MINIBATCH_THRESHOLD:
+        model = MiniBatchKMeans(n_clusters=k, random_state=42, n_init=3, batch_size=4096)
+    else:
+        model = KMeans(n_clusters=k, random_state=42, n_init=10)
+    model.fit(X_scaled)
+
+    order = np.argsort(model.cluster_centers_[:, 0])
+    relabel = np.empty_like(order)
+    relabel[order] = np.arange(k)
+    labels = relabel[model.labels_].astype(int)
+    centers = model.cluster_centers_[order]
+    counts = np.bincount(labels, minlength=k).astype(float)
+    return labels, centers, counts, mean, scale
+
+
+class SegmentState:
+    """Segment assignments for one data snapshot."""
+
+    def __init__(self, version, ids, features, labels, centers, counts, mean, scale, refit):
+        self.version = version
+        self.ids = ids
+        self.features = features
+        self.labels = labels
+        self.centers = centers
+        self.counts = counts
+        self.mean = mean
+        self.scale = scale
+        self.refit = refit  # False when this state was derived incrementally
+
+    def nearest(self, X):
+        scaled = (X - self.mean) / self.scale
+        dist = ((scaled[:, None, :] - self.centers[None, :, :]) ** 2).sum(axis=2)
+        return dist.argmin(axis=1)
+
+
+def update_segments(previous, version, ids, X):
+    """
+    Derive a new state from the previous one without refitting: unchanged
+    customers keep their label, new/changed ones go to the nearest centroid and
+    nudge it with a running-mean update (the MiniBatchKMeans partial_fit rule).
+    Returns None when too much changed and a full refit is the better deal.
+    """
+    old_rows = {cid: i for i, cid in enumerate(previous.ids)}
+    prev_row = np.fromiter((old_rows.get(cid, -1) for cid in ids), dtype=np.int64, count=len(ids))
+    known = prev_row >= 0
+    same = np.zeros(len(ids), dtype=bool)
+    same[known] = (previous.features[prev_row[known]] == X[known]).all(axis=1)
+
+    labels = np.empty(len(ids), dtype=int)
+    labels[same] = previous.labels[prev_row[same]]
+    changed = np.flatnonzero(~same)
+
+    if len(changed) > REFIT_FRACTION * max(len(ids), 1):
+        return None
+
+    centers = previous.centers.copy()
+    counts = previous.counts.copy()
+    if len(changed):
+        assigned = previous.nearest(X[changed])
+        labels[changed] = assigned
+        scaled = (X[changed] - previous.mean) / previous.scale
+        for row, k in zip(scaled, assigned):
+            counts[k] += 1
+            centers[k] += (row - centers[k]) / counts[k]
+    return SegmentState(version, ids, X, labels, centers, counts, previous.mean, previous.scale, refit=False)
+
+
+class SegmentCache:
+    """
+    Keeps the latest SegmentState and recomputes only when the data snapshot
+    changes: incrementally when few customers changed, otherwise a full fit on
+    the ML executor.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.state = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _prepare(snap, previous):
+        # (Money, BPM) per customer, straight from the snapshot's columns (columnar.py)
+        ids, X = snap.columns.customer_ids, snap.columns.customer_features
+        new_state = update_segments(previous, snap.version, ids, X) if previous is not None else None
+        return ids, X, new_state
+
+    async def get(self, snap):
+        state = self.state
+        if state is not None and state.version == snap.version:
+            return state
+        async with self._lock:
+            state = self.state
+            if state is not None and state.version == snap.version:
+                return state
+            # The incremental diff is O(n) Python: keep it off the loop too
+            ids, X, new_state = await asyncio.to_thread(self._prepare, snap, state)
+            if new_state is None:
+                if len(ids):
+                    labels, centers, counts, mean, scale = await self.executor.run(fit_segments, X)
+                else:
+                    labels, centers, counts = np.empty(0, dtype=int), np.empty((0, 2)), np.empty(0)
+                    mean, scale = np.zeros(2), np.ones(2)
+                new_state = SegmentState(snap.version, ids, X, labels, centers, counts, mean, scale, refit=True)
+            self.state = new_state
+            return new_state
+
+
+# --- CHART DOWNSAMPLING ---
+def sample_points(state, max_points, seed=42):
+    """Indices of a per-cluster proportional sample of at most max_points rows."""
+    n = len(state.labels)
+    if n <= max_points:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+    picked = []
+    for k in np.unique(state.labels):
+        members = np.flatnonzero(state.labels == k)
+        take = max(1, int(round(max_points * len(members) / n)))
+        picked.append(rng.choice(members, size=min(take, len(members)), replace=False))
+    return np.sort(np.concatenate(picked))
+
+
+def density_bins(state, bins):
+    """2D histogram per cluster: one point per non-empty (cluster, cell) with a count."""
+    X = state.features
+    if not len(X):
+        return []
+    x_edges = np.linspace(X[:, 1].min(), X[:, 1].max() + 1e-9, bins + 1)
+    y_edges = np.linspace(X[:, 0].min(), X[:, 0].max() + 1e-9, bins + 1)
+    x_mid = (x_edges[:-1] + x_edges[1:]) / 2
+    y_mid = (y_edges[:-1] + y_edges[1:]) / 2
+    points = []
+    for k in np.unique(state.labels):
+        members = state.labels == k
+        grid, _, _ = np.histogram2d(X[members, 1], X[members, 0], bins=[x_edges, y_edges])
+        for xi, yi in zip(*np.nonzero(grid)):
+            points.append({"x": round(float(x_mid[xi]), 2), "y": round(float(y_mid[yi]), 2),
+                           "cluster": int(k), "count": int(grid[xi, yi])})
+    return points
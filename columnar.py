@@ -0,0 +1,247 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from itertools import chain
+
+import numpy as np
+
+# Bump when the on-disk layout changes; old directories are then rebuilt
+LAYOUT_VERSION = 1
+KEEP_BUILDS = 2   # column directories kept per cache dir (the live one + the previous)
+
+
+# --- HISTORIES (CSR) ---
+class HistoryColumns:
+    """
+    Many sales histories in two flat arrays: `values` (every day of every
+    series, back to back) and `offsets` (n + 1 boundaries), so series i is
+    values[offsets[i]:offsets[i + 1]] — a view, never a copy.
+
+    Indexing with an int gives that view; a slice or a list of rows gives a
+    HistoryColumns over just those series. `flat` and `lengths` let the
+    forecasting code skip the list-of-lists padding step.
+    """
+
+    __slots__ = ("values", "offsets")
+
+    def __init__(self, values, offsets):
+        self.values = values
+        self.offsets = offsets
+
+    @classmethod
+    def from_histories(cls, histories):
+        lengths = np.fromiter((len(h) for h in histories), dtype=np.int64, count=len(histories))
+        offsets = np.zeros(len(histories) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        values = np.fromiter(chain.from_iterable(histories), dtype=float, count=int(offsets[-1]))
+        # int64 unless some day was recorded as a fraction
+        if np.array_equal(values, np.trunc(values)):
+            values = values.astype(np.int64)
+        return cls(values, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                offsets = self.offsets[start:stop + 1] if stop > start else self.offsets[start:start + 1]
+                return HistoryColumns(self.values[offsets[0]:offsets[-1]], offsets - offsets[0])
+            key = range(start, stop, step)
+        if isinstance(key, (int, np.integer)):
+            return self.values[self.offsets[key]:self.offsets[key + 1]]
+        return self.take(key)
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def flat(self):
+        return self.values[self.offsets[0]:self.offsets[-1]]
+
+    def tails(self, window):
+        """(n, window) float matrix of each series' last `window` points, right-aligned, NaN-padded."""
+        lengths = np.minimum(self.lengths, window)
+        out = np.full((len(self), window), np.nan)
+        rows = np.repeat(np.arange(len(self)), lengths)
+        within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)  # 0.. per series
+        out[rows, np.repeat(window - lengths, lengths) + within] = \
+            self.values[np.repeat(self.offsets[1:] - lengths, lengths) + within]
+        return out
+
+    def take(self, rows):
+        """A compact copy holding only `rows`, in that order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = self.lengths[rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        index = np.repeat(self.offsets[rows] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return HistoryColumns(self.values[index], offsets)
+
+
+# --- ROW VIEWS ---
+class CustomerRow:
+    """One customer read from the columns; serialized without building the full record."""
+
+    __slots__ = ("_columns", "_row")
+
+    def __init__(self, columns, row):
+        self._columns = columns
+        self._row = row
+
+    @property
+    def id(self):
+        return str(self._columns.customer_ids[self._row])
+
+    @property
+    def name(self):
+        return str(self._columns.customer_names[self._row])
+
+    @property
+    def avg_order_val(self):
+        return _number(self._columns.customer_features[self._row, 0])
+
+    @property
+    def bpm(self):
+        return _number(self._columns.customer_features[self._row, 1])
+
+    def point(self, cluster):
+        # Chart.js scatter point: x = taste, y = money
+        return {"name": self.name, "x": self.bpm, "y": self.avg_order_val, "cluster": cluster}
+
+    def assignment(self, cluster):
+        return {"id": self.id, "name": self.name, "cluster": cluster}
+
+
+# --- CATALOG ---
+# Array name -> file; everything is a plain .npy so np.load(mmap_mode='r') works
+_ARRAYS = ("history_values", "history_offsets", "release_ids",
+           "customer_features", "customer_ids", "customer_names")
+
+
+class CatalogColumns:
+    """
+    Columnar copy of the numeric parts of a snapshot, for the ML paths:
+    release histories (CSR) and the customer feature matrix
+    [avg_order_val, bpm]. Row order matches data['releases'] / data['customers'].
+
+    Built per snapshot (DataStore); with a cache directory it is written once
+    as .npy files and memory-mapped, so every worker process reading the
+    same data shares one copy in the page cache.
+    """
+
+    __slots__ = ("histories", "release_ids", "customer_features", "customer_ids", "customer_names", "path")
+
+    def __init__(self, histories, release_ids, customer_features, customer_ids, customer_names, path=None):
+        self.histories = histories
+        self.release_ids = release_ids
+        self.customer_features = customer_features
+        self.customer_ids = customer_ids
+        self.customer_names = customer_names
+        self.path = path
+
+    @classmethod
+    def from_data(cls, data):
+        releases = data.get('releases', []) if isinstance(data, dict) else []
+        customers = data.get('customers', []) if isinstance(data, dict) else []
+        histories = HistoryColumns.from_histories([r.get('stats', {}).get('history', []) for r in releases])
+        features = np.array([[c.get('avg_order_val', 0), c.get('bpm', 0)] for c in customers], dtype=float).reshape(-1, 2)
+        return cls(histories,
+                   _strings([r.get('id', '') for r in releases]),
+                   features,
+                   _strings([c.get('id', '') for c in customers]),
+                   _strings([c.get('name', '') for c in customers]))
+
+    def customer(self, row):
+        return CustomerRow(self, row)
+
+    def nbytes(self):
+        return sum(getattr(a, "nbytes", 0) for a in self._arrays().values())
+
+    # --- PERSISTENCE ---
+    def _arrays(self):
+        return {
+            "history_values": self.histories.values,
+            "history_offsets": self.histories.offsets,
+            "release_ids": self.release_ids,
+            "customer_features": self.customer_features,
+            "customer_ids": self.customer_ids,
+            "customer_names": self.customer_names,
+        }
+
+    def save(self, path):
+        """Write to directory `path` atomically (build in a temp dir, then rename)."""
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+        try:
+            for name, array in self._arrays().items():
+                np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(array))
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump({"layout": LAYOUT_VERSION}, f)
+            os.chmod(tmp, 0o755)
+            os.rename(tmp, path)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(path):  # losing the race to another worker is fine
+                raise
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, "meta.json")) as f:
+            if json.load(f).get("layout") != LAYOUT_VERSION:
+                raise ValueError(f"{path}: unsupported column layout")
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mode) for name in _ARRAYS}
+        return cls(HistoryColumns(arrays["history_values"], arrays["history_offsets"]),
+                   arrays["release_ids"], arrays["customer_features"],
+                   arrays["customer_ids"], arrays["customer_names"], path=path)
+
+
+def _number(value):
+    # Features are stored as floats; whole numbers go back out as ints, as in the JSON
+    value = value.item()
+    return int(value) if value.is_integer() else value
+
+
+def _strings(values):
+    # Fixed-width unicode: unlike object arrays these can be memory-mapped
+    return np.array([str(v) for v in values], dtype=str) if values else np.zeros(0, dtype="<U1")
+
+
+def _prune(cache_dir, keep):
+    builds = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if not name.startswith(".") and os.path.isdir(path):
+            builds.append((os.path.getmtime(path), path))
+    for _, path in sorted(builds)[:-keep]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def build(data, fingerprint=None, cache_dir=None):
+    """
+    Columns for `data`. With a cache_dir and a fingerprint the columns are
+    looked up (or written) under a directory named after the fingerprint
+    and returned memory-mapped.
+    """
+    if not cache_dir or fingerprint is None:
+        return CatalogColumns.from_data(data)
+    key = hashlib.sha1(repr((LAYOUT_VERSION, fingerprint)).encode()).hexdigest()[:20]
+    path = os.path.join(cache_dir, key)
+    try:
+        if not os.path.isdir(path):
+            CatalogColumns.from_data(data).save(path)
+            _prune(cache_dir, KEEP_BUILDS)
+        return CatalogColumns.load(path, mmap=True)
+    except (OSError, ValueError):
+        # Unwritable dir, or pruned by another worker in between: private copy
+        return CatalogColumns.from_data(data)
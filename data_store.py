@@ -0,0 +1,138 @@
+import time
+import threading
+from collections import namedtuple
+
+import columnar
+from indexes import CatalogIndex
+from storage import JsonBackend
+
+# --- SNAPSHOT ---
+# One fully parsed copy of the database plus its lookup indexes and columnar
+# arrays (columnar.py, for the ML paths). Handlers treat it as read-only; a
+# reload never mutates a snapshot, it builds a new one (indexes included) and
+# swaps the reference.
+Snapshot = namedtuple("Snapshot", ["data", "version", "fingerprint", "loaded_at", "indexes", "columns"])
+
+
+class DataStore:
+    """
+    Process-wide cache of the catalog, read through a storage backend
+    (database.json by default, or SQLite; see storage.py).
+
+    - Loads the data once and serves every request from memory.
+    - A watcher thread polls the backend's fingerprint (file inode/mtime/size,
+      or the SQLite version counter) and reloads on change.
+    - reload() / request_reload() force a re-read (admin endpoint, SIGHUP).
+    - The new snapshot is swapped in with a single reference assignment, so
+      readers never block and never see a half-written file: if the parse
+      fails or the file changes while we read it, the old snapshot stays.
+    """
+
+    def __init__(self, source, poll_interval=1.0, columns_dir=None):
+        # A path means the classic database.json
+        self.backend = JsonBackend(source) if isinstance(source, str) else source
+        self.path = self.backend.path
+        self.poll_interval = poll_interval
+        self.columns_dir = columns_dir  # shared, memory-mapped columns across workers when set
+        self._snapshot = None
+        self._version = 0
+        self._reload_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._watcher = None
+        self._listeners = []
+        self.last_error = None
+
+    # --- READ PATH ---
+    def current(self):
+        """Latest snapshot. Only the very first call (cold start) parses inline."""
+        snap = self._snapshot
+        if snap is None:
+            self.reload()
+            snap = self._snapshot
+        return snap
+
+    # --- RELOAD PATH ---
+    def _read(self):
+        # Fingerprint first: if a write lands mid-load we reload again next tick
+        fingerprint = self.backend.fingerprint()
+        return self.backend.load(), fingerprint
+
+    def _build(self, data, fingerprint):
+        indexes = CatalogIndex(data)
+        columns = columnar.build(data, (self.path, fingerprint), self.columns_dir)
+        self._version += 1
+        return Snapshot(data=data, version=self._version, fingerprint=fingerprint,
+                        loaded_at=time.time(), indexes=indexes, columns=columns)
+
+    def reload(self, force=True):
+        """
+        Re-read the file and swap in a new snapshot.
+        With force=False nothing happens if the fingerprint is unchanged.
+        Returns True when a new snapshot was published.
+        """
+        with self._reload_lock:
+            current = self._snapshot
+            if not force and current is not None and self.backend.fingerprint() == current.fingerprint:
+                return False
+            try:
+                data, fingerprint = self._read()
+            except Exception as e:
+                self.last_error = str(e)
+                if current is None:
+                    raise
+                return False
+            self._snapshot = snap = self._build(data, fingerprint)
+            self.last_error = None
+        for callback in list(self._listeners):
+            try:
+                callback(snap)
+            except Exception as e:
+                self.last_error = f"listener failed: {e}"
+        return True
+
+    def subscribe(self, callback):
+        """Call `callback(snapshot)` after every newly published snapshot (on the reloading thread)."""
+        self._listeners.append(callback)
+
+    def request_reload(self):
+        """Ask the watcher to reload on its next tick. Safe to call from a signal handler."""
+        self._wakeup.set()
+
+    # --- WATCHER ---
+    def _watch(self):
+        while not self._stopping.is_set():
+            forced = self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.reload(force=forced)
+            except Exception as e:
+                self.last_error = str(e)
+
+    def start_watching(self):
+        if self._watcher and self._watcher.is_alive():
+            return
+        self._stopping.clear()
+        self._watcher = threading.Thread(target=self._watch, name="data-store-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._watcher:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def status(self):
+        snap = self._snapshot
+        return {
+            "backend": self.backend.kind,
+            "path": self.path,
+            "version": snap.version if snap else None,
+            "loaded_at": snap.loaded_at if snap else None,
+            "watching": bool(self._watcher and self._watcher.is_alive()),
+            "columns": {"bytes": snap.columns.nbytes(), "mmap": snap.columns.path} if snap else None,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,133 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class ExecutorSaturated(Exception):
+    """Too many ML jobs queued; the API answers 429 so clients back off."""
+
+
+class JobTimeout(Exception):
+    """A job took longer than its deadline; the API answers 504."""
+
+
+class MLExecutor:
+    """
+    Runs CPU-bound ML work (sklearn fits, KMeans, batched polyfit) outside
+    the uvicorn event loop.
+
+    - kind="process" (default) uses a ProcessPoolExecutor so fits don't fight
+      over the GIL; kind="thread" is handy for debugging and tiny deployments.
+    - At most `max_pending` jobs may be queued or running; beyond that run()
+      raises ExecutorSaturated immediately instead of growing the queue.
+    - Each job gets a deadline (`timeout` seconds). A process job that misses
+      it can't be interrupted, so it keeps its slot until it actually finishes.
+    """
+
+    def __init__(self, kind="process", workers=None, max_pending=32, timeout=30.0, latency_window=1000):
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 2
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._latencies = deque(maxlen=latency_window)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    if self.kind == "thread":
+                        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ml")
+                    else:
+                        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise ExecutorSaturated(f"{self._pending} ML jobs pending (limit {self.max_pending})")
+            self._pending += 1
+            self.submitted += 1
+
+    def _on_done(self, started, future):
+        # Runs when the worker really finishes, even if the caller gave up waiting
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._pending -= 1
+            self._latencies.append(elapsed)
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    async def run(self, fn, *args, timeout=None):
+        """Await fn(*args) on the pool. fn must be a picklable top-level function."""
+        self._acquire()
+        started = time.perf_counter()
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(lambda f: self._on_done(started, f))
+
+        deadline = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), deadline)
+        except asyncio.TimeoutError:
+            future.cancel()  # only helps if it hasn't started yet
+            with self._lock:
+                self.timeouts += 1
+            raise JobTimeout(f"{getattr(fn, '__name__', 'job')} exceeded {deadline}s")
+
+    def stats(self):
+        with self._lock:
+            pending = self._pending
+            latencies = sorted(self._latencies)
+
+        def pct(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": pending,
+            "queue_depth": max(0, pending - self.workers),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "latency_ms": {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99),
+                           "max": pct(1.0), "samples": len(latencies)},
+        }
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def from_env():
+    return MLExecutor(
+        kind=os.getenv("ML_EXECUTOR", "process"),
+        workers=int(os.getenv("ML_WORKERS", "0")) or None,
+        max_pending=int(os.getenv("ML_MAX_PENDING", "32")),
+        timeout=float(os.getenv("ML_JOB_TIMEOUT", "30")),
+    )
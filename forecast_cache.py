@@ -0,0 +1,304 @@
+import os
+import time
+import asyncio
+import logging
+
+import numpy as np
+
+import forecasting
+from executor import ExecutorSaturated, JobTimeout
+from model_cache import history_fingerprint
+from online_forecast import ONLINE_ALGORITHMS
+
+log = logging.getLogger("forecast_cache")
+
+GBR_CHUNK = 16   # releases per gradient-boosting job on the ML executor
+SHARED_POLL = 5.0  # seconds between a follower's checks for newly shared rows
+
+
+class ForecastTable:
+    """
+    Materialized forecasts for one data snapshot: an (n, horizon) int matrix
+    per algorithm plus a ready flag and computed_at time per row. Rows are
+    written before they are flagged ready, so readers never see a partial one.
+    """
+
+    def __init__(self, version, ids, fingerprints, horizon, algos):
+        self.version = version
+        self.horizon = horizon
+        self.ids = ids
+        self.row_of = {rid: i for i, rid in enumerate(ids)}
+        self.fingerprints = fingerprints
+        n = len(ids)
+        self.values = {algo: np.zeros((n, horizon), dtype=np.int64) for algo in algos}
+        self.ready = {algo: np.zeros(n, dtype=bool) for algo in algos}
+        self.computed_at = {algo: np.zeros(n) for algo in algos}
+
+    def get(self, release_id, algo):
+        """(forecast, computed_at) or None if not materialized (yet)."""
+        ready = self.ready.get(algo)
+        row = self.row_of.get(release_id)
+        if ready is None or row is None or not ready[row]:
+            return None
+        return self.values[algo][row].tolist(), float(self.computed_at[algo][row])
+
+    def fill(self, algo, rows, predictions, computed_at):
+        self.values[algo][rows] = predictions
+        self.computed_at[algo][rows] = computed_at
+        self.ready[algo][rows] = True
+
+
+class ForecastMaterializer:
+    """
+    Background job that precomputes every algorithm for every release whenever
+    the data snapshot changes, so /api/forecast is a table lookup.
+
+    - Only releases whose history changed (or that are new) are recomputed;
+      the rest are carried over from the previous table.
+    - The cheap algorithms (running-state based, see online_forecast.py) are
+      filled before the new table is published; gradient boosting is filled in
+      afterwards, in small jobs on the ML executor, and abandoned early if yet
+      another snapshot arrives.
+    - Until the refresh for the current snapshot is published, lookups return
+      the previous table's rows marked stale (stale-while-revalidate).
+    - Gradient boosting rows are shared through the backend (save_forecasts).
+      Under serve.py only one worker computes them; the others start with
+      follow=True, keep the cheap algorithms themselves and adopt the shared
+      rows whose history fingerprint matches their snapshot.
+    """
+
+    def __init__(self, store, online, executor, algos=forecasting.ALGORITHMS,
+                 horizon=forecasting.DEFAULT_HORIZON, gbr_chunk=GBR_CHUNK, poll=SHARED_POLL):
+        self.store = store
+        self.online = online
+        self.executor = executor
+        self.algos = tuple(a for a in algos if a in forecasting.ALGORITHMS)
+        self.horizon = horizon
+        self.gbr_chunk = gbr_chunk
+        self.poll = poll
+        self.follow = False
+        self.table = None
+        self.shared = None      # release id -> [fingerprint, horizon, computed_at, gradient boosting row]
+        self.shared_seen = None
+        self.refreshes = 0
+        self.refreshing = False
+        self.last_refresh_s = None
+        self.last_error = None
+        self._wakeup = None
+        self._task = None
+
+    # --- LIFECYCLE ---
+    def start(self, follow=False):
+        self.follow = follow
+        if not self.algos:
+            return
+        loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()  # initial build
+        self.store.subscribe(lambda snap: loop.call_soon_threadsafe(self._wakeup.set))
+        self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def promote(self):
+        """Start computing (and sharing) gradient boosting rows instead of following."""
+        self.follow = False
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            if self.follow:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await self._wakeup.wait()
+            try:
+                if self._wakeup.is_set():
+                    self._wakeup.clear()
+                    await self.refresh(self.store.current())
+                elif self.follow and self.table is not None:
+                    await asyncio.to_thread(self.sync_shared, self.table)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                log.exception("forecast refresh failed")
+
+    # --- REFRESH ---
+    def _plan(self, snap, previous):
+        """New table with unchanged rows carried over; returns (table, changed row indices)."""
+        releases = snap.data.get('releases', [])
+        ids = [r['id'] for r in releases]
+        fingerprints = [history_fingerprint(h) for h in snap.columns.histories]
+        table = ForecastTable(snap.version, ids, fingerprints, self.horizon, self.algos)
+        src, dst, changed = [], [], []
+        for i, (rid, fp) in enumerate(zip(ids, fingerprints)):
+            row = previous.row_of.get(rid) if previous is not None else None
+            if row is not None and previous.fingerprints[row] == fp:
+                src.append(row)
+                dst.append(i)
+            else:
+                changed.append(i)
+        if src and previous.horizon == self.horizon:
+            for algo in self.algos:
+                if algo in previous.values:
+                    table.values[algo][dst] = previous.values[algo][src]
+                    table.computed_at[algo][dst] = previous.computed_at[algo][src]
+                    table.ready[algo][dst] = previous.ready[algo][src]
+        else:
+            changed = list(range(len(ids)))
+        return table, changed
+
+    def _fill_online(self, table, releases, rows):
+        pairs = [(releases[i]['id'], releases[i]['stats']['history']) for i in rows]
+        self.online.verify(pairs)  # these histories changed: check the running state still holds
+        for algo in self.algos:
+            if algo in ONLINE_ALGORITHMS:
+                predictions = self.online.forecast_many(pairs, algo, self.horizon)
+                table.fill(algo, rows, np.array(predictions, dtype=np.int64).reshape(-1, self.horizon), time.time())
+
+    # --- SHARING ---
+    def sync_shared(self, table):
+        """Re-read the shared rows if they changed (or never loaded) and adopt what fits `table`."""
+        if "gradient_boosting" not in self.algos:
+            return 0
+        seen = self.store.backend.shared_fingerprint("forecasts")
+        if self.shared is None or seen != self.shared_seen:
+            self.shared_seen = seen
+            self.shared = self.store.backend.load_forecasts()
+        return self._adopt(table)
+
+    def _adopt(self, table):
+        ready = table.ready["gradient_boosting"]
+        rows, values, times = [], [], []
+        for rid, (fingerprint, horizon, computed_at, forecast) in self.shared.items():
+            row = table.row_of.get(rid)
+            if row is not None and not ready[row] and horizon == table.horizon and table.fingerprints[row] == fingerprint:
+                rows.append(row)
+                values.append(forecast)
+                times.append(computed_at)
+        if rows:
+            table.fill("gradient_boosting", rows, np.array(values, dtype=np.int64), np.array(times))
+        return len(rows)
+
+    def _share(self, table, rows):
+        changed = {table.ids[i]: [table.fingerprints[i], table.horizon, float(table.computed_at["gradient_boosting"][i]),
+                                  table.values["gradient_boosting"][i].tolist()] for i in rows}
+        removed = [rid for rid in self.shared if rid not in table.row_of]
+        for rid in removed:
+            del self.shared[rid]
+        self.shared.update(changed)
+        if changed or removed:
+            self.store.backend.save_forecasts(changed, removed)
+
+    async def _fill_gbr(self, table, histories):
+        pending = np.flatnonzero(~table.ready["gradient_boosting"])
+        for start in range(0, len(pending), self.gbr_chunk):
+            if self._wakeup.is_set() or table is not self.table:
+                return  # a newer snapshot is waiting; it will carry finished rows over
+            rows = pending[start:start + self.gbr_chunk]
+            while True:
+                try:
+                    predictions = await self.executor.run(forecasting.batch_forecast, histories.take(rows),
+                                                          "gradient_boosting", self.horizon)
+                    break
+                except ExecutorSaturated:
+                    await asyncio.sleep(1.0)  # interactive requests come first
+                except JobTimeout:
+                    predictions = None
+                    break
+            if predictions is not None:
+                table.fill("gradient_boosting", rows, np.array(predictions, dtype=np.int64), time.time())
+                await asyncio.to_thread(self._share, table, rows)
+
+    def prime(self, snap):
+        """
+        Synchronous build of the cheap algorithms for `snap`, e.g. in a
+        pre-fork parent (serve.py) so workers start with a table. Gradient
+        boosting rows come from the shared ones; the rest are left to the
+        background refresh.
+        """
+        if not self.algos:
+            return
+        table, changed = self._plan(snap, self.table)
+        if changed:
+            self._fill_online(table, snap.data.get('releases', []), changed)
+        self.sync_shared(table)
+        self.table = table
+
+    async def refresh(self, snap):
+        started = time.perf_counter()
+        self.refreshing = True
+        try:
+            releases = snap.data.get('releases', [])
+            table, changed = await asyncio.to_thread(self._plan, snap, self.table)
+            if changed:
+                await asyncio.to_thread(self._fill_online, table, releases, changed)
+                await asyncio.to_thread(self.online.flush)
+            await asyncio.to_thread(self.sync_shared, table)
+            self.table = table
+            if "gradient_boosting" in self.algos and not self.follow:
+                await self._fill_gbr(table, snap.columns.histories)
+            self.refreshes += 1
+            self.last_refresh_s = round(time.perf_counter() - started, 3)
+            self.last_error = None
+        finally:
+            self.refreshing = False
+
+    def invalidate(self, release_ids):
+        """Stop serving these releases' rows (their data changed under them) until the next refresh."""
+        table = self.table
+        if table is None:
+            return
+        rows = [table.row_of[rid] for rid in release_ids if rid in table.row_of]
+        for ready in table.ready.values():
+            ready[rows] = False
+
+    # --- READS ---
+    def lookup(self, release_id, algo, version):
+        """(forecast, computed_at, stale) in O(1), or None on a miss."""
+        table = self.table
+        if table is None:
+            return None
+        hit = table.get(release_id, algo)
+        if hit is None:
+            return None
+        return hit[0], hit[1], table.version != version
+
+    def stats(self):
+        table = self.table
+        return {
+            "algorithms": list(self.algos),
+            "follow": self.follow,
+            "version": table.version if table else None,
+            "releases": len(table.row_of) if table else 0,
+            "ready": {algo: int(r.sum()) for algo, r in table.ready.items()} if table else {},
+            "refreshing": self.refreshing,
+            "refreshes": self.refreshes,
+            "last_refresh_s": self.last_refresh_s,
+            "last_error": self.last_error,
+        }
+
+
+def from_env(store, online, executor):
+    """FORECAST_PRECOMPUTE: 'all' (default), 'off', or a comma separated list of algorithms."""
+    setting = os.getenv("FORECAST_PRECOMPUTE", "all").strip().lower()
+    if setting in ("off", "0", "none", ""):
+        algos = ()
+    elif setting == "all":
+        algos = forecasting.ALGORITHMS
+    else:
+        algos = tuple(a.strip() for a in setting.split(","))
+    return ForecastMaterializer(store, online, executor, algos,
+                                gbr_chunk=int(os.getenv("FORECAST_PRECOMPUTE_GBR_CHUNK", str(GBR_CHUNK))),
+                                poll=float(os.getenv("FORECAST_SHARED_POLL", str(SHARED_POLL))))
@@ -0,0 +1,260 @@
+import numpy as np
+
+# --- FORECAST ALGORITHMS ---
+ALGORITHMS = ("linear", "polynomial", "gradient_boosting", "moving_average", "exponential")
+POLY_DEGREES = {"linear": 1, "polynomial": 2}
+DEFAULT_HORIZON = 7
+MA_WINDOW = 3
+EWMA_ALPHA = 0.8
+BATCH_CHUNK = 20000  # rows per padded matrix, keeps memory flat for huge catalogs
+SNAP_DECIMALS = 6    # float noise below this is rounded away before truncating
+
+
+def _clip(values):
+    return _clip_matrix(np.fromiter(values, dtype=float)).tolist()
+
+
+def _clip_matrix(values):
+    # Same rounding as the original endpoint: truncate, never below zero. A whole number that
+    # comes out as 279.9999999 is snapped to 280 first, so every solver truncates it alike
+    return np.maximum(0, np.trunc(np.round(values, SNAP_DECIMALS))).astype(np.int64)
+
+
+# --- BATCHED LEAST SQUARES ---
+def _pad(histories, lengths, width):
+    # Scatter all histories into one zero-padded (n, width) matrix in one shot
+    Y = np.zeros((len(histories), width))
+    if lengths.sum():
+        if hasattr(histories, "flat"):
+            flat = histories.flat  # columnar.HistoryColumns: already one flat array
+        else:
+            flat = np.concatenate([np.asarray(h, dtype=float) for h in histories if len(h)])
+        rows = np.repeat(np.arange(len(histories)), lengths)
+        cols = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        Y[rows, cols] = flat
+    return Y
+
+
+def _fit_chunk(histories, degree, horizon):
+    n = len(histories)
+    if hasattr(histories, "lengths"):
+        lengths = histories.lengths
+    else:
+        lengths = np.fromiter((len(h) for h in histories), dtype=np.int64, count=n)
+    width = max(1, int(lengths.max()) if n else 1)
+
+    Y = _pad(histories, lengths, width)
+    mask = (np.arange(width)[None, :] < lengths[:, None]).astype(float)
+
+    # Scale x to [0, 1] so the normal equations stay well conditioned
+    scale = float(max(width - 1, 1))
+    t = np.arange(width) / scale
+    T = t[:, None] ** np.arange(2 * degree + 1)[None, :]      # (width, 2d+1)
+
+    # Masked moments sum(t^k) and sum(y * t^k) for every series, as two matmuls
+    moments = mask @ T                                        # (n, 2d+1)
+    b = Y @ T[:, :degree + 1]                                 # (n, d+1); padding is zero
+    return solve_moments(moments, b, lengths, scale, degree, horizon)
+
+
+def solve_moments(moments, b, lengths, scale, degree, horizon):
+    """
+    Solve the normal equations from precomputed moments and extrapolate.
+    moments[:, k] = sum(t^k) for k <= 2d, b[:, j] = sum(y * t^j), with t = x / scale
+    (`scale` is a scalar or one value per series). Returns (n, horizon) floats.
+    """
+    n = len(lengths)
+    idx = np.arange(degree + 1)
+    A = moments[:, idx[:, None] + idx[None, :]]               # (n, d+1, d+1) Hankel
+    coef = np.zeros((n, degree + 1))
+    solvable = lengths > degree
+    if solvable.any():
+        coef[solvable] = np.linalg.solve(A[solvable], b[solvable][:, :, None])[:, :, 0]
+    short = ~solvable & (lengths > 0)
+    if short.any():
+        # Too few points for this degree: minimum-norm solution, like np.polyfit
+        coef[short] = (np.linalg.pinv(A[short]) @ b[short][:, :, None])[:, :, 0]
+
+    # Evaluate the whole horizon as one Vandermonde matmul
+    future = (lengths[:, None] + np.arange(horizon)[None, :]) / np.reshape(scale, (-1, 1))  # (n, horizon)
+    V = future[:, :, None] ** idx[None, None, :]                        # (n, horizon, d+1)
+    return (V @ coef[:, :, None])[:, :, 0]
+
+
+def batch_polyfit_forecast(histories, degree, horizon=DEFAULT_HORIZON):
+    """
+    Fit a degree-`degree` polynomial to every history at once and return an
+    (n, horizon) int array of clipped predictions.
+    """
+    out = np.zeros((len(histories), horizon), dtype=np.int64)
+    for start in range(0, len(histories), BATCH_CHUNK):
+        chunk = histories[start:start + BATCH_CHUNK]
+        out[start:start + len(chunk)] = _clip_matrix(_fit_chunk(chunk, degree, horizon))
+    return out
+
+
+# --- SINGLE-SERIES MODELS ---
+GBR_PARAMS = {"n_estimators": 100, "learning_rate": 0.1, "max_depth": 1, "random_state": 42}
+
+
+def fit_gradient_boosting(history, params=GBR_PARAMS):
+    """Train a GBR on day index -> sales. CPU-bound; run it off the event loop."""
+    from sklearn.ensemble import GradientBoostingRegressor
+    X = np.arange(len(history)).reshape(-1, 1)
+    model = GradientBoostingRegressor(**params)
+    model.fit(X, np.array(history))
+    return model
+
+
+def predict_gradient_boosting(model, n_days, horizon=DEFAULT_HORIZON):
+    # One predict call over the whole horizon instead of one per day
+    future = np.arange(n_days, n_days + horizon).reshape(-1, 1)
+    return _clip(model.predict(future))
+
+
+def _gradient_boosting(history, horizon):
+    return predict_gradient_boosting(fit_gradient_boosting(history), len(history), horizon)
+
+
+def _moving_average(history, horizon, window=MA_WINDOW):
+    avg_val = sum(history[-window:]) / window
+    return _clip(avg_val * (1 + (0.01 * i)) for i in range(horizon))
+
+
+def _exponential(history, horizon, alpha=EWMA_ALPHA):
+    last_val = history[0]
+    for val in history[1:]:
+        last_val = alpha * val + (1 - alpha) * last_val
+    return _clip([last_val] * horizon)
+
+
+# --- PREDICTION INTERVALS ---
+INTERVAL_QUANTILES = (10, 50, 90)
+
+
+def interval_samples(n_days, requested, max_samples, budget):
+    """Resample count for one request: at most max_samples, and samples * n_days <= budget."""
+    return int(max(1, min(requested, max_samples, budget // max(n_days, 1))))
+
+
+def _linear_operator(y, algo, horizon):
+    """
+    (fitted, residuals, M) such that every bootstrap-able algorithm's forecast
+    is `series @ M` for an (n, horizon) matrix M: polynomial fits, the moving
+    average and the EWMA are all linear in the history.
+    """
+    n = len(y)
+    if algo in POLY_DEGREES:
+        degree = POLY_DEGREES[algo]
+        scale = float(max(n - 1, 1))
+        X = (np.arange(n) / scale)[:, None] ** np.arange(degree + 1)
+        Xf = ((n + np.arange(horizon)) / scale)[:, None] ** np.arange(degree + 1)
+        pinv = np.linalg.pinv(X)                                # (d+1, n)
+        fitted = X @ (pinv @ y)
+        return fitted, y - fitted, pinv.T @ Xf.T
+
+    M = np.zeros((n, horizon))
+    if algo == "moving_average":
+        w = min(MA_WINDOW, n)
+        M[n - w:, :] = (1 + 0.01 * np.arange(horizon))[None, :] / MA_WINDOW
+        # One-step-ahead fit: mean of the previous window
+        csum = np.concatenate([[0.0], np.cumsum(y)])
+        idx = np.arange(MA_WINDOW, n)
+        fitted = y.copy()
+        fitted[idx] = (csum[idx] - csum[idx - MA_WINDOW]) / MA_WINDOW
+        residuals = y[MA_WINDOW:] - fitted[MA_WINDOW:]
+        return fitted, residuals, M
+
+    # exponential: final EWMA = sum(weights * y); one-step-ahead fit = previous EWMA value
+    weights = EWMA_ALPHA * (1 - EWMA_ALPHA) ** np.arange(n - 1, -1, -1)
+    weights[0] = (1 - EWMA_ALPHA) ** (n - 1)
+    M[:] = weights[:, None]
+    level = np.empty(n)
+    level[0] = y[0]
+    for t in range(1, n):
+        level[t] = EWMA_ALPHA * y[t] + (1 - EWMA_ALPHA) * level[t - 1]
+    fitted = np.concatenate([[y[0]], level[:-1]])
+    return fitted, (y - fitted)[1:], M
+
+
+def _bootstrap_bands(history, algo, horizon, samples, rng):
+    y = np.asarray(history, dtype=float)
+    _, residuals, M = _linear_operator(y, algo, horizon)
+    if not len(residuals):
+        residuals = np.zeros(1)
+    # Mean-centered: the one-step-ahead residuals of the moving average / EWMA
+    # are biased by the trend and would shift the whole band off the forecast
+    residuals = residuals - residuals.mean()
+    point = y @ M
+    # All resamples at once: (samples, n) resampled noise refit with one matmul
+    # around the forecast of the actual history, plus a resampled residual per future day
+    noise = residuals[rng.integers(0, len(residuals), (samples, len(y)))]
+    paths = point[None, :] + noise @ M + residuals[rng.integers(0, len(residuals), (samples, horizon))]
+    return np.percentile(paths, INTERVAL_QUANTILES, axis=0)
+
+
+def _quantile_gbr_bands(history, horizon, quantiles=INTERVAL_QUANTILES):
+    from sklearn.ensemble import GradientBoostingRegressor
+    X = np.arange(len(history)).reshape(-1, 1)
+    future = np.arange(len(history), len(history) + horizon).reshape(-1, 1)
+    bands = []
+    for q in quantiles:
+        params = {**GBR_PARAMS, "loss": "quantile", "alpha": q / 100}
+        bands.append(GradientBoostingRegressor(**params).fit(X, np.array(history)).predict(future))
+    return np.array(bands)
+
+
+def forecast_intervals(history, algo="linear", horizon=DEFAULT_HORIZON, samples=1000, seed=42):
+    """
+    p10/p50/p90 bands for the next `horizon` days. gradient_boosting uses
+    quantile-loss GBRs for p10/p90 and reports the served forecast as p50;
+    every other algorithm uses a residual bootstrap with `samples`
+    resamples, vectorized. Seeded, so repeat calls agree.
+    CPU-bound; run it on the ML executor.
+    """
+    algo = resolve_algo(algo)
+    if not len(history):
+        zeros = [0] * horizon
+        return {"p10": zeros, "p50": zeros, "p90": zeros, "method": None, "samples": 0}
+    point = forecast(history, algo, horizon)
+    if algo == "gradient_boosting":
+        # A separate median fit lands away from the served forecast; that forecast is the p50
+        outer = _quantile_gbr_bands(history, horizon, (INTERVAL_QUANTILES[0], INTERVAL_QUANTILES[-1]))
+        p10, p90 = _clip_matrix(np.sort(outer, axis=0)).tolist()  # sorted: independent quantile fits can cross
+        p50, method, samples = point, "quantile_gbr", None
+    else:
+        bands = _bootstrap_bands(history, algo, horizon, samples, np.random.default_rng(seed))
+        p10, p50, p90 = _clip_matrix(bands).tolist()
+        method = "residual_bootstrap"
+    # p10 <= forecast <= p90, also where skewed residuals, quantile fits or rounding put a band past it
+    p10 = [min(lo, f) for lo, f in zip(p10, point)]
+    p90 = [max(hi, f) for hi, f in zip(p90, point)]
+    return {"p10": p10, "p50": p50, "p90": p90, "method": method, "samples": samples}
+
+
+def resolve_algo(algo):
+    # Unknown algorithms fall back to linear, as the endpoint always has
+    return algo if algo in ALGORITHMS else "linear"
+
+
+def forecast(history, algo="linear", horizon=DEFAULT_HORIZON):
+    """Predict the next `horizon` days of one release's history."""
+    algo = resolve_algo(algo)
+    if algo in POLY_DEGREES:
+        return batch_polyfit_forecast([history], POLY_DEGREES[algo], horizon)[0].tolist()
+    if algo == "gradient_boosting":
+        return _gradient_boosting(history, horizon)
+    if algo == "moving_average":
+        return _moving_average(history, horizon)
+    return _exponential(history, horizon)
+
+
+def batch_forecast(histories, algo="linear", horizon=DEFAULT_HORIZON):
+    """
+    Forecast many histories. Linear/polynomial are solved as one batched
+    least-squares problem; the other algorithms run per series.
+    """
+    algo = resolve_algo(algo)
+    if algo in POLY_DEGREES:
+        return batch_polyfit_forecast(histories, POLY_DEGREES[algo], horizon).tolist()
+    return [forecast(h, algo, horizon) for h in histories]
@@ -1,63 +1,198 @@
+import os
 import json
+import math
 import random
-import uuid
-
-def generate_large_database(num_competitors=50, num_customers=5000):
-    print(f"--- GENERATING LARGE DATABASE ({num_customers} customers) ---")
-    
-    # 1. Current Release (Static)
-    current_release = {
-        "product_id": "REL-2024-X1",
-        "artist": "Lunar Echo",
-        "genre": "Melodic Techno",
-        "mood_tags": ["Dark", "Hypnotic", "Driving"],
-        "bpm": 126,
-        "energy_score": 0.85,
-        "marketing_budget": 15000,
-        "workflow_status": "Marketing", # Default start stage
-        "historical_daily_sales": [random.randint(100, 500) for _ in range(30)]
-    }
-
-    # 2. Generate Competitors
-    competitors = []
-    for i in range(num_competitors):
-        competitors.append({
-            "name": f"Competitor {i+1}",
-            "bpm": random.randint(118, 135),
-            "energy_score": round(random.uniform(0.5, 1.0), 2),
-            "sales_velocity": random.randint(50, 1000)
-        })
-
-    # 3. Generate Customers
-    customers = []
-    regions = ["EMEA", "NA", "APAC", "LATAM"]
-    for i in range(num_customers):
-        customers.append({
-            "id": f"B2B-{str(uuid.uuid4())[:8]}",
-            "name": f"Customer {i+1} {random.choice(['Records', 'Club', 'Distro', 'Radio'])}",
-            "avg_order_val": random.randint(500, 10000),
-            "genre_affinity": round(random.uniform(0.1, 0.99), 2),
-            "region": random.choice(regions)
-        })
-
-    # 4. Market Signals
-    market_signals = {
-        "competitor_drop": random.choice([True, False]),
-        "tiktok_trend_volume": random.choice(["High", "Medium", "Low"]),
-        "similar_artist_performance": f"{random.choice(['+', '-'])}{random.randint(5, 25)}%"
-    }
-
-    full_db = {
-        "current_release": current_release,
-        "competitors": competitors,
-        "customers": customers,
-        "market_signals": market_signals
-    }
-
-    with open("database.json", "w") as f:
-        json.dump(full_db, f, indent=2)
-    
-    print(f"✅ Success: database.json created with {len(customers)} customers.")
+import argparse
+import tempfile
+from itertools import islice
+
+# --- CATALOG VOCABULARY ---
+# genre -> typical BPM range
+GENRES = {
+    "Melodic Techno": (120, 128), "Deep House": (118, 125), "Cyberpunk Bass": (140, 150),
+    "Liquid DnB": (170, 176), "Lo-Fi Beats": (70, 90), "Synthwave": (80, 118),
+    "Industrial Techno": (128, 140), "Future Bass": (140, 160), "Trap": (130, 150),
+    "Ambient": (60, 90), "Trance": (132, 140), "Dubstep": (140, 150),
+    "Indie Dance": (110, 124), "Nu-Disco": (115, 125), "Hardstyle": (150, 160),
+}
+TREND_WEIGHTS = {"Low": 0.35, "Medium": 0.35, "High": 0.2, "Viral": 0.1}
+REGIONS = ["EMEA", "NA", "APAC", "LATAM"]
+CUSTOMER_KINDS = ["Records", "Club", "Distro", "Radio", "Vinyl", "Collective"]
+CITIES = ["Berlin", "Tokyo", "London", "Ibiza", "Detroit", "Paris", "Sao Paulo", "Seoul",
+          "Amsterdam", "Chicago", "Melbourne", "Mexico City", "Lagos", "Tbilisi"]
+SYLLABLES = ["lu", "nar", "ech", "o", "so", "lar", "neo", "cy", "ber", "vel", "ta", "ka",
+             "ra", "mi", "zen", "qu", "ion", "dri", "ft", "ax", "or", "el", "va", "syn"]
+WORDS = ["Midnight", "Velocity", "Golden", "Hour", "Protocol", "Neon", "Drift", "Pulse",
+         "Echo", "Horizon", "Static", "Bloom", "Signal", "Mirage", "Orbit", "Ember", "Tide"]
+IMAGES = [
+    "https://images.unsplash.com/photo-1614613535308-eb5fbd3d2c17?q=80&w=2070&auto=format&fit=crop",
+    "https://images.unsplash.com/photo-1493225255756-d9584f8606e9?q=80&w=2070&auto=format&fit=crop",
+    "https://images.unsplash.com/photo-1470225620780-dba8ba36b745?q=80&w=2070&auto=format&fit=crop",
+    "https://images.unsplash.com/photo-1511379938547-c1f69419868d?q=80&w=2070&auto=format&fit=crop",
+]
+
+
+def _name(rng, parts):
+    return "".join(rng.choice(SYLLABLES) for _ in range(parts)).capitalize()
+
+
+def _history(rng, min_len, max_len):
+    """
+    Daily unit sales with a launch level, a growth/decay trend over the first
+    few months followed by a slow long-tail decline, a weekly cycle and noise.
+    Lengths are log-normal: most releases are weeks old, a few are years.
+    """
+    length = int(min(max_len, max(min_len, rng.lognormvariate(math.log(30), 0.9))))
+    base = rng.lognormvariate(math.log(120), 0.8)
+    growth = min(0.04, max(-0.03, rng.gauss(0.01, 0.015)))
+    weekly = rng.uniform(0, 0.25)
+    phase = rng.randrange(7)
+    history = []
+    for day in range(length):
+        trend = math.exp(growth * min(day, 90) - 0.002 * max(0, day - 90))
+        level = base * trend * (1 + weekly * math.sin(2 * math.pi * (day + phase) / 7))
+        history.append(max(0, int(rng.gauss(level, level * 0.1))))
+    return history
+
+
+# --- RECORD GENERATORS ---
+def generate_releases(count, seed=42, min_history=7, max_history=730):
+    rng = random.Random(seed)
+    trends, weights = zip(*TREND_WEIGHTS.items())
+    for i in range(count):
+        genre = rng.choice(list(GENRES))
+        history = _history(rng, min_history, max_history)
+        price = rng.uniform(0.9, 1.5)
+        yield {
+            "id": f"REL-{i + 1:07d}",
+            "artist": f"{_name(rng, 2)} {_name(rng, 2)}",
+            "track_name": f"{rng.choice(WORDS)} {rng.choice(WORDS)}",
+            "genre": genre,
+            "bpm": rng.randint(*GENRES[genre]),
+            "image": rng.choice(IMAGES),
+            "stats": {
+                "revenue": int(sum(history) * price * 10),
+                "budget": rng.randrange(1000, 50000, 500),
+                "sentiment": round(rng.uniform(5.0, 9.9), 1),
+                "history": history,
+            },
+            "market_signals": {
+                "competitor_drop": rng.random() < 0.3,
+                "tiktok_trend": rng.choices(trends, weights)[0],
+            },
+        }
+
+
+def generate_customers(count, seed=42):
+    rng = random.Random(seed + 1)  # independent stream: customer data doesn't depend on release count
+    for i in range(count):
+        avg_order_val = rng.randint(500, 10000)
+        yield {
+            "id": f"B2B-{i + 1:07d}",
+            "name": f"{rng.choice(CITIES)} {rng.choice(CUSTOMER_KINDS)} {i + 1}",
+            "avg_order_val": avg_order_val,
+            "region": rng.choice(REGIONS),
+            "bpm": rng.randint(70, 175),
+            "value": avg_order_val,
+        }
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# --- STREAMING WRITERS ---
+# Every writer holds at most one chunk in memory and publishes atomically.
+def _atomic_text_writer(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix='.gen-', dir=directory)
+    os.chmod(tmp, 0o644)  # mkstemp creates 0600; the output should be readable like a normal file
+    return os.fdopen(fd, 'w'), tmp
+
+
+def write_json(path, releases, customers, chunk_size):
+    f, tmp = _atomic_text_writer(path)
+    try:
+        with f:
+            for name, rows, opener in (("releases", releases, '{"releases":['), ("customers", customers, '],"customers":[')):
+                f.write(opener)
+                first = True
+                for chunk in chunked(rows, chunk_size):
+                    body = ",\n".join(json.dumps(r, separators=(',', ':')) for r in chunk)
+                    f.write(body if first else ",\n" + body)
+                    first = False
+            f.write("]}\n")
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def write_ndjson(path, releases, customers, chunk_size):
+    # Same line format as /api/database?format=ndjson
+    f, tmp = _atomic_text_writer(path)
+    try:
+        with f:
+            for name, rows in (("releases", releases), ("customers", customers)):
+                for chunk in chunked(rows, chunk_size):
+                    f.write("".join(json.dumps({"collection": name, **r}, separators=(',', ':')) + "\n" for r in chunk))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def write_sqlite(path, releases, customers, chunk_size):
+    from storage import SQLiteBackend
+    backend = SQLiteBackend(path, pool_size=1)
+    try:
+        # One transaction: a watching server sees either the old catalog or the new one
+        with backend.transaction() as conn:
+            conn.execute("DELETE FROM releases")
+            conn.execute("DELETE FROM customers")
+            pos = 0
+            for chunk in chunked(releases, chunk_size):
+                backend.insert_chunk(conn, releases=chunk, release_pos=pos)
+                pos += len(chunk)
+            pos = 0
+            for chunk in chunked(customers, chunk_size):
+                backend.insert_chunk(conn, customers=chunk, customer_pos=pos)
+                pos += len(chunk)
+    finally:
+        backend.close()
+
+
+WRITERS = {"json": write_json, "ndjson": write_ndjson, "sqlite": write_sqlite}
+
+
+def generate_large_database(num_releases=1000, num_customers=5000, out="database.json", fmt="json",
+                            seed=42, chunk_size=10000, min_history=7, max_history=730):
+    print(f"--- GENERATING LARGE DATABASE ({num_releases} releases, {num_customers} customers) ---")
+    releases = generate_releases(num_releases, seed, min_history, max_history)
+    customers = generate_customers(num_customers, seed)
+    WRITERS[fmt](out, releases, customers, chunk_size)
+    print(f"✅ Success: {out} ({fmt}) created with {num_releases} releases and {num_customers} customers.")
+
 
 if __name__ == "__main__":
-    generate_large_database()
+    parser = argparse.ArgumentParser(description="Generate a synthetic catalog in the current schema")
+    parser.add_argument("--releases", type=int, default=1000)
+    parser.add_argument("--customers", type=int, default=5000)
+    parser.add_argument("--format", choices=sorted(WRITERS), default="json")
+    parser.add_argument("--out", default=None, help="output path (default: database.json / .ndjson / .db)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--min-history", type=int, default=7)
+    parser.add_argument("--max-history", type=int, default=730)
+    args = parser.parse_args()
+
+    default_out = {"json": "database.json", "ndjson": "database.ndjson", "sqlite": "database.db"}[args.format]
+    generate_large_database(args.releases, args.customers, args.out or default_out, args.format,
+                            args.seed, args.chunk_size, args.min_history, args.max_history)
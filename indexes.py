@@ -0,0 +1,109 @@
+from collections import defaultdict
+
+# --- INDEX DEFINITIONS ---
+# collection -> {query param name: path into the record}
+# Customers don't carry artist/genre/trend fields, so they are indexed by region.
+SECONDARY_INDEXES = {
+    "releases": {
+        "artist": ("artist",),
+        "genre": ("genre",),
+        "tiktok_trend": ("market_signals", "tiktok_trend"),
+    },
+    "customers": {
+        "region": ("region",),
+    },
+}
+
+
+def _dig(record, path):
+    value = record
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _norm(value):
+    # Filters are case-insensitive: ?genre=deep%20house matches "Deep House"
+    return str(value).strip().casefold()
+
+
+class CatalogIndex:
+    """
+    Lookup tables built once per data snapshot.
+
+    - by_id: collection -> {id: record}, for O(1) point reads.
+    - secondary: collection -> field -> value -> [row positions], ascending,
+      so filtered results come back in the same order as the database.
+    """
+
+    def __init__(self, data):
+        self.by_id = {}
+        self.positions = {}
+        self.secondary = {}
+        self.rows = {}
+        self.labels = {}
+        for collection, fields in SECONDARY_INDEXES.items():
+            records = data.get(collection, []) if isinstance(data, dict) else []
+            self.rows[collection] = records
+            self.by_id[collection] = {r['id']: r for r in records if 'id' in r}
+            self.positions[collection] = {r['id']: pos for pos, r in enumerate(records) if 'id' in r}
+
+            tables = {name: defaultdict(list) for name in fields}
+            labels = {name: {} for name in fields}
+            for pos, record in enumerate(records):
+                for name, path in fields.items():
+                    value = _dig(record, path)
+                    if value is not None:
+                        key = _norm(value)
+                        tables[name][key].append(pos)
+                        labels[name].setdefault(key, value)
+            self.secondary[collection] = {name: dict(t) for name, t in tables.items()}
+            self.labels[collection] = labels
+
+    def get(self, collection, record_id):
+        return self.by_id.get(collection, {}).get(record_id)
+
+    def position(self, collection, record_id):
+        return self.positions.get(collection, {}).get(record_id)
+
+    def release(self, release_id):
+        return self.get("releases", release_id)
+
+    def customer(self, customer_id):
+        return self.get("customers", customer_id)
+
+    def filter(self, collection, **criteria):
+        """
+        Records matching every non-empty criterion (AND).
+        Unknown fields raise KeyError so the API can report a 400.
+        """
+        tables = self.secondary.get(collection, {})
+        criteria = {k: v for k, v in criteria.items() if v not in (None, "")}
+        records = self.rows.get(collection, [])
+        if not criteria:
+            return list(records)
+
+        postings = []
+        for field, value in criteria.items():
+            if field not in tables:
+                raise KeyError(field)
+            postings.append(tables[field].get(_norm(value), []))
+
+        # Intersect starting from the shortest posting list
+        postings.sort(key=len)
+        positions = set(postings[0])
+        for other in postings[1:]:
+            positions.intersection_update(other)
+            if not positions:
+                break
+        return [records[p] for p in sorted(positions)]
+
+    def facets(self, collection):
+        """Distinct values (and counts) per indexed field, for filter dropdowns."""
+        labels = self.labels.get(collection, {})
+        return {
+            field: {labels[field][key]: len(pos) for key, pos in table.items()}
+            for field, table in self.secondary.get(collection, {}).items()
+        }
@@ -0,0 +1,376 @@
+import io
+import os
+import csv
+import sys
+import json
+import math
+import time
+import threading
+from datetime import date, timedelta
+from collections import defaultdict
+
+# Records per validation chunk; in strict mode parsing stops after the first chunk with errors
+CHUNK_SIZE = 5000
+MAX_ERRORS = 100   # reported per batch; the count is always exact
+
+# market_signals fields a record may set, and how to read them from a CSV cell
+SIGNAL_FIELDS = ("competitor_drop", "tiktok_trend")
+RECORD_FIELDS = ("release_id", "date", "units") + SIGNAL_FIELDS
+_TRUE = {"true", "1", "yes", "y"}
+_FALSE = {"false", "0", "no", "n"}
+
+FORMATS = ("ndjson", "csv")
+
+
+class IngestError(ValueError):
+    """One record that can't be applied."""
+
+
+# --- PARSING ---
+def detect_format(fmt=None, content_type=None, filename=None):
+    if fmt:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format '{fmt}' (expected one of {', '.join(FORMATS)})")
+        return fmt
+    if (content_type and "csv" in content_type) or (filename and filename.endswith(".csv")):
+        return "csv"
+    return "ndjson"
+
+
+def read_records(lines, fmt="ndjson"):
+    """Yields (line number, dict or IngestError) from NDJSON lines or CSV rows with a header."""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            if None in record:
+                yield reader.line_num, IngestError("more cells than header columns")
+                continue
+            # Empty cells are absent fields, so one file can mix sales and signal rows
+            yield reader.line_num, {k.strip(): v.strip() for k, v in record.items() if v is not None and v.strip()}
+        return
+    for line_no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, IngestError(f"invalid JSON: {e}")
+            continue
+        yield line_no, record if isinstance(record, dict) else IngestError("expected a JSON object")
+
+
+def _units(value):
+    if isinstance(value, str):
+        try:
+            value = float(value) if any(c in value for c in ".eE") else int(value)
+        except ValueError:
+            raise IngestError(f"units must be a number, got {value!r}") from None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise IngestError(f"units must be a number, got {value!r}")
+    if value < 0:
+        raise IngestError("units must be >= 0")
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise IngestError(f"date must be YYYY-MM-DD, got {value!r}") from None
+
+
+def _signal(name, value):
+    if name == "competitor_drop":
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.lower() in _TRUE | _FALSE:
+            return value.lower() in _TRUE
+        raise IngestError(f"competitor_drop must be true/false, got {value!r}")
+    if not isinstance(value, str) or not value.strip():
+        raise IngestError(f"{name} must be a non-empty string")
+    return value.strip()
+
+
+def validate(record):
+    """
+    One raw record -> (release_id, date or None, units or None, {signal: value}).
+    A record carries daily sales (date + units), signal fields, or both.
+    """
+    unknown = [k for k in record if k not in RECORD_FIELDS]
+    if unknown:
+        raise IngestError(f"unknown field(s) {', '.join(map(str, unknown))}")
+    release_id = record.get("release_id")
+    if not isinstance(release_id, str) or not release_id.strip():
+        raise IngestError("release_id is required")
+    day = units = None
+    if record.get("units") is not None or record.get("date") is not None:
+        if record.get("units") is None or record.get("date") is None:
+            raise IngestError("date and units go together")
+        day, units = _date(record["date"]), _units(record["units"])
+    signals = {k: _signal(k, record[k]) for k in SIGNAL_FIELDS if record.get(k) is not None}
+    if units is None and not signals:
+        raise IngestError("nothing to ingest (expected date + units and/or signal fields)")
+    return release_id.strip(), day, units, signals
+
+
+# --- BATCH ---
+class Batch:
+    """
+    Validated updates grouped by release: sales[release][date] = units and
+    signals[release] = {field: value}. The last record for a day / field wins,
+    so replaying a file is idempotent.
+    """
+
+    def __init__(self):
+        self.sales = defaultdict(dict)
+        self.signals = defaultdict(dict)
+        self.lines = defaultdict(list)   # release -> source lines, for errors found at commit
+        self.day_lines = {}              # (release, date) -> source line
+        self.records = 0
+        self.accepted = 0
+        self.errors = []
+        self.rejected = 0
+
+    def reject(self, line_no, error, release_id=None):
+        self.rejected += 1
+        if len(self.errors) < MAX_ERRORS:
+            entry = {"line": line_no, "error": str(error)}
+            if release_id is not None:
+                entry["release_id"] = release_id
+            self.errors.append(entry)
+
+    def add_chunk(self, chunk):
+        for line_no, record in chunk:
+            self.records += 1
+            try:
+                if isinstance(record, IngestError):
+                    raise record
+                release_id, day, units, signals = validate(record)
+            except IngestError as e:
+                self.reject(line_no, e)
+                continue
+            if units is not None:
+                self.sales[release_id][day] = units
+                self.day_lines[release_id, day] = line_no
+            if signals:
+                self.signals[release_id].update(signals)
+            self.lines[release_id].append(line_no)
+            self.accepted += 1
+
+    def release_ids(self):
+        return self.sales.keys() | self.signals.keys()
+
+    def drop(self, release_id, error):
+        """Un-accept every record of one release (e.g. an unknown id)."""
+        for line_no in self.lines.pop(release_id, []):
+            self.accepted -= 1
+            self.reject(line_no, error, release_id)
+        self.sales.pop(release_id, None)
+        self.signals.pop(release_id, None)
+
+    def drop_day(self, release_id, day, error):
+        self.sales[release_id].pop(day, None)
+        self.accepted -= 1
+        self.reject(self.day_lines.get((release_id, day)), error, release_id)
+
+
+def parse(lines, fmt="ndjson", strict=True, chunk_size=CHUNK_SIZE):
+    batch = Batch()
+    chunk = []
+    for item in read_records(lines, fmt):
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            batch.add_chunk(chunk)
+            chunk = []
+            if strict and batch.rejected:
+                return batch
+    if chunk:
+        batch.add_chunk(chunk)
+    return batch
+
+
+# --- APPLYING ---
+def apply_sales(stats, days):
+    """
+    Write {date: units} into stats['history'] (one value per day). The history
+    ends on stats['history_end']; a release without one is anchored so that
+    its history ends the day before the first date ingested. Days past the
+    end are appended (skipped days count as 0 units); earlier days within the
+    history are corrected in place. Days before its start can't be placed:
+    returns (new stats, start date, those days); they are not written.
+    """
+    history = list(stats.get('history', []))
+    first, last = min(days), max(days)
+    end = date.fromisoformat(stats['history_end']) if stats.get('history_end') else first - timedelta(days=1)
+    start = end - timedelta(days=len(history) - 1)
+    early = sorted(day for day in days if day < start)
+    for day, units in days.items():
+        i = (day - start).days
+        if i < 0:
+            continue
+        if i >= len(history):
+            history.extend([0] * (i - len(history) + 1))
+        history[i] = units
+    return {**stats, "history": history, "history_end": max(end, last).isoformat()}, start, early
+
+
+def shift_history_end(stats, days):
+    """history_end after `days` points were appended without dates (POST /api/release/{id}/sales)."""
+    if not stats.get('history_end'):
+        return stats
+    return {**stats, "history_end": (date.fromisoformat(stats['history_end']) + timedelta(days=days)).isoformat()}
+
+
+class Ingestor:
+    """
+    Applies batches of daily sales and market signals through a storage
+    backend.
+
+    - Records are validated chunk by chunk before anything is written; with
+      strict=True (default) a batch with any invalid record writes nothing.
+    - Every touched release is updated in one backend.modify_releases call:
+      a temp file + rename for database.json, one transaction for SQLite.
+    - After a commit `publish()` (DataStore.reload in the server) swaps in the
+      new snapshot. Downstream caches key on each release's own data
+      (history fingerprints, signal keys), so only changed releases are
+      recomputed.
+    - Releases whose existing days were corrected (not just extended) are
+      passed to `invalidate()` first, so state built from the old days
+      (online forecaster sums, materialized forecasts) is dropped.
+    """
+
+    def __init__(self, backend, publish=None, invalidate=None):
+        self.backend = backend
+        self.publish = publish
+        self.invalidate = invalidate
+        self._lock = threading.Lock()   # one batch at a time per process
+        self.batches = 0
+        self.committed = 0
+        self.records = 0
+        self.rejected = 0
+        self.corrected = 0
+        self.last_batch_s = None
+
+    def ingest(self, lines, fmt="ndjson", strict=True):
+        started = time.perf_counter()
+        batch = parse(lines, fmt, strict)
+        report = {"records": batch.records, "committed": False, "releases_changed": 0,
+                  "releases_corrected": 0, "days_written": 0, "signals_updated": 0, "version": None}
+        corrected = []
+        with self._lock:
+            if batch.release_ids() and not (strict and batch.rejected):
+                corrected = self._commit(batch, strict, report)
+            self.batches += 1
+            self.records += batch.records
+            self.rejected += batch.rejected
+            self.committed += report["committed"]
+            self.corrected += len(corrected)
+            self.last_batch_s = round(time.perf_counter() - started, 4)
+        if corrected and self.invalidate:
+            self.invalidate(corrected)
+        if report["releases_changed"] and self.publish:
+            report["version"] = self.publish()
+        report.update(accepted=batch.accepted, rejected=batch.rejected, errors=batch.errors)
+        return report
+
+    def _commit(self, batch, strict, report):
+        early = {}     # release -> (history start, days before it)
+        missing = set()
+        corrected = set()   # releases with an existing day rewritten
+
+        def update(release):
+            rid = release['id']
+            stats = release.get('stats', {})
+            if batch.sales.get(rid):
+                old = stats.get('history', [])
+                stats, start, days = apply_sales(stats, batch.sales[rid])
+                if days:
+                    early[rid] = start, days
+                if stats['history'][:len(old)] != list(old):
+                    corrected.add(rid)
+            signals = {**(release.get('market_signals') or {}), **batch.signals.get(rid, {})}
+            new = {**release, "stats": stats, "market_signals": signals}
+            return None if new == release else new
+
+        def check(found):
+            # Unknown releases and misplaced days only show up once the backend has been read
+            missing.update(batch.release_ids() - found)
+            if strict and (early or missing):
+                raise IngestError("batch rejected")
+
+        try:
+            ids = self.backend.modify_releases(batch.release_ids(), update, check)
+        except IngestError:
+            ids = []   # strict: nothing was written
+        for rid, (start, days) in early.items():
+            for day in days:
+                batch.drop_day(rid, day, IngestError(f"{day.isoformat()} is before the start of the history ({start.isoformat()})"))
+        for rid in missing:
+            batch.drop(rid, IngestError("unknown release"))
+        corrected = [rid for rid in ids if rid in corrected]
+        report.update(committed=bool(ids), releases_changed=len(ids), releases_corrected=len(corrected),
+                      days_written=sum(len(batch.sales.get(rid, {})) for rid in ids),
+                      signals_updated=sum(len(batch.signals.get(rid, {})) for rid in ids))
+        return corrected
+
+    def stats(self):
+        return {"backend": self.backend.kind, "batches": self.batches, "committed": self.committed,
+                "records": self.records, "rejected": self.rejected, "corrected": self.corrected,
+                "last_batch_s": self.last_batch_s}
+
+
+# --- CLI ---
+def push(url, path, fmt, strict):
+    import urllib.error
+    import urllib.request
+
+    query = f"?format={fmt}&strict={str(strict).lower()}"
+    content_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    if path == "-":
+        body = sys.stdin.buffer.read()
+    else:
+        with open(path, 'rb') as f:
+            body = f.read()
+    req = urllib.request.Request(url + query, data=body, method="POST", headers={"Content-Type": content_type})
+    try:
+        with urllib.request.urlopen(req, timeout=300) as res:
+            return json.load(res)
+    except urllib.error.HTTPError as e:
+        if e.code != 422:
+            raise
+        return json.load(e)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import storage
+
+    parser = argparse.ArgumentParser(description="Ingest daily sales / market signals (NDJSON or CSV)")
+    parser.add_argument("files", nargs="+", help="one batch per file; '-' reads stdin")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension (.csv), else ndjson")
+    parser.add_argument("--lenient", action="store_true", help="commit the valid records even if some are rejected")
+    parser.add_argument("--push", metavar="URL", help="POST each file to a running server (e.g. http://127.0.0.1:8001/api/ingest) instead of writing the data directly")
+    parser.add_argument("--backend", default=os.getenv("DATA_BACKEND", "json"), choices=list(storage.BACKENDS))
+    parser.add_argument("--path", default=os.getenv("DATABASE_PATH"))
+    args = parser.parse_args()
+
+    # Written directly, the change is picked up by a running server's data watcher
+    ingestor = None if args.push else Ingestor(storage.open_backend(args.backend, args.path))
+    failed = False
+    for path in args.files:
+        fmt = detect_format(args.format, filename=path)
+        if args.push:
+            report = push(args.push, path, fmt, not args.lenient)
+        elif path == "-":
+            report = ingestor.ingest(io.TextIOWrapper(sys.stdin.buffer, newline=""), fmt, not args.lenient)
+        else:
+            with open(path, newline="") as f:
+                report = ingestor.ingest(f, fmt, not args.lenient)
+        failed = failed or bool(report["rejected"])
+        mark = "✅" if report["committed"] else "⚠️"
+        print(f"{mark} {path}: {report['accepted']}/{report['records']} records, "
+              f"{report['releases_changed']} releases changed, {report['rejected']} rejected")
+        for error in report["errors"]:
+            print(f"   line {error['line']}: {error['error']}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+
+from web_utils import sse_event
+
+
+def merge_patch(old, new):
+    """
+    RFC 7386 JSON merge patch that turns `old` into `new`: changed keys carry
+    their new value, nested objects are diffed recursively, removed keys are
+    null. Lists are replaced whole. Returns {} when nothing changed.
+    """
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return new
+    patch = {key: None for key in old.keys() - new.keys()}
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = value
+        elif old[key] != value:
+            if isinstance(value, dict) and isinstance(old[key], dict):
+                patch[key] = merge_patch(old[key], value)
+            else:
+                patch[key] = value
+    return patch
+
+
+def apply_merge_patch(target, patch):
+    """Apply an RFC 7386 merge patch to `target` in place (when both are objects); returns the result."""
+    if not isinstance(patch, dict):
+        return patch
+    if not isinstance(target, dict):
+        target = {}
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = apply_merge_patch(target.get(key), value)
+    return target
+
+
+class Subscriber:
+    """
+    One connected client: a bounded queue of pre-encoded frames. When it is
+    full the oldest frame is dropped, and since the client can no longer apply
+    deltas in order, it is sent a fresh snapshot next instead.
+    """
+
+    __slots__ = ("frames", "wakeup", "dropped", "resync")
+
+    def __init__(self, buffer_size):
+        self.frames = deque(maxlen=buffer_size)
+        self.wakeup = asyncio.Event()
+        self.dropped = 0
+        self.resync = True  # first frame is always a snapshot
+
+    def push(self, frame):
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+            self.resync = True
+        self.frames.append(frame)
+        self.wakeup.set()
+
+
+class LiveBus:
+    """
+    In-process pub/sub for the live dashboard feed (simulator.py, POST /api/live).
+
+    publish() takes the full state document, diffs it against the previous one
+    and fans the merge patch out to every subscriber. Each frame is encoded
+    once and the same bytes are queued for every client, so a publish costs
+    O(subscribers) appends no matter how big the document is. Everything runs
+    on the event loop; publish_threadsafe() is the entry point for threads.
+    """
+
+    def __init__(self, buffer_size=32, heartbeat=15.0):
+        self.buffer_size = buffer_size
+        self.heartbeat = heartbeat
+        self.state = {}
+        self.seq = 0
+        self.published_at = None
+        self._snapshot_frame = None
+        self._subscribers = set()
+        self._loop = None
+        self.relay = None   # RelayLink under serve.py: publish through the parent to every worker
+        self.published = 0
+        self.dropped = 0
+
+    def bind(self, loop):
+        self._loop = loop
+
+    # --- PUBLISH ---
+    def publish(self, state):
+        patch = merge_patch(self.state, state)
+        if not patch and self.seq:
+            return self.seq
+        self.state = state
+        return self._fan_out(patch)
+
+    def publish_patch(self, patch):
+        """Publish a change the caller already has as a merge patch (no diff of the whole document)."""
+        if not patch:
+            return self.seq
+        self.state = apply_merge_patch(self.state, patch)
+        return self._fan_out(patch)
+
+    def _fan_out(self, patch):
+        self.seq += 1
+        self.published += 1
+        self.published_at = time.time()
+        self._snapshot_frame = None
+        frame = sse_event({"seq": self.seq, "patch": patch}, event="delta")
+        for sub in self._subscribers:
+            sub.push(frame)
+        return self.seq
+
+    def submit(self, state):
+        """
+        Publish a document sent by a client (POST /api/live). Under serve.py it
+        goes through the parent so every worker's bus gets it; returns None
+        then, as the seq is only known once it comes back.
+        """
+        if self.relay is not None:
+            try:
+                self.relay.send(state)
+                return None
+            except OSError:
+                self.relay = None  # parent gone: this worker's clients still get it
+        return self.publish(state)
+
+    def publish_threadsafe(self, state):
+        if self._loop is None:
+            self.publish(state)  # not serving yet: nobody is subscribed
+        else:
+            self._loop.call_soon_threadsafe(self.publish, state)
+
+    def publish_patch_threadsafe(self, patch):
+        if self._loop is None:
+            self.publish_patch(patch)  # not serving yet: nobody is subscribed
+        else:
+            self._loop.call_soon_threadsafe(self.publish_patch, patch)
+
+    def snapshot_frame(self):
+        # Shared by every client that (re)syncs at this seq
+        if self._snapshot_frame is None:
+            self._snapshot_frame = sse_event({"seq": self.seq, "state": self.state}, event="snapshot")
+        return self._snapshot_frame
+
+    # --- SUBSCRIBE ---
+    async def stream(self):
+        """Async iterator of SSE frames for one client; unsubscribes when closed."""
+        sub = Subscriber(self.buffer_size)
+        self._subscribers.add(sub)
+        try:
+            while True:
+                if sub.resync:
+                    self.dropped += sub.dropped
+                    sub.dropped = 0
+                    sub.resync = False
+                    sub.frames.clear()  # older than the snapshot
+                    yield self.snapshot_frame()
+                while sub.frames and not sub.resync:
+                    yield sub.frames.popleft()
+                if sub.resync:
+                    continue
+                sub.wakeup.clear()
+                try:
+                    await asyncio.wait_for(sub.wakeup.wait(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+        finally:
+            self._subscribers.discard(sub)
+
+    def stats(self):
+        return {
+            "seq": self.seq,
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "dropped_frames": self.dropped + sum(s.dropped for s in self._subscribers),
+            "published_at": self.published_at,
+            "buffer_size": self.buffer_size,
+            "relay": self.relay.stats() if self.relay is not None else None,
+        }
+
+
+# --- MULTI-WORKER RELAY ---
+class RelayLink:
+    """
+    Worker end of serve.py's live relay. Each worker process has its own
+    LiveBus, so a document POSTed to one worker is sent up this socket; the
+    parent passes it (and any simulator updates) down to every worker, the
+    sender included, and each bus publishes what arrives. One JSON document
+    per line.
+    """
+
+    def __init__(self, sock, bus):
+        self.sock = sock
+        self.bus = bus
+        self.sent = 0
+        self.received = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self.bus.relay = self
+        self._thread = threading.Thread(target=self._run, name="live-relay", daemon=True)
+        self._thread.start()
+
+    def send(self, state):
+        line = json.dumps(state, separators=(',', ':')).encode() + b"\n"
+        with self._lock:
+            self.sock.sendall(line)
+        self.sent += 1
+
+    def _run(self):
+        with self.sock.makefile('rb') as lines:
+            for line in lines:
+                try:
+                    state = json.loads(line)
+                except ValueError:
+                    continue
+                self.received += 1
+                self.bus.publish_threadsafe(state)
+        self.bus.relay = None  # parent closed the link
+
+    def stats(self):
+        return {"sent": self.sent, "received": self.received}
+
+
+# --- FEEDS ---
+class SimulatorFeed:
+    """Publishes simulator.generate_live_data() every `interval` seconds from a thread."""
+
+    def __init__(self, bus, interval=3.0):
+        self.bus = bus
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        from simulator import generate_live_data
+        while not self._stop.is_set():
+            self.bus.publish_threadsafe(generate_live_data())
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="live-simulator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+def from_env():
+    """LIVE_BUFFER (frames per client), LIVE_HEARTBEAT (s); LIVE_SIMULATOR=1 feeds the bus in-process."""
+    bus = LiveBus(buffer_size=int(os.getenv("LIVE_BUFFER", "32")),
+                  heartbeat=float(os.getenv("LIVE_HEARTBEAT", "15")))
+    feed = None
+    if os.getenv("LIVE_SIMULATOR", "0") == "1":
+        feed = SimulatorFeed(bus, interval=float(os.getenv("LIVE_SIMULATOR_INTERVAL", "3")))
+    return bus, feed
@@ -0,0 +1,383 @@
+import os
+import re
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from model_cache import ModelCache
+
+DEFAULT_MODEL = 'models/gemini-2.0-flash'
+
+# Transient failures worth retrying (matched by class name so google.api_core stays a lazy import)
+RETRYABLE_ERRORS = {
+    "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError",
+    "TooManyRequests", "GatewayTimeout", "ConnectionError", "TimeoutError", "StubTransientError",
+}
+
+
+def normalize_prompt(prompt):
+    # Indentation/whitespace differences in f-string prompts shouldn't miss the cache
+    return re.sub(r'\s+', ' ', prompt).strip()
+
+
+def is_retryable(exc):
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(exc).__mro__)
+
+
+# --- BACKENDS ---
+class GeminiBackend:
+    """Google Gemini via google.generativeai (imported and configured on first use)."""
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+        self._genai = None
+        self._lock = threading.Lock()
+
+    def _client(self):
+        if self._genai is None:
+            with self._lock:
+                if self._genai is None:
+                    import google.generativeai as genai
+                    if self.api_key:
+                        genai.configure(api_key=self.api_key)
+                    self._genai = genai
+        return self._genai
+
+    def generate(self, model, prompt):
+        response = self._client().GenerativeModel(model).generate_content(prompt)
+        return response.text
+
+    def stream(self, model, prompt):
+        for chunk in self._client().GenerativeModel(model).generate_content(prompt, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+
+class StubTransientError(Exception):
+    pass
+
+
+class StubBackend:
+    """
+    Offline backend for tests and benchmarks. Returns `responder(model, prompt)`
+    (or an echo), optionally after `latency` seconds, and can fail the first
+    `fail_times` calls with a retryable error.
+    """
+
+    def __init__(self, responder=None, latency=0.0, fail_times=0):
+        self.responder = responder
+        self.latency = latency
+        self.fail_times = fail_times
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, model, prompt):
+        with self._lock:
+            self.calls += 1
+            attempt = self.calls
+        if self.latency:
+            time.sleep(self.latency)
+        if attempt <= self.fail_times:
+            raise StubTransientError(f"stub failure {attempt}/{self.fail_times}")
+        if self.responder:
+            return self.responder(model, prompt)
+        return f"[stub {model}] {normalize_prompt(prompt)[:200]}"
+
+    def stream(self, model, prompt, chunk_delay=0.0):
+        # Same text as generate(), delivered word by word
+        words = self.generate(model, prompt).split(' ')
+        for i, word in enumerate(words):
+            if chunk_delay:
+                time.sleep(chunk_delay)
+            yield word if i == 0 else ' ' + word
+
+
+# --- GATEWAY ---
+class LLMGateway:
+    """
+    One shared entry point for every LLM call in the app.
+
+    - generate() is async and never blocks the event loop; generate_blocking()
+      serves sync callers (ai_engine, scripts) through the same machinery.
+    - At most `max_concurrency` async calls hit the backend at once. They queue
+      on an asyncio.Semaphore before any thread is taken, so a backlog of
+      LLM calls doesn't hold the default executor the rest of the app uses.
+      Streams run on their own `max_concurrency` threads; sync callers, who
+      already have a thread, have their own `max_concurrency` slots.
+    - Transient errors are retried with exponential backoff and full jitter.
+    - Concurrent identical requests (same model + normalized prompt) share one
+      backend call, and successful responses are cached for `cache_ttl` seconds.
+    """
+
+    def __init__(self, backend, max_concurrency=4, max_retries=3, backoff_base=0.5, backoff_max=8.0,
+                 cache_size=256, cache_ttl=3600):
+        self.backend = backend
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache = ModelCache(max_entries=cache_size, ttl=cache_ttl)
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._loop_slots = (None, None)
+        self._stream_executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm-stream")
+        self._fills = set()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.backend_calls = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.streams = 0
+        self.streams_cancelled = 0
+        self._ttfb = deque(maxlen=1000)
+
+    @staticmethod
+    def cache_key(model, prompt):
+        return hashlib.sha256(f"{model}\0{normalize_prompt(prompt)}".encode()).hexdigest()
+
+    def _async_slots(self):
+        """The asyncio.Semaphore for the running loop (a new loop, e.g. in tests, gets its own)."""
+        loop = asyncio.get_running_loop()
+        owner, slots = self._loop_slots
+        if owner is not loop:
+            slots = asyncio.Semaphore(self.max_concurrency)
+            self._loop_slots = (loop, slots)
+        return slots
+
+    def _give_up(self, attempt, exc):
+        """True if `exc` is final; otherwise counts a retry."""
+        with self._lock:
+            if attempt >= self.max_retries or not is_retryable(exc):
+                self.failures += 1
+                return True
+            self.retries += 1
+            return False
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _call_with_retry(self, model, prompt):
+        attempt = 0
+        while True:
+            with self._slots:
+                try:
+                    with self._lock:
+                        self.backend_calls += 1
+                    return self.backend.generate(model, prompt)
+                except Exception as e:
+                    if self._give_up(attempt, e):
+                        raise
+            # Back off outside the concurrency slot so others can proceed
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def _call_with_retry_async(self, model, prompt):
+        attempt = 0
+        while True:
+            async with self._async_slots():
+                try:
+                    with self._lock:
+                        self.backend_calls += 1
+                    return await asyncio.to_thread(self.backend.generate, model, prompt)
+                except Exception as e:
+                    if self._give_up(attempt, e):
+                        raise
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def _claim(self, key):
+        """Returns (future, owner). The owner must fill the future via _fill()."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def _settle(self, key, future, text, error, use_cache):
+        if error is not None:
+            future.set_exception(error)
+        else:
+            if use_cache:
+                self.cache.put(key, text)
+            future.set_result(text)
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _fill(self, key, future, model, prompt, use_cache):
+        try:
+            text, error = self._call_with_retry(model, prompt), None
+        except Exception as e:
+            text, error = None, e
+        self._settle(key, future, text, error, use_cache)
+
+    async def _fill_async(self, key, future, model, prompt, use_cache):
+        try:
+            text, error = await self._call_with_retry_async(model, prompt), None
+        except Exception as e:
+            text, error = None, e
+        self._settle(key, future, text, error, use_cache)
+
+    def generate_blocking(self, prompt, model=DEFAULT_MODEL, use_cache=True):
+        key = self.cache_key(model, prompt)
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        future, owner = self._claim(key)
+        if owner:
+            self._fill(key, future, model, prompt, use_cache)
+        return future.result()
+
+    async def generate(self, prompt, model=DEFAULT_MODEL, use_cache=True):
+        key = self.cache_key(model, prompt)
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        future, owner = self._claim(key)
+        if owner:
+            # Its own task: coalesced callers still get the answer if this one disconnects
+            fill = asyncio.create_task(self._fill_async(key, future, model, prompt, use_cache))
+            self._fills.add(fill)
+            fill.add_done_callback(self._fills.discard)
+        return await asyncio.wrap_future(future)
+
+    # --- STREAMING ---
+    def _pump(self, model, prompt, emit, cancelled):
+        """
+        Stream thread: forward backend chunks to the event loop via emit().
+        Retries only while nothing has been sent yet; stops early once the
+        client is gone (cancelled is set).
+        """
+        attempt, sent, parts = 0, False, []
+        while True:
+            try:
+                with self._lock:
+                    self.backend_calls += 1
+                for chunk in self.backend.stream(model, prompt):
+                    if cancelled.is_set():
+                        return None
+                    parts.append(chunk)
+                    sent = True
+                    emit(chunk)
+                return ''.join(parts)
+            except Exception as e:
+                if self._give_up(self.max_retries if sent else attempt, e):
+                    raise
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def stream(self, prompt, model=DEFAULT_MODEL, use_cache=True):
+        """
+        Async iterator of text chunks as the model produces them. A cached
+        response is replayed as one chunk. Closing the iterator (client
+        disconnect) stops the backend stream at the next chunk.
+        """
+        started = time.perf_counter()
+        key = self.cache_key(model, prompt)
+        cached = self.cache.get(key) if use_cache else None
+        if cached is not None:
+            self._record_ttfb(started)
+            yield cached
+            return
+
+        loop = asyncio.get_running_loop()
+        slots = self._async_slots()
+        queue = asyncio.Queue()
+        cancelled = threading.Event()
+        done = object()
+        with self._lock:
+            self.streams += 1
+
+        def emit(chunk):
+            loop.call_soon_threadsafe(queue.put_nowait, chunk)
+
+        def run():
+            try:
+                text = self._pump(model, prompt, emit, cancelled)
+                if text is not None and use_cache:
+                    self.cache.put(key, text)
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+
+        await slots.acquire()
+        worker = loop.run_in_executor(self._stream_executor, run)
+        first = True
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if first:
+                    self._record_ttfb(started)
+                    first = False
+                yield item
+        finally:
+            slots.release()
+            if not worker.done():
+                cancelled.set()
+                with self._lock:
+                    self.streams_cancelled += 1
+
+    def _record_ttfb(self, started):
+        with self._lock:
+            self._ttfb.append(time.perf_counter() - started)
+
+    def stats(self):
+        with self._lock:
+            inflight = len(self._inflight)
+            ttfb = sorted(self._ttfb)
+
+        def pct(p):
+            return round(ttfb[min(len(ttfb) - 1, int(p * len(ttfb)))] * 1000, 2) if ttfb else None
+        return {
+            "backend": type(self.backend).__name__,
+            "backend_calls": self.backend_calls,
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "in_flight": inflight,
+            "streams": self.streams,
+            "streams_cancelled": self.streams_cancelled,
+            "ttfb_ms": {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "samples": len(ttfb)},
+            "cache": self.cache.stats(),
+        }
+
+
+def from_env():
+    """LLM_BACKEND=stub runs fully offline; anything else talks to Gemini."""
+    if os.getenv("LLM_BACKEND", "gemini").lower() == "stub":
+        backend = StubBackend(latency=float(os.getenv("LLM_STUB_LATENCY", "0")))
+    else:
+        backend = GeminiBackend(api_key=os.getenv("GEMINI_API_KEY"))
+    return LLMGateway(
+        backend,
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+        cache_size=int(os.getenv("LLM_CACHE_SIZE", "256")),
+        cache_ttl=float(os.getenv("LLM_CACHE_TTL", "3600")),
+    )
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """Process-wide gateway shared by main.py and ai_engine.py."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = from_env()
+    return _gateway
@@ -1,30 +1,183 @@
+import io
 import os
-import json
-import random
-import numpy as np
-import google.generativeai as genai
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+import sys
+import asyncio
+import time
+import signal
+from contextlib import asynccontextmanager
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
+from typing import List, Union
 from dotenv import load_dotenv
 
 # --- MACHINE LEARNING IMPORTS ---
-from sklearn.ensemble import GradientBoostingRegressor
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
+# sklearn is used inside these modules; the fits run on the ML executor
+import clustering
+
+import forecasting
+import storage
+from data_store import DataStore
+from model_cache import ModelCache, history_fingerprint, params_key
+from online_forecast import OnlineForecaster, ONLINE_ALGORITHMS
+from executor import ExecutorSaturated, JobTimeout
+import executor
+import live
+import assets
+import triggers
+import ingest
+import forecast_cache
+import backtest
+import similarity
+import metrics
+from metrics import span
+from llm_gateway import get_gateway
+from retrieval import CatalogRetriever
+from web_utils import (parse_fields, project, encode_cursor, decode_cursor, make_etag,
+                       etag_matches, cached_json_response, ndjson_response, sse_response, sse_frames_response)
 
 # --- CONFIGURATION ---
 os.environ['GRPC_DNS_RESOLVER'] = 'native'
 load_dotenv()
 api_key = os.getenv("GEMINI_API_KEY")
 
-if not api_key:
+if not api_key and os.getenv("LLM_BACKEND", "gemini").lower() != "stub":
     print("⚠️ WARNING: GEMINI_API_KEY not found.")
-else:
-    genai.configure(api_key=api_key)
 
-app = FastAPI()
+DATA_BACKEND = os.getenv("DATA_BACKEND", "json")   # json | sqlite
+DATABASE_PATH = os.getenv("DATABASE_PATH") or storage.DEFAULT_PATHS.get(DATA_BACKEND)
+DATA_RELOAD_INTERVAL = float(os.getenv("DATA_RELOAD_INTERVAL", "1.0"))
+
+# Loaded once per process; the watcher swaps in a new snapshot when the data changes.
+# COLUMNS_DIR: write the columnar arrays there once per data version and memory-map them,
+# so every worker process shares one copy
+store = DataStore(storage.open_backend(DATA_BACKEND, DATABASE_PATH), poll_interval=DATA_RELOAD_INTERVAL,
+                  columns_dir=os.getenv("COLUMNS_DIR") or None)
+
+# Per-release running sums for O(1) linear/polynomial/moving-average/EWMA forecasts,
+# persisted next to the catalog
+online = OnlineForecaster(store.backend)
+
+# All CPU-bound ML work goes through this pool (ML_EXECUTOR, ML_WORKERS, ML_MAX_PENDING, ML_JOB_TIMEOUT)
+ml_executor = executor.from_env()
+
+# Every algorithm precomputed per release on each new snapshot (FORECAST_PRECOMPUTE)
+materializer = forecast_cache.from_env(store, online, ml_executor)
+
+# Rolling-origin backtest of every algorithm per release; algo=auto serves the winner (BACKTEST, BACKTEST_METRIC)
+backtester = backtest.from_env(store, ml_executor)
+
+# Nearest releases by bpm / sentiment / revenue / sales shape, kept in step with every snapshot
+# (SIMILAR_REBUILD_FRACTION); SIMILAR_PROMPT_K comparables go into the marketing and chat prompts
+similar_index = similarity.from_env()
+SIMILAR_K_MAX = 100
+SIMILAR_PROMPT_K = int(os.getenv("SIMILAR_PROMPT_K", "3"))
+
+# Live dashboard feed: pub/sub bus pushed to browsers as SSE deltas (LIVE_SIMULATOR=1 feeds it in-process)
+live_bus, live_feed = live.from_env()
+
+# Alert rules evaluated over the whole catalog on every snapshot; changes are pushed on their own bus
+alerts_bus = live.LiveBus(live_bus.buffer_size, live_bus.heartbeat)
+trigger_engine = triggers.from_env(notify=alerts_bus.publish_patch_threadsafe)
+
+# Batched sales / market-signal writes (POST /api/ingest, `python ingest.py`); each commit publishes a snapshot
+def publish_snapshot():
+    store.reload()
+    return store.current().version
+
+def forget_forecasts(release_ids):
+    # Past days were corrected: running sums and precomputed rows built on them are wrong now
+    online.forget(release_ids)
+    materializer.invalidate(release_ids)
+
+ingestor = ingest.Ingestor(store.backend, publish=publish_snapshot, invalidate=forget_forecasts)
+INGEST_MAX_BYTES = int(float(os.getenv("INGEST_MAX_MB", "64")) * 1024 * 1024)
+
+# Release artwork: fixed seed per (release, version), images cached on disk (ASSET_CACHE_DIR)
+asset_service = assets.from_env()
+
+# Shared async Gemini client: concurrency limit, retries, coalescing, response cache
+llm = get_gateway()
+
+# Chat prompts carry only the most relevant records, not the whole database
+retriever = CatalogRetriever(use_tfidf=os.getenv("CHAT_TFIDF", "0") == "1")
+CHAT_TOP_K = int(os.getenv("CHAT_TOP_K", "20"))
+CHAT_TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", "4000"))
+
+# WARM_START=1: fit the customer segments in the background right after startup (serve.py sets it)
+WARM_START = os.getenv("WARM_START", "0") == "1"
+
+# BACKGROUND_JOBS=follow: don't run the materializer's gradient boosting or the backtest here, use
+# what another process shares through the backend (serve.py runs them in one worker; lead() promotes)
+def background_follows():
+    return os.getenv("BACKGROUND_JOBS", "run") == "follow"
+
+def lead():
+    materializer.promote()
+    backtester.promote()
+
+async def warm_caches():
+    try:
+        await segment_cache.get(store.current())
+    except Exception as e:
+        print(f"⚠️ warm start: segments failed: {e}")
+
+def prime():
+    """
+    Load the data and warm the cheap caches synchronously. serve.py calls this
+    once in the parent before forking workers, so they all start warm and
+    share the pages; in a single process the lifespan does the same lazily.
+    """
+    snap = store.current()
+    if not online.loaded:
+        online.load()
+    trigger_engine.evaluate(snap)
+    similar_index.sync(snap)
+    materializer.prime(snap)
+    if backtester.algos and not backtester.loaded:
+        backtester.load()
+    online.flush()
+    return snap
+
+@asynccontextmanager
+async def lifespan(app):
+    if not online.loaded:
+        await run_in_threadpool(online.load)
+    store.start_watching()
+    try:
+        # `kill -HUP <pid>` forces a reload without a restart
+        signal.signal(signal.SIGHUP, lambda *_: store.request_reload())
+    except (AttributeError, ValueError):
+        pass  # no SIGHUP on Windows / not on the main thread
+    materializer.start(follow=background_follows())
+    backtester.start(follow=background_follows())
+    live_bus.bind(asyncio.get_running_loop())
+    alerts_bus.bind(asyncio.get_running_loop())
+    store.subscribe(trigger_engine.evaluate)
+    await run_in_threadpool(trigger_engine.evaluate, store.current())
+    store.subscribe(similar_index.sync)
+    await run_in_threadpool(similar_index.sync, store.current())
+    if live_feed:
+        live_feed.start()
+    warm_task = asyncio.create_task(warm_caches()) if WARM_START else None
+    app.state.serving = True
+    yield
+    app.state.serving = False  # readiness fails while draining
+    if warm_task:
+        warm_task.cancel()
+    if live_feed:
+        live_feed.stop()
+    await materializer.stop()
+    await backtester.stop()
+    store.stop_watching()
+    online.flush()
+    backtester.flush()
+    ml_executor.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -33,6 +186,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Compresses anything we didn't already encode ourselves (NDJSON streams etc.)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+# Outermost: request/stage histograms for /metrics, slow-request log, X-Profile sampling
+app.add_middleware(metrics.MetricsMiddleware, slow_exclude=["/api/live/stream", "/api/triggers/stream"], **metrics.options_from_env())
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request, exc):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(JobTimeout)
+async def job_timeout_handler(request, exc):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
 
 class ChatRequest(BaseModel):
     message: str
@@ -40,14 +205,28 @@ class ChatRequest(BaseModel):
 
 # --- DATA HELPERS ---
 def load_data():
+    # Served from the in-memory snapshot; treat the result as read-only.
     try:
-        with open('database.json', 'r') as f:
-            return json.load(f)
+        with span("load_data"):
+            return store.current().data
     except Exception as e:
         return {"error": str(e)}
 
 def get_release_by_id(data, release_id):
-    return next((r for r in data.get('releases', []) if r['id'] == release_id), None)
+    with span("lookup"):
+        snap = store.current()
+        if data is snap.data:
+            return snap.indexes.release(release_id)
+        # Not the live snapshot (e.g. a dict built by a script): fall back to a scan
+        return next((r for r in data.get('releases', []) if r['id'] == release_id), None)
+
+def filter_collection(collection, request, **criteria):
+    # FastAPI drops undeclared query parameters; pass them on so a typo is a 400, not "everything"
+    criteria = {**{k: v for k, v in request.query_params.items() if k not in criteria}, **criteria}
+    try:
+        return store.current().indexes.filter(collection, **criteria)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Unknown filter: {e.args[0]}")
 
 # --- API ENDPOINTS ---
 
@@ -55,9 +234,181 @@ def get_release_by_id(data, release_id):
 async def read_root():
     return FileResponse('index.html')
 
+@app.get("/api/system/health")
+async def get_health():
+    """Liveness: the process answers. Touches no data."""
+    return {"status": "ok", "pid": os.getpid()}
+
+@app.get("/api/system/ready")
+async def get_readiness(warm: bool = False):
+    """
+    Readiness: 200 once this worker serves from a loaded snapshot, 503 before
+    that and while shutting down. With warm=1 every cache must also be built
+    for the current data version (forecast table, segments, alert rules).
+    """
+    status = store.status()
+    version = status["version"]
+    forecasts = materializer.stats()
+    caches = {
+        "forecasts": forecasts["version"] == version and not forecasts["refreshing"] if materializer.algos else None,
+        "segments": (segment_cache.state is not None and segment_cache.state.version == version) if WARM_START else None,
+        "triggers": trigger_engine.version == version,
+        "online_state": online.loaded,
+    }
+    ready = bool(getattr(app.state, "serving", False)) and version is not None
+    if warm:
+        ready = ready and all(v is not False for v in caches.values())
+    body = {
+        "ready": ready,
+        "pid": os.getpid(),
+        "version": version,
+        "columns": status["columns"],
+        "warm": caches,
+        "forecast_rows": forecasts["ready"],
+        "modules_loaded": {m: m in sys.modules for m in ("sklearn", "google.generativeai")},
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/api/system/data")
+async def get_data_status():
+    return store.status()
+
+@app.get("/api/system/executor")
+async def get_executor_stats():
+    return ml_executor.stats()
+
+@app.get("/api/system/forecasts")
+async def get_forecast_table_stats():
+    return materializer.stats()
+
+@app.get("/api/system/backtest")
+async def get_backtest_stats():
+    return backtester.stats()
+
+@app.get("/api/system/similar")
+async def get_similarity_stats():
+    return similar_index.stats()
+
+@app.get("/api/system/live")
+async def get_live_stats():
+    return live_bus.stats()
+
+@app.get("/api/system/triggers")
+async def get_trigger_stats():
+    return {**trigger_engine.stats(), "stream": alerts_bus.stats()}
+
+@app.get("/api/system/ingest")
+async def get_ingest_stats():
+    return ingestor.stats()
+
+@app.get("/api/system/assets")
+async def get_asset_stats():
+    return asset_service.stats()
+
+@app.get("/api/system/llm")
+async def get_llm_stats():
+    return llm.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text format: request and per-stage latency histograms."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/system/model-cache")
+async def get_model_cache_stats():
+    return {**gbr_cache.stats(), "online": online.stats()}
+
+@app.post("/api/system/reload")
+async def reload_data():
+    try:
+        changed = await run_in_threadpool(store.reload)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed: {e}")
+    return {"reloaded": changed, **store.status()}
+
+DB_COLLECTIONS = ("releases", "customers")
+DB_PAGE_DEFAULT = 100
+DB_PAGE_MAX = 1000
+
+def _page_start(snap, collection, cursor):
+    if not cursor:
+        return 0
+    offset, last_id = decode_cursor(cursor)
+    rows = snap.data.get(collection, [])
+    if last_id is not None and not (0 < offset <= len(rows) and rows[offset - 1].get('id') == last_id):
+        # Positions moved since the cursor was issued: resume after the last id we served
+        pos = snap.indexes.position(collection, last_id)
+        if pos is not None:
+            return pos + 1
+    return max(0, offset)
+
 @app.get("/api/database")
-async def get_full_database():
-    return load_data()
+async def get_full_database(request: Request, collection: str = None, cursor: str = None,
+                            limit: int = DB_PAGE_DEFAULT, fields: str = None, format: str = "json"):
+    """
+    With no parameters: the whole document (as before), ETag-cached and compressed.
+    ?collection=releases|customers  -> cursor-paginated {items, next_cursor, total}
+    ?fields=id,artist,stats.revenue -> project each row
+    ?format=ndjson                  -> stream rows one per line (from cursor to the end)
+    """
+    try:
+        snap = store.current()
+    except Exception as e:
+        return {"error": str(e)}
+
+    if collection is not None and collection not in DB_COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"collection must be one of {', '.join(DB_COLLECTIONS)}")
+    paths = parse_fields(fields)
+    limit = max(1, min(limit, DB_PAGE_MAX))
+    etag = make_etag(snap.fingerprint, snap.version, collection, cursor, limit, fields, format)
+
+    if format == "ndjson":
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        names = [collection] if collection else list(DB_COLLECTIONS)
+
+        def rows():
+            for name in names:
+                records = snap.data.get(name, [])
+                start = _page_start(snap, name, cursor) if collection else 0
+                for i in range(start, len(records)):
+                    row = project(records[i], paths)
+                    yield row if collection else {"collection": name, **row}
+        return ndjson_response(rows(), etag=etag)
+
+    if collection is None:
+        if paths:
+            build = lambda: {name: [project(r, paths) for r in snap.data.get(name, [])] for name in DB_COLLECTIONS}
+        else:
+            build = lambda: snap.data
+        return cached_json_response(request, etag, build)
+
+    def build_page():
+        records = snap.data.get(collection, [])
+        start = _page_start(snap, collection, cursor)
+        page = records[start:start + limit]
+        end = start + len(page)
+        next_cursor = encode_cursor(end, page[-1].get('id')) if page and end < len(records) else None
+        return {
+            "items": [project(r, paths) for r in page],
+            "next_cursor": next_cursor,
+            "total": len(records),
+        }
+    return cached_json_response(request, etag, build_page)
+
+@app.get("/api/releases")
+async def list_releases(request: Request, artist: str = None, genre: str = None, tiktok_trend: str = None):
+    return filter_collection("releases", request, artist=artist, genre=genre, tiktok_trend=tiktok_trend)
+
+@app.get("/api/customers")
+async def list_customers(request: Request, region: str = None):
+    return filter_collection("customers", request, region=region)
+
+@app.get("/api/facets/{collection}")
+async def get_facets(collection: str):
+    if collection not in ("releases", "customers"):
+        raise HTTPException(status_code=404, detail="Unknown collection")
+    return store.current().indexes.facets(collection)
 
 @app.get("/api/release/{release_id}")
 async def get_specific_release(release_id: str):
@@ -68,111 +419,324 @@ async def get_specific_release(release_id: str):
     return release
 
 # --- 1. FORECASTING (Added Gradient Boosting) ---
+class BatchForecastRequest(BaseModel):
+    ids: Union[List[str], str] = "all"
+    algo: str = "linear"
+    horizon: int = forecasting.DEFAULT_HORIZON
+
+MAX_FORECAST_HORIZON = 365
+
+# Trained GBR models, reused until the release's history changes
+gbr_cache = ModelCache(max_entries=int(os.getenv("MODEL_CACHE_SIZE", "512")),
+                       ttl=float(os.getenv("MODEL_CACHE_TTL", "3600")))
+
+async def get_gbr_model(release_id, history):
+    key = (release_id, history_fingerprint(history), params_key(forecasting.GBR_PARAMS))
+    model = gbr_cache.get(key)
+    if model is None:
+        # Fitting is CPU-bound: keep it off the event loop
+        with span("fit"):
+            model = await ml_executor.run(forecasting.fit_gradient_boosting, history)
+        gbr_cache.put(key, model)
+    return model
+
+async def compute_forecast(release_id, history, algo):
+    if algo == "gradient_boosting":
+        model = await get_gbr_model(release_id, history)
+        with span("predict"):
+            return forecasting.predict_gradient_boosting(model, len(history))
+    # O(1) from the release's running state (only days added since the last call are folded in)
+    with span("predict"):
+        return online.forecast(release_id, history, algo)
+
+# Prediction intervals: resamples per request, capped so samples * history days <= the budget
+INTERVAL_SAMPLES_MAX = int(os.getenv("FORECAST_INTERVAL_SAMPLES", "1000"))
+INTERVAL_BUDGET = int(os.getenv("FORECAST_INTERVAL_BUDGET", "2000000"))
+
 @app.get("/api/forecast/{release_id}")
-async def get_forecast(release_id: str, algo: str = "linear"):
+async def get_forecast(release_id: str, algo: str = "linear", fresh: bool = False, detail: bool = False,
+                       intervals: bool = False, samples: int = INTERVAL_SAMPLES_MAX):
+    """
+    Served from the precomputed forecast table. Right after a data change the
+    previous value may be returned while the table refreshes (stale=true);
+    ?fresh=true always computes against the current snapshot instead.
+    ?detail=true wraps the list as {forecast, algo, computed_at, stale, source};
+    the same information is always sent as X-Forecast-* headers.
+    ?intervals=true adds p10/p50/p90 bands (implies detail); `samples` is
+    capped by FORECAST_INTERVAL_SAMPLES and FORECAST_INTERVAL_BUDGET.
+    algo=auto serves the release's best algorithm in the stored backtest
+    (linear until it has been scored); X-Forecast-Algo says which one ran.
+    """
     data = load_data()
     release = get_release_by_id(data, release_id)
     if not release: return []
-    
-    history = release['stats']['history']
-    days_to_predict = 7
-    predictions = []
-
-    X = np.array(range(len(history))).reshape(-1, 1)
-    y = np.array(history)
-
-    # A. LINEAR REGRESSION
-    if algo == "linear":
-        z = np.polyfit(X.flatten(), y, 1)
-        p = np.poly1d(z)
-        for i in range(days_to_predict):
-            predictions.append(max(0, int(p(len(history) + i))))
-
-    # B. POLYNOMIAL REGRESSION
-    elif algo == "polynomial":
-        z = np.polyfit(X.flatten(), y, 2)
-        p = np.poly1d(z)
-        for i in range(days_to_predict):
-            predictions.append(max(0, int(p(len(history) + i))))
-
-    # C. GRADIENT BOOSTING (NEW!)
-    elif algo == "gradient_boosting":
-        # GBR is powerful but needs reshaping. 
-        model = GradientBoostingRegressor(n_estimators=100, learning_rate=0.1, max_depth=1, random_state=42)
-        model.fit(X, y)
-        
-        for i in range(days_to_predict):
-            next_day = np.array([[len(history) + i]])
-            pred = model.predict(next_day)[0]
-            predictions.append(max(0, int(pred)))
-
-    # D. MOVING AVERAGE
-    elif algo == "moving_average":
-        window = 3
-        avg_val = sum(history[-window:]) / window
-        for i in range(days_to_predict):
-            val = avg_val * (1 + (0.01 * i))
-            predictions.append(max(0, int(val)))
-
-    # E. EXPONENTIAL
-    elif algo == "exponential":
-        alpha = 0.8
-        last_val = history[0]
-        for val in history[1:]:
-            last_val = alpha * val + (1 - alpha) * last_val
-        for i in range(days_to_predict):
-            predictions.append(max(0, int(last_val)))
+    auto = algo == "auto"
+    algo = backtester.choose(release_id) if auto else forecasting.resolve_algo(algo)
+    hit = None if fresh else materializer.lookup(release_id, algo, store.current().version)
+    if hit:
+        forecast, computed_at, stale = hit
+        source = "materialized"
+    else:
+        forecast = await compute_forecast(release_id, release['stats']['history'], algo)
+        computed_at, stale, source = time.time(), False, "computed"
+    headers = {"X-Forecast-Computed-At": f"{computed_at:.3f}", "X-Forecast-Stale": str(stale).lower(),
+               "X-Forecast-Source": source, "X-Forecast-Algo": algo}
+    if detail or intervals:
+        body = {"forecast": forecast, "algo": algo, "computed_at": computed_at, "stale": stale, "source": source}
+        if auto:
+            body["backtest"] = backtester.report(release_id)
+        if intervals:
+            history = release['stats']['history']
+            n_samples = forecasting.interval_samples(len(history), samples, INTERVAL_SAMPLES_MAX, INTERVAL_BUDGET)
+            with span("intervals"):
+                body.update(await ml_executor.run(forecasting.forecast_intervals, history, algo,
+                                                  forecasting.DEFAULT_HORIZON, n_samples))
+        return JSONResponse(body, headers=headers)
+    return JSONResponse(forecast, headers=headers)
 
+@app.post("/api/forecast/batch")
+async def get_batch_forecast(request: BatchForecastRequest, background_tasks: BackgroundTasks):
+    """
+    Forecast many releases in one call. Body: {"ids": [...] | "all", "algo", "horizon"}.
+    Served from per-release running state (linear/polynomial solved as one
+    batched matrix problem); gradient_boosting trains on the ML executor.
+    With algo=auto each release uses its backtest winner (`selected`).
+    """
+    if not 1 <= request.horizon <= MAX_FORECAST_HORIZON:
+        raise HTTPException(status_code=400, detail=f"horizon must be between 1 and {MAX_FORECAST_HORIZON}")
+    snap = store.current()
+    if request.ids == "all":
+        releases, missing = snap.data.get('releases', []), []
+    elif isinstance(request.ids, str):
+        raise HTTPException(status_code=400, detail='ids must be a list of release ids or "all"')
     else:
-        return await get_forecast(release_id, "linear")
-        
-    return predictions
+        found = [(rid, snap.indexes.release(rid)) for rid in request.ids]
+        releases = [r for _, r in found if r]
+        missing = [rid for rid, r in found if not r]
+
+    if request.algo != "auto":
+        algo = forecasting.resolve_algo(request.algo)
+        predictions = await batch_predict(snap, releases, algo, request.horizon, background_tasks)
+        return {
+            "algo": algo,
+            "horizon": request.horizon,
+            "forecasts": {r['id']: p for r, p in zip(releases, predictions)},
+            "missing": missing,
+        }
+
+    # One batch per selected algorithm
+    selected = {r['id']: backtester.choose(r['id']) for r in releases}
+    groups = {}
+    for r in releases:
+        groups.setdefault(selected[r['id']], []).append(r)
+    forecasts = {}
+    for algo, group in groups.items():
+        predictions = await batch_predict(snap, group, algo, request.horizon, background_tasks)
+        forecasts.update((r['id'], p) for r, p in zip(group, predictions))
+    return {
+        "algo": "auto",
+        "horizon": request.horizon,
+        "forecasts": {r['id']: forecasts[r['id']] for r in releases},
+        "selected": selected,
+        "missing": missing,
+    }
+
+async def batch_predict(snap, releases, algo, horizon, background_tasks):
+    if algo in ONLINE_ALGORITHMS:
+        with span("predict"):
+            predictions = await run_in_threadpool(online.forecast_many, [(r['id'], r['stats']['history']) for r in releases],
+                                                  algo, horizon)
+        background_tasks.add_task(online.flush)
+        return predictions
+    # Handed to the executor as two flat arrays instead of a list of lists
+    histories = snap.columns.histories.take([snap.indexes.position("releases", r['id']) for r in releases])
+    with span("fit"):
+        return await ml_executor.run(forecasting.batch_forecast, histories, algo, horizon)
+
+@app.get("/api/backtest")
+async def get_backtest_summary():
+    """Wins and mean MAPE / RMSE per algorithm across the catalog."""
+    return {**backtester.summary(), "version": backtester.version, "running": backtester.running}
+
+@app.get("/api/backtest/{release_id}")
+async def get_backtest(release_id: str):
+    """Rolling-origin scores of every algorithm for one release, and the one algo=auto serves."""
+    if not store.current().indexes.release(release_id):
+        raise HTTPException(status_code=404, detail="Release not found")
+    scores = backtester.report(release_id)
+    body = {"release_id": release_id, "selected": backtester.choose(release_id), "scores": scores}
+    if not scores or not scores["best"]:
+        body["note"] = (f"Not scored (yet): needs more than {backtester.min_train} days of history; "
+                        f"algo=auto serves {backtest.DEFAULT_ALGO} until then")
+    return body
+
+class SalesUpdate(BaseModel):
+    values: List[Union[int, float]]
+
+# Serializes writes (appends, ingestion) so two updates to one release can't both start from the same history
+sales_lock = asyncio.Lock()
+
+@app.post("/api/release/{release_id}/sales")
+async def append_sales(release_id: str, update: SalesUpdate, background_tasks: BackgroundTasks):
+    """
+    Append new daily sales points to a release. The catalog is updated through
+    the storage backend; the forecast state folds in just the new points.
+    """
+    async with sales_lock:
+        release = await run_in_threadpool(store.backend.get_release, release_id)
+        if not release:
+            raise HTTPException(status_code=404, detail="Release not found")
+        history = release['stats']['history']
+        stats = ingest.shift_history_end(release['stats'], len(update.values))
+        updated = {**release, "stats": {**stats, "history": history + list(update.values)}}
+        await run_in_threadpool(store.backend.upsert_releases, [updated])
+        days = online.append(release_id, update.values, history)
+    store.request_reload()
+    background_tasks.add_task(online.flush)
+    return {"id": release_id, "days": days}
+
+@app.post("/api/ingest")
+async def ingest_batch(request: Request, format: str = None, strict: bool = True):
+    """
+    Bulk daily sales and market signals. Body: NDJSON (one record per line) or
+    CSV with a header (Content-Type text/csv or ?format=csv). Fields:
+    release_id, date (YYYY-MM-DD) + units, competitor_drop, tiktok_trend.
+    All touched releases are committed at once and a new snapshot is
+    published before the response. With strict=true (default) any invalid
+    record rejects the whole batch (422, nothing written); strict=false
+    commits the valid records and lists the rest.
+    """
+    try:
+        fmt = ingest.detect_format(format, request.headers.get("content-type"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > INGEST_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Batch larger than {INGEST_MAX_BYTES} bytes; split it (INGEST_MAX_MB)")
+    try:
+        lines = io.StringIO(body.decode("utf-8"), newline="")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Body must be UTF-8")
+    async with sales_lock:
+        with span("ingest"):
+            report = await run_in_threadpool(ingestor.ingest, lines, fmt, strict)
+    return JSONResponse(report, status_code=422 if strict and report["rejected"] else 200)
 
 # --- 2. CLUSTERING (K-MEANS) ---
+# Assignments are computed once per data snapshot and updated incrementally
+segment_cache = clustering.SegmentCache(ml_executor)
+CLUSTER_POINTS_DEFAULT = 2000
+
 @app.get("/api/clusters")
-async def get_customer_segments():
+async def get_customer_segments(max_points: int = CLUSTER_POINTS_DEFAULT, mode: str = "sample", bins: int = 40):
     """
     Uses K-Means to group customers into 3 segments based on:
     1. Average Order Value (Money)
     2. BPM Preference (Taste)
+    Returns at most `max_points` points for the scatter chart (a per-cluster
+    sample), or with mode=bins one point per density cell with a `count`.
+    Full assignments live at /api/clusters/assignments.
     """
-    data = load_data()
-    customers = data.get('customers', [])
+    try:
+        snap = store.current()
+    except Exception:
+        return []
+    customers = snap.data.get('customers', [])
     if not customers: return []
 
-    # Prepare Data for ML (Money, BPM)
-    X = np.array([[c['avg_order_val'], c['bpm']] for c in customers])
-    
-    # Scale Data (Important for K-Means)
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-
-    # Run K-Means (3 Clusters: e.g., Low, Mid, High value)
-    kmeans = KMeans(n_clusters=min(3, len(customers)), random_state=42, n_init=10)
-    kmeans.fit(X_scaled)
-    labels = kmeans.labels_
-
-    # Format output for Chart.js
-    segments = []
-    for i, customer in enumerate(customers):
-        segments.append({
-            "name": customer['name'],
-            "x": customer['bpm'],      # X-Axis: Taste
-            "y": customer['avg_order_val'], # Y-Axis: Money
-            "cluster": int(labels[i])  # Color group
-        })
-        
-    return segments
+    with span("fit"):
+        state = await segment_cache.get(snap)
+
+    if mode == "bins":
+        return clustering.density_bins(state, max(1, min(bins, 200)))
+
+    # Format output for Chart.js (x = taste, y = money, colour = cluster)
+    columns = snap.columns
+    return [columns.customer(i).point(int(state.labels[i]))
+            for i in clustering.sample_points(state, max(1, max_points), seed=snap.version)]
+
+@app.get("/api/clusters/assignments")
+async def get_cluster_assignments(cursor: str = None, limit: int = DB_PAGE_DEFAULT):
+    snap = store.current()
+    customers = snap.data.get('customers', [])
+    state = await segment_cache.get(snap)
+    start = _page_start(snap, "customers", cursor)
+    end = min(len(customers), start + max(1, min(limit, DB_PAGE_MAX)))
+    items = [snap.columns.customer(i).assignment(int(state.labels[i])) for i in range(start, end)]
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(end, items[-1]["id"]) if items and end < len(customers) else None,
+        "total": len(customers),
+        "version": state.version,
+        "incremental": not state.refit,
+    }
+
+# --- MARKET RADAR ---
+class SimilarBatchRequest(BaseModel):
+    ids: List[str]
+    k: int = 10
+    same_genre: bool = False
+
+async def current_similar():
+    # Same race as current_alerts: a request can arrive before the watcher's sync
+    snap = store.current()
+    state = similar_index.state
+    if state is None or state.version != snap.version:
+        await run_in_threadpool(similar_index.sync, snap)
+    return snap
+
+def similar_items(snap, neighbours):
+    items = []
+    for release_id, distance in neighbours:
+        r = snap.indexes.release(release_id) or {}
+        items.append({"id": release_id, "artist": r.get('artist'), "track_name": r.get('track_name'),
+                      "genre": r.get('genre'), "distance": round(distance, 4)})
+    return items
+
+async def comparables_for(release_id, k=SIMILAR_PROMPT_K):
+    """Release records of the k nearest releases, for the marketing / chat prompts."""
+    if k <= 0:
+        return []
+    snap = await current_similar()
+    neighbours = similar_index.neighbours(release_id, k) or []
+    return [r for r in (snap.indexes.release(rid) for rid, _ in neighbours) if r]
+
+@app.get("/api/similar/{release_id}")
+async def get_similar_releases(release_id: str, k: int = 10, same_genre: bool = False):
+    """The k releases nearest to this one by bpm, sentiment, revenue and recent sales shape."""
+    snap = await current_similar()
+    with span("knn"):
+        neighbours = similar_index.neighbours(release_id, max(1, min(k, SIMILAR_K_MAX)), same_genre)
+    if neighbours is None:
+        raise HTTPException(status_code=404, detail="Release not found")
+    return {"release_id": release_id, "version": snap.version, "similar": similar_items(snap, neighbours)}
+
+@app.post("/api/similar/batch")
+async def get_similar_batch(request: SimilarBatchRequest):
+    """Neighbours for many releases in one call; unknown ids are listed in `missing`."""
+    snap = await current_similar()
+    with span("knn"):
+        found = similar_index.neighbours_many(request.ids, max(1, min(request.k, SIMILAR_K_MAX)), request.same_genre)
+    return {
+        "version": snap.version,
+        "similar": {rid: similar_items(snap, n) for rid, n in found.items() if n is not None},
+        "missing": [rid for rid, n in found.items() if n is None],
+    }
 
 # --- 3. ADVANCED CMO STRATEGY ---
-@app.get("/api/marketing/{release_id}")
-async def get_marketing_strategy(release_id: str):
-    data = load_data()
-    release = get_release_by_id(data, release_id)
-    if not release: return {"strategy": "Release not found"}
-    
+def build_marketing_prompt(release, comparables=()):
     # We ask the AI to act as a Chief Marketing Officer and return stylized HTML
-    prompt = f"""
+    comparable_lines = "\n".join(
+        f"    - {r['artist']} - {r['track_name']} ({r['genre']}, {r.get('bpm')} BPM, "
+        f"sentiment {r.get('stats', {}).get('sentiment')}/10, revenue ${r.get('stats', {}).get('revenue')})"
+        for r in comparables)
+    comparable_section = f"""
+    COMPARABLE RELEASES (closest in our catalog by sound, sentiment and sales):
+{comparable_lines}
+    """ if comparables else ""
+    return f"""
     Act as a visionary Chief Marketing Officer for a top record label.
     Create a high-stakes launch strategy for:
     
@@ -181,7 +745,7 @@ async def get_marketing_strategy(release_id: str):
     GENRE: {release['genre']}
     BUDGET: ${release['stats']['budget']}
     SENTIMENT: {release['stats']['sentiment']}/10
-    
+    {comparable_section}
     OUTPUT FORMAT:
     Return ONLY raw HTML code (no markdown backticks, no ```html wrapper). 
     Use Tailwind CSS classes for styling. Make it colorful and modern.
@@ -196,80 +760,168 @@ async def get_marketing_strategy(release_id: str):
     
     Do not use markdown. Just raw HTML string.
     """
+
+MARKETING_ERROR_HTML = "<div class='text-red-500'>AI Connection Error. Check API Key.</div>"
+
+@app.get("/api/marketing/{release_id}")
+async def get_marketing_strategy(release_id: str):
+    data = load_data()
+    release = get_release_by_id(data, release_id)
+    if not release: return {"strategy": "Release not found"}
+
+    prompt = build_marketing_prompt(release, await comparables_for(release_id))
     try:
-        model = genai.GenerativeModel('models/gemini-2.0-flash')
-        response = model.generate_content(prompt)
+        with span("llm"):
+            text = await llm.generate(prompt)
         
         # Clean up if AI adds markdown wrapper by mistake
-        clean_html = response.text.replace("```html", "").replace("```", "")
+        clean_html = text.replace("```html", "").replace("```", "")
         return {"strategy": clean_html}
     except:
-        return {"strategy": "<div class='text-red-500'>AI Connection Error. Check API Key.</div>"}
+        return {"strategy": MARKETING_ERROR_HTML}
+
+@app.get("/api/marketing/{release_id}/stream")
+async def stream_marketing_strategy(release_id: str):
+    """
+    Server-sent events version of /api/marketing: `data: {"delta": ...}` per
+    chunk, then `event: done`. The client strips any ```html wrapper once
+    the text is complete.
+    """
+    release = store.current().indexes.release(release_id)
+    if not release:
+        raise HTTPException(status_code=404, detail="Release not found")
+    prompt = build_marketing_prompt(release, await comparables_for(release_id))
+    return sse_response(llm.stream(prompt), error_html=MARKETING_ERROR_HTML)
 
 # --- 4. FAST ASSET GENERATION ---
 @app.get("/api/generate-asset/{release_id}")
-async def generate_asset(release_id: str):
-    data = load_data()
-    release = get_release_by_id(data, release_id)
+async def generate_asset(release_id: str, version: int = None):
+    """
+    Banner artwork for a release. The image is deterministic per (release,
+    version) and served from the local asset cache at `image_url`.
+    """
+    release = store.current().indexes.release(release_id)
     if not release: return {"error": "No release"}
-
-    genre_styles = {
-        "Melodic Techno": "neon lights, futuristic, purple haze, abstract geometric, 4k render",
-        "Deep House": "sunset, ibiza beach, luxury yacht, cocktail, cinematic lighting",
-        "Cyberpunk Bass": "cyberpunk city, glitch art, matrix code, neon rain, sci-fi",
-        "Liquid DnB": "fluid art, blue water, abstract flow, motion blur, smooth",
-        "Lo-Fi Beats": "anime aesthetic, rainy window, cozy room, cat, coffee",
-        "Synthwave": "retro car, 80s grid, palm trees, vaporwave, neon pink sun",
-        "Industrial Techno": "concrete texture, factory smoke, dark warehouse, industrial",
-        "Future Bass": "colorful smoke, festival crowd, lasers, vibrant clouds",
-        "Trap": "urban city night, gold chain, luxury sports car, street lights",
-        "Ambient": "nebula, stars, galaxy, aurora borealis, peaceful nature",
-        "Trance": "laser light show, tunnel, speed lines, energy, euphoria",
-        "Dubstep": "speaker system, shockwave, lightning, explosion, dark energy",
-        "Indie Dance": "disco ball, dance floor, retro fashion, vinyl record",
-        "Nu-Disco": "glitter, roller skates, 70s style, funk, vibrant colors",
-        "Hardstyle": "red lasers, massive stage, fireworks, hardstyle festival"
+    info = asset_service.describe(release, version)
+    v = info["version"]
+    return {
+        "image_url": f"/api/assets/{release_id}/full?version={v}",
+        "thumbnail_url": f"/api/assets/{release_id}/thumb?version={v}",
+        "sizes": {size: f"/api/assets/{release_id}/{size}?version={v}" for size in assets.SIZES},
+        **info,
     }
 
-    genre = release.get('genre', 'Unknown')
-    base_prompt = genre_styles.get(genre, f"{genre} music abstract art")
-    encoded_prompt = base_prompt.replace(" ", "%20")
-    random_seed = random.randint(1000, 9999)
-    image_url = f"https://image.pollinations.ai/prompt/{encoded_prompt}?width=1280&height=720&nologo=true&seed={random_seed}"
-    return {"image_url": image_url, "keywords": base_prompt}
+@app.get("/api/assets/{release_id}/{size}")
+async def get_asset(release_id: str, size: str, request: Request, version: int = None):
+    """Cached image bytes (thumb / medium / full): the full image is downloaded once per version, the rest resized from it."""
+    if size not in assets.SIZES:
+        raise HTTPException(status_code=400, detail=f"Unknown size '{size}'. Available: {', '.join(assets.SIZES)}")
+    release = store.current().indexes.release(release_id)
+    if not release:
+        raise HTTPException(status_code=404, detail="Release not found")
+    try:
+        with span("fetch"):
+            path, digest, content_type = await asset_service.get(release, size, version)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Image fetch failed: {e}")
+    etag = f'"{digest}"'
+    # A pinned version never changes; the default one follows the release's asset_version
+    headers = {"ETag": etag,
+               "Cache-Control": "public, max-age=31536000, immutable" if version is not None else "public, max-age=300"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=content_type, headers=headers)
+
+# --- LIVE FEED ---
+@app.get("/api/live")
+async def get_live_state():
+    return {"seq": live_bus.seq, "state": live_bus.state}
+
+@app.post("/api/live")
+async def publish_live_state(state: dict):
+    """
+    Publish the full live document (e.g. `python simulator.py --push`); clients
+    receive the delta. Under serve.py it reaches every worker through the
+    parent, and `seq` is null (the document is published once it comes back).
+    """
+    return {"seq": live_bus.submit(state)}
+
+@app.get("/api/live/stream")
+async def stream_live_state():
+    """
+    SSE: `event: snapshot` {seq, state} first (and again after a slow client
+    dropped frames), then `event: delta` {seq, patch} with RFC 7386 merge patches.
+    """
+    return sse_frames_response(live_bus.stream())
 
 # --- 5. TRIGGERS & CHAT ---
+async def current_alerts():
+    # The watcher notifies the engine on reload; this covers a request racing it
+    snap = store.current()
+    if trigger_engine.version != snap.version:
+        await run_in_threadpool(trigger_engine.evaluate, snap)
+    return trigger_engine
+
+@app.get("/api/triggers")
+async def list_triggers(rule: str = None, color: str = None, artist: str = None, genre: str = None,
+                        limit: int = DB_PAGE_DEFAULT):
+    """Active alerts across the catalog, optionally for the releases of one artist / genre."""
+    engine = await current_alerts()
+    release_ids = None
+    if artist or genre:
+        release_ids = [r['id'] for r in store.current().indexes.filter("releases", artist=artist, genre=genre)]
+    return engine.query(rule=rule, color=color, release_ids=release_ids, limit=max(1, min(limit, DB_PAGE_MAX)))
+
+@app.get("/api/triggers/events")
+async def list_trigger_events(since: int = 0, limit: int = DB_PAGE_DEFAULT):
+    """Raised / cleared events after sequence number `since` (bounded history, TRIGGER_HISTORY)."""
+    engine = await current_alerts()
+    return {"seq": engine.seq, "events": engine.events_since(since, max(1, min(limit, DB_PAGE_MAX)))}
+
+@app.get("/api/triggers/stream")
+async def stream_triggers():
+    """SSE like /api/live/stream over {"active": {release id: {rule id: alert}}}."""
+    return sse_frames_response(alerts_bus.stream())
+
 @app.get("/api/triggers/{release_id}")
 async def get_triggers(release_id: str):
-    data = load_data()
-    release = get_release_by_id(data, release_id)
-    if not release: return []
-    signals = release.get('market_signals', {})
-    alerts = []
-    if signals.get('competitor_drop'):
-        alerts.append({"type": "Competition Alert", "color": "red", "msg": "Major competitor released today."})
-    if signals.get('tiktok_trend') in ["High", "Viral"]:
-        alerts.append({"type": "Viral Signal", "color": "green", "msg": "Genre trending on TikTok."})
-    return alerts
+    engine = await current_alerts()
+    return engine.alerts_for(release_id)
 
-@app.post("/api/chat")
-async def chat_with_data(request: ChatRequest):
-    data = load_data()
-    full_context = json.dumps(data)
-    prompt = f"""
+async def build_chat_prompt(request):
+    related = [r['id'] for r in await comparables_for(request.context_id)] if request.context_id else []
+    snap = store.current()
+    with span("retrieval"):
+        context, _ = await run_in_threadpool(retriever.build_context, snap, request.message,
+                                             request.context_id, CHAT_TOP_K, CHAT_TOKEN_BUDGET, related)
+    return f"""
     You are the Chief Intelligence Officer.
-    DATABASE: {full_context}
+    DATABASE (records relevant to the question):
+    {context}
     User Question: {request.message}
     Answer professionally and concise.
     """
+
+@app.post("/api/chat")
+async def chat_with_data(request: ChatRequest):
     try:
-        model = genai.GenerativeModel('models/gemini-2.0-flash')
-        response = model.generate_content(prompt)
-        return {"response": response.text}
+        prompt = await build_chat_prompt(request)
+        with span("llm"):
+            return {"response": await llm.generate(prompt)}
     except Exception as e:
         return {"response": f"AI Error: {str(e)}"}
 
+@app.post("/api/chat/stream")
+async def stream_chat_with_data(request: ChatRequest):
+    """Server-sent events version of /api/chat (see /api/marketing/{id}/stream)."""
+    try:
+        prompt = await build_chat_prompt(request)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"AI Error: {str(e)}")
+    return sse_response(llm.stream(prompt))
+
 if __name__ == "__main__":
+    # Development: one worker. Production: `python serve.py --workers N` (shared snapshot, rolling reloads)
     import uvicorn
     print("--- Enterprise Label Platform Online ---")
     uvicorn.run(app, host="127.0.0.1", port=8001)
\ No newline at end of file
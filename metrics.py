@@ -0,0 +1,254 @@
+import os
+import sys
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+log = logging.getLogger("metrics")
+
+# Seconds; tuned for an API where most calls are ms and LLM/fit calls are seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# --- PROMETHEUS PRIMITIVES ---
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, safe to observe from any thread."""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}   # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for labelvalues, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labelvalues, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}")
+        return "\n".join(lines)
+
+
+class Gauge:
+    """A value read at scrape time from a callback (in-flight requests, cache sizes...)."""
+
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help = help_text
+        self.read = read
+
+    def render(self):
+        return f"# HELP {self.name} {self.help}\n# TYPE {self.name} gauge\n{self.name} {self.read()}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(m.render() for m in self.metrics) + "\n"
+
+
+registry = Registry()
+REQUEST_SECONDS = registry.register(Histogram(
+    "http_request_duration_seconds", "Time from request start to the last response byte.",
+    ("method", "route", "status")))
+STAGE_SECONDS = registry.register(Histogram(
+    "request_stage_duration_seconds", "Time spent per request stage (load_data, lookup, fit, llm, ...).",
+    ("route", "stage")))
+
+_in_flight = [0]
+_in_flight_lock = threading.Lock()
+registry.register(Gauge("http_requests_in_flight", "Requests currently being served.", lambda: _in_flight[0]))
+
+# --- SPANS ---
+# The active request's stage timings. contextvars follow the request into
+# run_in_threadpool / asyncio.to_thread, so spans work in sync helpers too.
+_trace = contextvars.ContextVar("request_trace", default=None)
+
+
+class Trace:
+    def __init__(self):
+        self.stages = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] += seconds
+
+
+@contextmanager
+def span(stage):
+    """Time a block as `stage` of the current request. A no-op outside a request."""
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(stage, time.perf_counter() - started)
+
+
+# --- SAMPLING PROFILER ---
+class SamplingProfiler:
+    """
+    Samples the Python stacks of all threads every `interval` seconds while
+    running. Output is the folded format (`frame;frame;frame count` per line)
+    read by flamegraph.pl, speedscope and inferno. Other concurrent requests
+    show up too: profile on a quiet instance.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+# --- MIDDLEWARE ---
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (streaming responses are timed to their last byte):
+    records request and per-stage histograms, logs requests slower than
+    `slow_ms` with their stage breakdown, and when `profile_dir` is set,
+    profiles requests that carry an `X-Profile: 1` header.
+    Time not covered by a span is reported as the `other` stage.
+    """
+
+    def __init__(self, app, slow_ms=1000, profile_dir=None, profile_interval=0.005, slow_exclude=()):
+        self.app = app
+        self.slow_ms = slow_ms
+        self.slow_exclude = frozenset(slow_exclude)  # long-lived routes (live streams) are never "slow"
+        self.profile_dir = profile_dir
+        self.profile_interval = profile_interval
+        self._profile_seq = 0
+        self._lock = threading.Lock()
+
+    def _wants_profile(self, scope):
+        return self.profile_dir and (b"x-profile", b"1") in scope.get("headers", [])
+
+    def _profile_path(self, scope):
+        with self._lock:
+            self._profile_seq += 1
+            seq = self._profile_seq
+        route = scope.get("path", "").strip("/").replace("/", "_") or "root"
+        return os.path.join(self.profile_dir, f"{int(time.time())}-{seq}-{route}.folded")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trace = Trace()
+        token = _trace.set(trace)
+        status = 500
+        profiler = profile_path = None
+        if self._wants_profile(scope):
+            profiler = SamplingProfiler(self.profile_interval)
+            profile_path = self._profile_path(scope)
+            profiler.start()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile_path:
+                    message.setdefault("headers", []).append((b"x-profile-file", os.path.basename(profile_path).encode()))
+            await send(message)
+
+        with _in_flight_lock:
+            _in_flight[0] += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            with _in_flight_lock:
+                _in_flight[0] -= 1
+            _trace.reset(token)
+            if profiler:
+                profiler.stop()
+                os.makedirs(self.profile_dir, exist_ok=True)
+                with open(profile_path, "w") as f:
+                    f.write(profiler.folded())
+            self._record(scope, status, elapsed, trace)
+
+    def _record(self, scope, status, elapsed, trace):
+        route = getattr(scope.get("route"), "path", None) or "unmatched"
+        REQUEST_SECONDS.observe(elapsed, scope["method"], route, str(status))
+        stages = dict(trace.stages)
+        stages["other"] = max(0.0, elapsed - sum(stages.values()))
+        for stage, seconds in stages.items():
+            STAGE_SECONDS.observe(seconds, route, stage)
+        if elapsed * 1000 >= self.slow_ms and route not in self.slow_exclude:
+            breakdown = " ".join(f"{k}={v * 1000:.1f}ms" for k, v in sorted(stages.items(), key=lambda kv: -kv[1]))
+            log.warning("slow request %s %s -> %s in %.1fms: %s",
+                        scope["method"], scope.get("path"), status, elapsed * 1000, breakdown)
+
+
+def options_from_env():
+    """SLOW_REQUEST_MS (default 1000); PROFILE_DIR enables per-request profiling via `X-Profile: 1`."""
+    return {
+        "slow_ms": float(os.getenv("SLOW_REQUEST_MS", "1000")),
+        "profile_dir": os.getenv("PROFILE_DIR") or None,
+        "profile_interval": float(os.getenv("PROFILE_INTERVAL", "0.005")),
+    }
@@ -0,0 +1,80 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def history_fingerprint(history):
+    """Stable hash of a sales history; any change to any day changes the key."""
+    return hashlib.sha1(np.asarray(history, dtype=np.float64).tobytes()).hexdigest()
+
+
+def params_key(params):
+    return tuple(sorted(params.items()))
+
+
+class ModelCache:
+    """
+    Bounded LRU + TTL cache for trained models.
+
+    Keys are (release id, history fingerprint, hyperparameters), so a model is
+    reused until the release's history or the model config changes. Entries
+    expire after `ttl` seconds and the least recently used entry is evicted
+    once `max_entries` is reached.
+    """
+
+    def __init__(self, max_entries=512, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            model, stored_at = entry
+            if self.ttl and now - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return model
+
+    def put(self, key, model):
+        with self._lock:
+            self._entries[key] = (model, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
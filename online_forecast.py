@@ -0,0 +1,295 @@
+import struct
+import threading
+
+import numpy as np
+
+import forecasting
+from forecasting import MA_WINDOW, EWMA_ALPHA, POLY_DEGREES, DEFAULT_HORIZON
+
+MAX_DEGREE = max(POLY_DEGREES.values())
+# Algorithms served from running state; gradient_boosting still trains (and caches) a model
+ONLINE_ALGORITHMS = ("linear", "polynomial", "moving_average", "exponential")
+
+# --- HISTORY DIGEST ---
+# Order-sensitive 64-bit digest of a series: the sum over days of splitmix64(bits(y) + x * GOLDEN).
+# Appending a day adds one term (O(1)); checking a whole history is one vectorized pass.
+_MASK = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+_MIX1, _MIX2 = 0xBF58476D1CE4E5B9, 0x94D049BB133111EB
+
+
+def _day_term(x, y):
+    z = (struct.unpack('<Q', struct.pack('<d', float(y) + 0.0))[0] + x * _GOLDEN) & _MASK
+    z = ((z ^ (z >> 30)) * _MIX1) & _MASK
+    z = ((z ^ (z >> 27)) * _MIX2) & _MASK
+    return z ^ (z >> 31)
+
+
+def history_digest(history):
+    """Digest of a whole series; equals the running SeriesState.digest after the same days."""
+    z = (np.asarray(history, dtype=float).reshape(-1) + 0.0).view(np.uint64)
+    z = z + np.arange(len(z), dtype=np.uint64) * np.uint64(_GOLDEN)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(_MIX1)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(_MIX2)
+    z = z ^ (z >> np.uint64(31))
+    return int(z.sum(dtype=np.uint64))
+
+
+class SeriesState:
+    """
+    Sufficient statistics of one release's daily history (x = day index):
+    n, sum(y * x^j) for j <= MAX_DEGREE (the OLS right-hand sides; sum(x^k)
+    follows from n), the EWMA value, the last MA_WINDOW points and a digest
+    of every day so far (history_digest).
+    Appending a day is O(1); so is every forecast derived from it.
+    """
+
+    __slots__ = ("n", "sums", "ewma", "tail", "digest")
+
+    def __init__(self, n=0, sums=None, ewma=None, tail=None, digest=0):
+        self.n = n
+        self.sums = sums or [0] * (MAX_DEGREE + 1)
+        self.ewma = ewma
+        self.tail = tail or []
+        self.digest = digest
+
+    @classmethod
+    def from_history(cls, history):
+        state = cls()
+        state.extend(history)
+        return state
+
+    def append(self, y):
+        x = self.n
+        for j in range(len(self.sums)):
+            self.sums[j] += y * x ** j
+        self.ewma = y if self.ewma is None else EWMA_ALPHA * y + (1 - EWMA_ALPHA) * self.ewma
+        self.tail.append(y)
+        if len(self.tail) > MA_WINDOW:
+            del self.tail[0]
+        if self.digest is not None:
+            self.digest = (self.digest + _day_term(x, y)) & _MASK
+        self.n += 1
+
+    def extend(self, values):
+        for y in values:
+            self.append(y)
+
+    def matches(self, history):
+        """
+        Cheap check that `history` extends this series: same length or longer
+        and the same tail. Edits further back are caught by verify() / forget().
+        """
+        n = self.n
+        return (self.digest is not None and n <= len(history)
+                and self.tail == list(history[max(0, n - MA_WINDOW):n]))
+
+    def verify(self, history):
+        """Full check against every day this state folded in (O(n))."""
+        return self.digest is not None and self.n <= len(history) and self.digest == history_digest(history[:self.n])
+
+    # Persisted as a plain list: [n, [sums...], ewma, [tail...], digest]
+    def to_list(self):
+        return [self.n, self.sums, self.ewma, self.tail, self.digest]
+
+    @classmethod
+    def from_list(cls, raw):
+        n, sums, ewma, tail = raw[:4]
+        # State saved before the digest existed can't be checked; it rebuilds on first use
+        return cls(n, list(sums), ewma, list(tail), raw[4] if len(raw) > 4 else None)
+
+
+def _power_sums(n):
+    """sum(x^k) for x in 0..n-1 and k = 0..4, per element of n."""
+    m = n - 1.0
+    s1 = m * (m + 1) / 2
+    s2 = m * (m + 1) * (2 * m + 1) / 6
+    s4 = m * (m + 1) * (2 * m + 1) * (3 * m * m + 3 * m - 1) / 30
+    return np.stack([n.astype(float), s1, s2, s1 * s1, s4], axis=1)
+
+
+def polyfit_from_states(states, degree, horizon=DEFAULT_HORIZON):
+    """Same predictions as forecasting.batch_polyfit_forecast, from running sums only."""
+    lengths = np.fromiter((s.n for s in states), dtype=np.int64, count=len(states))
+    if not len(states):
+        return np.zeros((0, horizon), dtype=np.int64)
+    scale = np.maximum(lengths - 1, 1).astype(float)
+    powers = np.arange(2 * degree + 1)
+    moments = _power_sums(lengths)[:, :2 * degree + 1] / scale[:, None] ** powers
+    b = np.array([s.sums[:degree + 1] for s in states], dtype=float) / scale[:, None] ** powers[:degree + 1]
+    return forecasting._clip_matrix(forecasting.solve_moments(moments, b, lengths, scale, degree, horizon))
+
+
+def _moving_average(state, horizon):
+    avg_val = sum(state.tail) / MA_WINDOW
+    return forecasting._clip(avg_val * (1 + (0.01 * i)) for i in range(horizon))
+
+
+def _exponential(state, horizon):
+    return forecasting._clip([state.ewma if state.ewma is not None else 0] * horizon)
+
+
+class OnlineForecaster:
+    """
+    Per-release forecasting state kept in step with the catalog.
+
+    - A release's state is reconciled with the history it is asked about: if
+      days were only appended, just those are folded in; anything else
+      (edited tail, a new release) rebuilds it from the history. Edits to
+      older days are caught once per snapshot, not per call: the
+      materializer verify()s the releases whose fingerprint changed, and
+      ingest forget()s releases whose past days it corrected.
+    - append() folds in new daily points directly (O(1) per point). Until the
+      snapshot catches up with them, the state is served as is rather than
+      rebuilt from the shorter history.
+    - State is persisted alongside the data (backend.save_forecast_state), so
+      a restart doesn't replay every history. flush() writes what changed.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._states = {}
+        self._dirty = set()
+        self._removed = set()
+        self._ahead = {}  # release id -> snapshot length when append() got ahead of it
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.rebuilds = 0
+        self.appended_days = 0
+
+    # --- PERSISTENCE ---
+    def load(self):
+        raw = self.backend.load_forecast_state() if self.backend is not None else {}
+        with self._lock:
+            self._states = {rid: SeriesState.from_list(v) for rid, v in raw.items()}
+            self._dirty.clear()
+            self._removed.clear()
+            self._ahead.clear()
+            self.loaded = True
+        return len(raw)
+
+    def flush(self):
+        with self._lock:
+            changed = {rid: self._states[rid].to_list() for rid in self._dirty if rid in self._states}
+            removed = list(self._removed)
+            self._dirty.clear()
+            self._removed.clear()
+        if self.backend is not None and (changed or removed):
+            self.backend.save_forecast_state(changed, removed)
+        return len(changed) + len(removed)
+
+    # --- STATE ---
+    def _state_for(self, release_id, history):
+        state = self._states.get(release_id)
+        if state is not None and state.n > len(history) and self._ahead.get(release_id, state.n) <= len(history):
+            return state  # appended days the snapshot doesn't have yet
+        self._ahead.pop(release_id, None)
+        if state is not None and state.matches(history):
+            if state.n == len(history):
+                return state
+            self.appended_days += len(history) - state.n
+            state.extend(history[state.n:])
+        else:
+            self.rebuilds += 1
+            state = self._states[release_id] = SeriesState.from_history(history)
+        self._dirty.add(release_id)
+        return state
+
+    def append(self, release_id, values, history=None):
+        """Fold new daily points into a release's state (`history` = the series before them)."""
+        with self._lock:
+            state = self._state_for(release_id, history) if history is not None else self._states.get(release_id)
+            if state is None:
+                state = self._states[release_id] = SeriesState()
+            if history is not None:
+                self._ahead.setdefault(release_id, len(history))
+            state.extend(values)
+            self.appended_days += len(values)
+            self._dirty.add(release_id)
+            return state.n
+
+    def forget(self, release_ids):
+        """Drop these releases' state (e.g. past days were corrected); it is rebuilt on next use."""
+        with self._lock:
+            for rid in release_ids:
+                self._ahead.pop(rid, None)
+                if self._states.pop(rid, None) is not None:
+                    self._dirty.discard(rid)
+                    self._removed.add(rid)
+
+    def verify(self, releases):
+        """
+        Full check of [(release id, history), ...] against their state, for
+        releases whose data changed (the materializer passes the rows whose
+        fingerprint moved). States that don't hold are dropped and rebuilt.
+        """
+        with self._lock:
+            stale = [rid for rid, history in releases
+                     if rid in self._states and not self._states[rid].verify(history)
+                     and not self._ahead.get(rid, len(history) + 1) <= len(history) < self._states[rid].n]
+        self.forget(stale)
+        return len(stale)
+
+    def prune(self, live_ids):
+        """Drop state for releases that no longer exist."""
+        with self._lock:
+            for rid in [rid for rid in self._states if rid not in live_ids]:
+                del self._states[rid]
+                self._ahead.pop(rid, None)
+                self._dirty.discard(rid)
+                self._removed.add(rid)
+
+    # --- FORECASTS ---
+    def forecast(self, release_id, history, algo="linear", horizon=DEFAULT_HORIZON):
+        return self.forecast_many([(release_id, history)], algo, horizon)[0]
+
+    def forecast_many(self, releases, algo="linear", horizon=DEFAULT_HORIZON):
+        """Forecasts for [(release id, history), ...] from per-release state."""
+        algo = forecasting.resolve_algo(algo)
+        with self._lock:
+            states = [self._state_for(rid, history) for rid, history in releases]
+        if algo in POLY_DEGREES:
+            return polyfit_from_states(states, POLY_DEGREES[algo], horizon).tolist()
+        if algo == "moving_average":
+            return [_moving_average(s, horizon) for s in states]
+        if algo == "exponential":
+            return [_exponential(s, horizon) for s in states]
+        raise ValueError(f"{algo} is not an online algorithm")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "releases": len(self._states),
+                "dirty": len(self._dirty),
+                "rebuilds": self.rebuilds,
+                "appended_days": self.appended_days,
+            }
+
+
+def self_check(seed=0, horizon=DEFAULT_HORIZON):
+    """
+    Online forecasts must equal a fresh fit after appends (also before the
+    snapshot has them) and after a correction to a day before the tail, once
+    the new snapshot is verified (a stale state would keep the old sums).
+    """
+    rng = np.random.default_rng(seed)
+    history = rng.integers(100, 300, 30).tolist()
+    online = OnlineForecaster()
+    online.forecast("R", history[:20])
+    online.append("R", history[20:25], history=history[:20])
+    online.verify([("R", history[:20])])
+    ahead = online.forecast("R", history[:20])
+    assert ahead == forecasting.batch_forecast([history[:25]], "linear", horizon)[0], ahead
+    corrected = list(history)
+    corrected[2] = 9000
+    for series in (history, corrected, corrected + [250]):
+        online.verify([("R", series)])
+        for algo in ONLINE_ALGORITHMS:
+            got = online.forecast("R", series, algo, horizon)
+            want = forecasting.batch_forecast([series], algo, horizon)[0]
+            assert list(got) == list(want), (algo, got, want)
+    return online.stats()
+
+
+if __name__ == "__main__":
+    print(f"✅ Online forecasts match fresh fits after appends and past-day corrections: {self_check()}")
@@ -0,0 +1,250 @@
+import re
+import json
+import math
+import heapq
+import hashlib
+import itertools
+import threading
+from collections import Counter, defaultdict
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+CHARS_PER_TOKEN = 4  # rough estimate for budgeting prompt size
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def compact(record):
+    return json.dumps(record, separators=(',', ':'), sort_keys=True)
+
+
+# --- DOCUMENTS ---
+def release_text(r):
+    stats = r.get('stats', {})
+    signals = r.get('market_signals', {})
+    parts = [
+        r.get('id', ''), r.get('artist', ''), r.get('track_name', ''), r.get('genre', ''),
+        f"bpm {r.get('bpm', '')}", f"sentiment {stats.get('sentiment', '')}",
+        f"tiktok {signals.get('tiktok_trend', '')}",
+    ]
+    if signals.get('competitor_drop'):
+        parts.append("competitor drop competition")
+    return " ".join(str(p) for p in parts)
+
+
+def customer_text(c):
+    return " ".join(str(p) for p in (c.get('id', ''), c.get('name', ''), c.get('region', ''),
+                                     f"bpm {c.get('bpm', '')}"))
+
+
+COLLECTIONS = {"releases": release_text, "customers": customer_text}
+
+# Words that name a collection narrow the search to it instead of matching every record of it
+COLLECTION_WORDS = {
+    word: collection
+    for collection, words in (("releases", ("release", "track", "song")),
+                              ("customers", ("customer", "client", "buyer", "account")))
+    for stem in words for word in (stem, stem + "s")
+}
+
+
+class CatalogRetriever:
+    """
+    Local search index over releases and customers for building chat prompts.
+
+    - BM25 over a keyword index (postings + document frequencies), updated
+      incrementally: on a new data snapshot only added/changed/removed records
+      touch the index.
+    - Optional TF-IDF character n-gram vectors (use_tfidf=True, needs sklearn and scipy)
+      blended into the score so typos and partial names still match. The
+      vocabulary is refit only after enough of the catalog has changed.
+    """
+
+    def __init__(self, k1=1.5, b=0.75, use_tfidf=False, tfidf_refit_fraction=0.2):
+        self.k1 = k1
+        self.b = b
+        self.use_tfidf = use_tfidf
+        self.tfidf_refit_fraction = tfidf_refit_fraction
+        self.version = None
+        self._lock = threading.Lock()
+        self._docs = {}                       # key -> (fingerprint, term counts, length, record)
+        self._keys = {c: {} for c in COLLECTIONS}  # collection -> its doc keys (dict as an ordered set)
+        self._postings = defaultdict(dict)    # term -> {key: tf}
+        self._total_len = 0
+        # TF-IDF state: one CSR matrix, row_keys[i] -> doc, row_of[doc] -> live row
+        self._vectorizer = None
+        self._matrix = None
+        self._row_keys = []
+        self._row_of = {}
+        self._changed_since_fit = 0
+
+    # --- INDEX MAINTENANCE ---
+    def _remove(self, key):
+        _, counts, length, _ = self._docs.pop(key)
+        del self._keys[key[0]][key]
+        for term in counts:
+            bucket = self._postings[term]
+            bucket.pop(key, None)
+            if not bucket:
+                del self._postings[term]
+        self._total_len -= length
+
+    def _add(self, key, fingerprint, text, record):
+        counts = Counter(tokenize(text))
+        length = sum(counts.values())
+        for term, tf in counts.items():
+            self._postings[term][key] = tf
+        self._docs[key] = (fingerprint, counts, length, record)
+        self._keys[key[0]][key] = None
+        self._total_len += length
+        return text
+
+    def sync(self, snap):
+        """Bring the index up to date with a data snapshot. Returns the number of changed docs."""
+        with self._lock:
+            if self.version == snap.version:
+                return 0
+            seen = set()
+            changed = {}
+            for collection, to_text in COLLECTIONS.items():
+                for pos, record in enumerate(snap.data.get(collection, [])):
+                    key = (collection, record.get('id', pos))
+                    seen.add(key)
+                    fingerprint = hashlib.sha1(compact(record).encode()).digest()
+                    current = self._docs.get(key)
+                    if current is not None and current[0] == fingerprint:
+                        continue
+                    if current is not None:
+                        self._remove(key)
+                    changed[key] = self._add(key, fingerprint, to_text(record), record)
+            removed = [key for key in self._docs if key not in seen]
+            for key in removed:
+                self._remove(key)
+
+            if self.use_tfidf and (changed or removed or self._vectorizer is None):
+                self._update_tfidf(changed, len(removed))
+            self.version = snap.version
+            return len(changed) + len(removed)
+
+    def _update_tfidf(self, changed, n_removed):
+        from scipy.sparse import vstack
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        self._changed_since_fit += len(changed) + n_removed
+        if not self._docs:
+            self._vectorizer = self._matrix = None
+            return
+        if self._vectorizer is None or self._changed_since_fit > self.tfidf_refit_fraction * max(len(self._docs), 1):
+            keys = list(self._docs)
+            self._vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=(3, 4), sublinear_tf=True)
+            self._matrix = self._vectorizer.fit_transform([COLLECTIONS[k[0]](self._docs[k][3]) for k in keys]).tocsr()
+            self._row_keys = keys
+            self._row_of = {k: i for i, k in enumerate(keys)}
+            self._changed_since_fit = 0
+            return
+        # Reuse the fitted vocabulary: changed docs get fresh rows appended, their
+        # old rows (and rows of removed docs) are simply no longer referenced
+        keys = list(changed)
+        if keys:
+            start = self._matrix.shape[0]
+            self._matrix = vstack([self._matrix, self._vectorizer.transform([changed[k] for k in keys])]).tocsr()
+            self._row_keys.extend(keys)
+            for i, k in enumerate(keys):
+                self._row_of[k] = start + i
+        for k in [k for k in self._row_of if k not in self._docs]:
+            del self._row_of[k]
+
+    # --- SEARCH ---
+    def _bm25(self, terms):
+        n = len(self._docs)
+        avg_len = self._total_len / n if n else 0
+        scores = defaultdict(float)
+        for term in set(terms):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, tf in postings.items():
+                length = self._docs[key][2]
+                scores[key] += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_len))
+        return scores
+
+    def _tfidf(self, query, limit):
+        sims = (self._matrix @ self._vectorizer.transform([query]).T).toarray().ravel()
+        out = {}
+        for i in sims.argsort()[::-1]:
+            if sims[i] <= 0 or len(out) >= limit:
+                break
+            key = self._row_keys[i]
+            if self._row_of.get(key) == i:  # skip superseded rows
+                out[key] = float(sims[i])
+        return out
+
+    def search(self, query, k=20):
+        """
+        Top-k (score, collection, record) for a free-text query. Collection
+        words ("customers", "tracks", ...) restrict the results to that
+        collection; if nothing else matches, its first k records are listed.
+        """
+        terms = tokenize(query)
+        wanted = {COLLECTION_WORDS[t] for t in terms if t in COLLECTION_WORDS}
+        terms = [t for t in terms if t not in COLLECTION_WORDS]
+        with self._lock:
+            scores = self._bm25(terms)
+            if self.use_tfidf and self._vectorizer is not None and terms:
+                top = max(scores.values(), default=0) or 1.0
+                blended = {key: s / top for key, s in scores.items()}
+                for key, sim in self._tfidf(" ".join(terms), 10 * k).items():
+                    blended[key] = blended.get(key, 0.0) + sim
+                scores = blended
+            if wanted:
+                scores = {key: s for key, s in scores.items() if key[0] in wanted}
+                if not scores:
+                    keys = itertools.chain.from_iterable(self._keys[c] for c in COLLECTIONS if c in wanted)
+                    scores = dict.fromkeys(itertools.islice(keys, k), 0.0)
+            best = heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+            return [(score, key[0], self._docs[key][3]) for key, score in best]
+
+    # --- PROMPT CONTEXT ---
+    def build_context(self, snap, question, context_id=None, k=20, token_budget=4000, related=()):
+        """
+        Compact JSON lines for the records most relevant to `question`, pinned
+        release (`context_id`) first, then the `related` release ids (e.g. its
+        nearest neighbours), stopping before `token_budget` is exceeded.
+        """
+        self.sync(snap)
+        lines, used, seen = [], 0, set()
+
+        def take(collection, record):
+            nonlocal used
+            key = (collection, record.get('id'))
+            if key in seen:
+                return True
+            line = f"{collection[:-1]}: {compact(record)}"
+            cost = estimate_tokens(line)
+            if used + cost > token_budget:
+                return False
+            lines.append(line)
+            used += cost
+            seen.add(key)
+            return True
+
+        pinned = snap.indexes.release(context_id) if context_id else None
+        if pinned:
+            take("releases", pinned)
+        for release_id in related:
+            record = snap.indexes.release(release_id)
+            if record and not take("releases", record):
+                break
+        for _, collection, record in self.search(question, k):
+            if not take(collection, record):
+                break
+
+        summary = (f"CATALOG: {len(snap.data.get('releases', []))} releases, "
+                   f"{len(snap.data.get('customers', []))} customers. "
+                   f"Showing the {len(lines)} most relevant records.")
+        return summary + "\n" + "\n".join(lines), used
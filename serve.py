@@ -0,0 +1,373 @@
+"""
+Production launcher: N uvicorn workers forked from one warm parent.
+
+    python serve.py --workers 4 --host 0.0.0.0 --port 8001
+
+- The parent imports the app (heavy ML/LLM libraries stay lazy), loads the
+  data once and warms the cheap caches (main.prime), then forks the workers.
+  They inherit that snapshot copy-on-write (gc.freeze keeps the collector
+  from dirtying its pages), and the columnar arrays are memory-mapped from
+  COLUMNS_DIR, so the catalog is held once rather than once per worker.
+- All workers accept on one shared listening socket.
+- Workers still watch the data and reload on their own, as in single-process
+  mode. Every `--share-interval` seconds (or on `kill -HUP <parent>`) the
+  parent reloads too and replaces the workers one at a time: the new one
+  must report ready before the old one is told to drain, so there is no
+  downtime and the new snapshot is shared again.
+- Background jobs run once, not once per worker: one elected worker
+  precomputes gradient boosting forecasts and runs the backtest; the others
+  start with BACKGROUND_JOBS=follow and pick the results up from the backend.
+  When the elected worker exits, a remaining one is promoted (SIGUSR1).
+- The live dashboard feed is relayed through the parent: a document POSTed
+  to /api/live on any worker reaches the SSE clients of every worker, and
+  LIVE_SIMULATOR=1 runs one simulator here instead of one per worker.
+- SIGTERM / SIGINT drain every worker; crashed workers are replaced.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import errno
+import select
+import signal
+import socket
+import logging
+import argparse
+import multiprocessing
+
+log = logging.getLogger("serve")
+
+
+def parse_args(argv=None):
+    cpus = os.cpu_count() or 2
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", str(cpus))))
+    parser.add_argument("--columns-dir", default=os.getenv("COLUMNS_DIR", ".columns"),
+                        help="where the shared memory-mapped columns are written")
+    parser.add_argument("--share-interval", type=float, default=float(os.getenv("SHARE_INTERVAL", "60")),
+                        help="seconds between checks for new data to re-share (0: only on SIGHUP)")
+    parser.add_argument("--ready-timeout", type=float, default=60.0,
+                        help="seconds a replacement worker gets to start before a rollout is abandoned")
+    parser.add_argument("--live-simulator", action="store_true", default=os.getenv("LIVE_SIMULATOR", "0") == "1",
+                        help="publish simulator.py updates to every worker's live feed")
+    parser.add_argument("--live-interval", type=float, default=float(os.getenv("LIVE_SIMULATOR_INTERVAL", "3")))
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args(argv)
+
+
+# --- LIVE FEED RELAY ---
+class LiveRelay:
+    """
+    Parent end of the live feed (live.RelayLink in each worker): every line a
+    worker sends up is passed down to all workers, so SSE clients see the same
+    feed whichever worker they are connected to. The latest document is
+    replayed to workers started later. With a simulator interval the simulator
+    runs here, once, instead of in every worker.
+    """
+
+    def __init__(self, simulate_interval=None):
+        self.links = {}     # worker pid -> parent end of its socket pair
+        self.partial = {}   # worker pid -> bytes of an unfinished line
+        self.last = None
+        self.relayed = 0
+        self.simulate_interval = simulate_interval
+        self._next_tick = time.monotonic()
+
+    def add(self, pid, sock):
+        sock.settimeout(1.0)  # a worker that stops reading loses its feed instead of stalling the parent
+        self.links[pid] = sock
+        self.partial[pid] = b""
+        if self.last is not None:
+            self._send(pid, self.last)
+
+    def remove(self, pid):
+        self.partial.pop(pid, None)
+        sock = self.links.pop(pid, None)
+        if sock is not None:
+            sock.close()
+
+    def close_inherited(self):
+        # In a freshly forked worker: the other workers' parent ends aren't its to hold
+        for sock in self.links.values():
+            sock.close()
+        self.links.clear()
+        self.partial.clear()
+
+    def broadcast(self, line):
+        self.last = line
+        self.relayed += 1
+        for pid in list(self.links):
+            self._send(pid, line)
+
+    def _send(self, pid, line):
+        try:
+            self.links[pid].sendall(line)
+        except OSError as e:
+            log.warning("live relay to worker %d dropped: %s", pid, e)
+            self.remove(pid)
+
+    def poll(self, timeout):
+        """Relay what the workers sent within `timeout` seconds; publishes a simulator update when due."""
+        if self.simulate_interval:
+            timeout = max(0.0, min(timeout, self._next_tick - time.monotonic()))
+        if self.links:
+            readable, _, _ = select.select(list(self.links.values()), [], [], timeout)
+        else:
+            readable = []
+            time.sleep(timeout)
+        pid_of = {sock: pid for pid, sock in self.links.items()}
+        for sock in readable:
+            pid = pid_of[sock]
+            try:
+                chunk = sock.recv(65536)
+            except OSError:
+                chunk = b""
+            if not chunk:
+                self.remove(pid)  # worker exited
+                continue
+            *lines, self.partial[pid] = (self.partial[pid] + chunk).split(b"\n")
+            for line in lines:
+                if line:
+                    self.broadcast(line + b"\n")
+        if self.simulate_interval and time.monotonic() >= self._next_tick:
+            from simulator import generate_live_data
+            self._next_tick = time.monotonic() + self.simulate_interval
+            self.broadcast(json.dumps(generate_live_data(), separators=(',', ':')).encode() + b"\n")
+
+
+class Supervisor:
+    def __init__(self, app_module, sock, args):
+        self.app_module = app_module
+        self.sock = sock
+        self.args = args
+        self.relay = LiveRelay(args.live_interval if args.live_simulator else None)
+        self.workers = {}       # pid -> started at
+        self.leader = None      # the worker running the background jobs
+        self.retiring = set()   # draining after a rollout; not replaced when they exit
+        self.stopping = False
+        self.reload_requested = False
+        self.loop = None        # in a worker: its event loop
+        self.snapshot_fingerprint = app_module.store.current().fingerprint
+
+    # --- WORKERS ---
+    def spawn(self):
+        """Fork one worker; returns (pid, fd that becomes readable when it is serving)."""
+        lead = self.leader is None
+        ready_r, ready_w = os.pipe()
+        relay_parent, relay_child = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            relay_parent.close()
+            self.relay.close_inherited()
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            os.environ["BACKGROUND_JOBS"] = "run" if lead else "follow"
+            signal.signal(signal.SIGUSR1, self._on_promote)
+            # uvicorn handles these while serving and re-raises them afterwards;
+            # ignored here so that re-raise doesn't skip the cleanup in _serve
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            code = 0
+            try:
+                self._serve(ready_w, relay_child)
+            except BaseException:
+                log.exception("worker %d crashed", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(ready_w)
+        relay_child.close()
+        self.relay.add(pid, relay_parent)
+        self.workers[pid] = time.time()
+        if lead:
+            self.leader = pid
+        return pid, ready_r
+
+    def _on_promote(self, *_):
+        # In the worker: from now on this process runs the background jobs
+        os.environ["BACKGROUND_JOBS"] = "run"
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.app_module.lead)
+
+    def elect(self):
+        """Promote the longest-running worker if the one running the background jobs is gone."""
+        if self.leader is not None or self.stopping or not self.workers:
+            return
+        self.leader = min(self.workers, key=self.workers.get)
+        log.info("worker %d now runs the background jobs", self.leader)
+        self._signal(self.leader, signal.SIGUSR1)
+
+    def _serve(self, ready_fd, relay_sock):
+        import asyncio
+        import uvicorn
+        import live
+
+        live.RelayLink(relay_sock, self.app_module.live_bus).start()
+
+        server = uvicorn.Server(uvicorn.Config(self.app_module.app, lifespan="on", log_level=self.args.log_level))
+
+        async def announce():
+            while not server.started and not server.should_exit:
+                await asyncio.sleep(0.05)
+            if server.started:
+                os.write(ready_fd, b"1")
+            os.close(ready_fd)
+
+        async def run():
+            self.loop = asyncio.get_running_loop()
+            task = asyncio.create_task(announce())
+            await server.serve(sockets=[self.sock])
+            task.cancel()
+
+        asyncio.run(run())
+        # The ML process pool was shut down without waiting; its processes would outlive os._exit
+        for child in multiprocessing.active_children():
+            child.terminate()
+            child.join(5)
+
+    def wait_ready(self, pid, ready_fd):
+        try:
+            readable, _, _ = select.select([ready_fd], [], [], self.args.ready_timeout)
+            return bool(readable) and os.read(ready_fd, 1) == b"1"
+        finally:
+            os.close(ready_fd)
+
+    def start(self):
+        for _ in range(self.args.workers):
+            pid, ready_fd = self.spawn()
+            if not self.wait_ready(pid, ready_fd):
+                log.error("worker %d did not become ready", pid)
+        log.info("serving on %s:%d with %d workers", self.args.host, self.args.port, len(self.workers))
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.workers.pop(pid, None)
+            self.relay.remove(pid)
+            if pid == self.leader:
+                self.leader = None
+                self.elect()
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+            elif not self.stopping:
+                log.warning("worker %d exited (status %d); replacing it", pid, status)
+                time.sleep(1.0)  # don't spin if workers die at startup
+                self.wait_ready(*self.spawn())
+
+    # --- ROLLING RELOAD ---
+    def reshare(self):
+        """Reload in the parent, then swap workers one by one for ones forked from the new snapshot."""
+        store = self.app_module.store
+        gc.unfreeze()
+        try:
+            store.reload()
+            snap = self.app_module.prime()
+        finally:
+            gc.freeze()
+        self.snapshot_fingerprint = snap.fingerprint
+        log.info("data version %s loaded; replacing %d workers", snap.version, len(self.workers))
+        for old in list(self.workers):
+            if self.stopping:
+                return
+            pid, ready_fd = self.spawn()
+            if not self.wait_ready(pid, ready_fd):
+                log.error("replacement worker %d not ready; keeping the remaining old workers", pid)
+                return
+            self.retire(old)
+
+    def retire(self, pid):
+        self.retiring.add(pid)
+        self.workers.pop(pid, None)
+        self._signal(pid, signal.SIGTERM)  # uvicorn finishes in-flight requests, then exits
+
+    def data_changed(self):
+        try:
+            return self.app_module.store.backend.fingerprint() != self.snapshot_fingerprint
+        except Exception:
+            return False
+
+    # --- MAIN LOOP ---
+    def _signal(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+    def _on_stop(self, *_):
+        self.stopping = True
+
+    def _on_hup(self, *_):
+        self.reload_requested = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_hup)
+        self.start()
+        last_check = time.monotonic()
+        while not self.stopping:
+            self.relay.poll(0.5)
+            self.reap()
+            due = self.args.share_interval and time.monotonic() - last_check >= self.args.share_interval
+            if due:
+                last_check = time.monotonic()
+            if self.reload_requested or (due and self.data_changed()):
+                self.reload_requested = False
+                self.reshare()
+        self.shutdown()
+
+    def shutdown(self, grace=30.0):
+        log.info("stopping %d workers", len(self.workers) + len(self.retiring))
+        for pid in list(self.workers) + list(self.retiring):
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + grace
+        while (self.workers or self.retiring) and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers) + list(self.retiring):
+            self._signal(pid, signal.SIGKILL)
+
+
+def bind(host, port):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(name)s %(message)s")
+    if not hasattr(os, "fork"):
+        sys.exit("serve.py needs fork(); on this platform run `python main.py`")
+
+    # Settings the workers inherit: shared columns, one ML pool's worth of CPUs split across workers
+    os.environ.setdefault("COLUMNS_DIR", args.columns_dir)
+    os.environ.setdefault("ML_WORKERS", str(max(1, (os.cpu_count() or 2) // max(1, args.workers))))
+    os.environ.setdefault("WARM_START", "1")
+    os.environ["LIVE_SIMULATOR"] = "0"  # the parent's relay runs the one simulator (--live-simulator)
+
+    started = time.perf_counter()
+    import main as app_module
+    snap = app_module.prime()
+    gc.freeze()  # everything allocated so far is shared with the workers; keep the GC off those pages
+    log.info("data version %s ready in %.2fs (columns: %s)", snap.version,
+             time.perf_counter() - started, snap.columns.path)
+
+    Supervisor(app_module, bind(args.host, args.port), args).run()
+
+
+if __name__ == "__main__":
+    main()
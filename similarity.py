@@ -0,0 +1,234 @@
+import os
+import time
+import warnings
+import threading
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from triggers import tail_slopes
+
+SHAPE_WINDOW = 14   # days of history behind the shape features
+REBUILD_FRACTION = 0.1   # rebuild the main tree once this share of releases sits in the delta
+
+# name -> weight in the distance (features are standardized first)
+FEATURES = {
+    "bpm": 1.0,
+    "sentiment": 1.0,
+    "revenue": 1.0,      # log1p(revenue)
+    "level": 1.0,        # log1p(mean daily sales over the window)
+    "trend": 1.0,        # relative OLS slope over the window
+    "volatility": 0.5,   # std / mean over the window
+}
+
+
+def _genre(release):
+    return str(release.get('genre') or '').strip().casefold()
+
+
+def extract_features(releases, histories):
+    """Raw (n, len(FEATURES)) matrix, NaN where a value is missing; `histories` is a HistoryColumns."""
+    def column(get):
+        return np.array([get(r) for r in releases], dtype=float)
+
+    def number(value):
+        return value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+    tails = histories.tails(SHAPE_WINDOW) if len(releases) else np.zeros((0, SHAPE_WINDOW))
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN rows (no history) stay NaN
+        mean = np.nanmean(tails, axis=1)
+        std = np.nanstd(tails, axis=1)
+        revenue = column(lambda r: number(r.get('stats', {}).get('revenue')))
+        columns = {
+            "bpm": column(lambda r: number(r.get('bpm'))),
+            "sentiment": column(lambda r: number(r.get('stats', {}).get('sentiment'))),
+            "revenue": np.log1p(np.maximum(revenue, 0)),
+            "level": np.log1p(np.maximum(mean, 0)),
+            "trend": tail_slopes(tails),
+            "volatility": np.where(mean > 0, std / mean, 0.0),
+        }
+    return np.stack([columns[name] for name in FEATURES], axis=1).reshape(-1, len(FEATURES))
+
+
+class _State:
+    """
+    One published index (never mutated once built):
+    Z are the current standardized, weighted features, one row per release in
+    snapshot order. The main KD-tree may have been built from older rows:
+    tree_rows maps each tree point to the current row it still represents
+    (-1 once that release changed or left), and `delta` lists the current
+    rows the tree doesn't cover, in a small tree of their own (delta_tree).
+    """
+
+    __slots__ = ("version", "ids", "row_of", "genres", "Z", "center", "scale",
+                 "tree", "tree_rows", "delta", "delta_tree")
+
+    def __init__(self, version, ids, genres, Z, center, scale, tree, tree_rows, delta, delta_tree=None):
+        self.version = version
+        self.ids = ids
+        self.row_of = {rid: i for i, rid in enumerate(ids)}
+        self.genres = genres
+        self.Z = Z
+        self.center = center
+        self.scale = scale
+        self.tree = tree
+        self.tree_rows = tree_rows
+        self.delta = delta
+        self.delta_tree = delta_tree
+
+
+class SimilarityIndex:
+    """
+    k-nearest-neighbour search over releases for the market radar: bpm,
+    sentiment, revenue and the shape of recent sales (FEATURES), standardized
+    and weighted, in a KD-tree (scipy cKDTree).
+
+    - Built once per data snapshot, then updated incrementally: releases whose
+      features changed are tombstoned in the main tree and move to a small
+      delta tree, rebuilt on every sync, until they make up REBUILD_FRACTION
+      of the catalog, when the main tree (and the standardization) is rebuilt.
+    - Each sync publishes a new immutable state with one reference swap, so
+      queries never wait on a rebuild.
+    """
+
+    def __init__(self, rebuild_fraction=REBUILD_FRACTION):
+        self.rebuild_fraction = rebuild_fraction
+        self.weights = np.array(list(FEATURES.values()))
+        self.state = None
+        self.builds = 0
+        self.syncs = 0
+        self.last_changed = 0
+        self.last_sync_s = None
+        self._lock = threading.Lock()
+
+    # --- MAINTENANCE ---
+    def _standardize(self, F, center, scale):
+        Z = (F - center) / scale * self.weights
+        Z[np.isnan(Z)] = 0.0  # missing values sit at the center
+        return Z
+
+    def _build(self, version, ids, genres, F):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # a feature nobody has
+            center = np.nan_to_num(np.nanmedian(F, axis=0)) if len(F) else np.zeros(F.shape[1])
+            scale = np.nan_to_num(np.nanstd(F, axis=0)) if len(F) else np.ones(F.shape[1])
+        scale[scale == 0] = 1.0
+        Z = self._standardize(F, center, scale)
+        self.builds += 1
+        return _State(version, ids, genres, Z, center, scale, cKDTree(Z), np.arange(len(ids)), np.zeros(0, dtype=np.int64))
+
+    def sync(self, snap):
+        """Bring the index up to date with `snap`; returns the number of releases re-indexed."""
+        with self._lock:
+            previous = self.state
+            if previous is not None and previous.version == snap.version:
+                return 0
+            started = time.perf_counter()
+            releases = snap.data.get('releases', [])
+            ids = [r['id'] for r in releases]
+            genres = np.array([_genre(r) for r in releases], dtype=object)
+            F = extract_features(releases, snap.columns.histories)
+            if previous is None:
+                state, changed = self._build(snap.version, ids, genres, F), len(ids)
+            else:
+                state, changed = self._update(previous, snap.version, ids, genres, F)
+            self.state = state
+            self.syncs += 1
+            self.last_changed = changed
+            self.last_sync_s = round(time.perf_counter() - started, 4)
+            return changed
+
+    def _update(self, previous, version, ids, genres, F):
+        Z = self._standardize(F, previous.center, previous.scale)
+        prev = np.fromiter((previous.row_of.get(rid, -1) for rid in ids), dtype=np.int64, count=len(ids))
+        known = prev >= 0
+        same = np.zeros(len(ids), dtype=bool)
+        same[known] = (Z[known] == previous.Z[prev[known]]).all(axis=1) & (genres[known] == previous.genres[prev[known]])
+        # Old row -> new row for releases that didn't change; everything else drops out of the tree
+        new_of_old = np.full(len(previous.ids), -1, dtype=np.int64)
+        new_of_old[prev[same]] = np.flatnonzero(same)
+        tree_rows = np.where(previous.tree_rows >= 0, new_of_old[np.maximum(previous.tree_rows, 0)], -1)
+        covered = np.zeros(len(ids), dtype=bool)
+        covered[tree_rows[tree_rows >= 0]] = True
+        delta = np.flatnonzero(~covered)
+        changed = int((~same).sum())
+        if len(delta) > self.rebuild_fraction * max(len(ids), 1):
+            return self._build(version, ids, genres, F), changed
+        delta_tree = cKDTree(Z[delta]) if len(delta) else None
+        return _State(version, ids, genres, Z, previous.center, previous.scale,
+                      previous.tree, tree_rows, delta, delta_tree), changed
+
+    # --- QUERIES ---
+    def _candidates(self, state, tree, tree_rows, point, row, k, genre):
+        # Fetch a few more than k, and 4x more each round while tombstones / other genres fill the results
+        n_tree = len(tree_rows)
+        fetch = min(n_tree, (k + 1) * (1 if genre is None else 4))
+        while fetch > 0:
+            dist, idx = tree.query(point, fetch)
+            dist, idx = np.atleast_1d(dist), np.atleast_1d(idx)
+            rows = tree_rows[idx]
+            keep = (rows >= 0) & (rows != row)
+            if genre is not None:
+                keep &= state.genres[np.maximum(rows, 0)] == genre
+            if keep.sum() >= k or fetch >= n_tree:
+                return dist[keep][:k], rows[keep][:k]
+            fetch = min(n_tree, fetch * 4)
+        return np.zeros(0), np.zeros(0, dtype=np.int64)
+
+    def neighbours(self, release_id, k=10, same_genre=False):
+        """[(release id, distance)] of the k nearest other releases, or None if the id isn't indexed."""
+        state = self.state
+        row = state.row_of.get(release_id) if state is not None else None
+        if row is None:
+            return None
+        point = state.Z[row]
+        genre = state.genres[row] if same_genre else None
+        dist, rows = self._candidates(state, state.tree, state.tree_rows, point, row, k, genre)
+        if len(state.delta):
+            d2, r2 = self._candidates(state, state.delta_tree, state.delta, point, row, k, genre)
+            dist, rows = np.concatenate([dist, d2]), np.concatenate([rows, r2])
+            order = np.argsort(dist, kind="stable")[:k]
+            dist, rows = dist[order], rows[order]
+        return [(state.ids[r], float(d)) for r, d in zip(rows.tolist(), dist.tolist())]
+
+    def neighbours_many(self, release_ids, k=10, same_genre=False):
+        """{release id: neighbours} for many releases; the tree is queried once for all of them."""
+        state = self.state
+        if state is None:
+            return {rid: None for rid in release_ids}
+        found = [(rid, state.row_of.get(rid)) for rid in release_ids]
+        out = {rid: None for rid, row in found if row is None}
+        found = [(rid, row) for rid, row in found if row is not None]
+        # No delta and as many tree points as releases means no tombstones either:
+        # one query for everything. Otherwise filters / tombstones can need a deeper search per release
+        if not found or same_genre or len(state.delta) or len(state.tree_rows) != len(state.ids):
+            out.update((rid, self.neighbours(rid, k, same_genre)) for rid, _ in found)
+            return out
+        rows = np.array([row for _, row in found])
+        fetch = min(len(state.tree_rows), k + 1)
+        dist, idx = state.tree.query(state.Z[rows], fetch)
+        dist, idx = dist.reshape(len(rows), -1), idx.reshape(len(rows), -1)
+        for (rid, row), d, i in zip(found, dist.tolist(), state.tree_rows[idx].tolist()):
+            out[rid] = [(state.ids[j], dj) for j, dj in zip(i, d) if j != row][:k]
+        return out
+
+    def stats(self):
+        state = self.state
+        return {
+            "features": FEATURES,
+            "version": state.version if state else None,
+            "releases": len(state.ids) if state else 0,
+            "tree_points": len(state.tree_rows) if state else 0,
+            "tombstones": int((state.tree_rows < 0).sum()) if state else 0,
+            "delta": len(state.delta) if state else 0,
+            "builds": self.builds,
+            "syncs": self.syncs,
+            "last_changed": self.last_changed,
+            "last_sync_s": self.last_sync_s,
+        }
+
+
+def from_env():
+    """SIMILAR_REBUILD_FRACTION: share of changed releases kept in the delta before the main tree is rebuilt."""
+    return SimilarityIndex(rebuild_fraction=float(os.getenv("SIMILAR_REBUILD_FRACTION", str(REBUILD_FRACTION))))
@@ -2,6 +2,8 @@ import json
 import time
 import random
 import os
+import argparse
+import urllib.request
 
 # Configuration
 DATA_FILE = "data.json"
@@ -53,16 +55,40 @@ def generate_live_data():
     
     return data
 
+def write_atomic(path, data):
+    # Temp file + rename: readers see the old document or the new one, never half of one
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+def push(url, data):
+    # Publish to the server's live bus (POST /api/live); dashboards get the delta over SSE
+    req = urllib.request.Request(url, data=json.dumps(data).encode(), method="POST",
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=5) as res:
+        return json.load(res)
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live market simulator")
+    parser.add_argument("--push", metavar="URL", help="POST each update here (e.g. http://127.0.0.1:8001/api/live) instead of writing data.json")
+    parser.add_argument("--interval", type=float, default=3.0)
+    args = parser.parse_args()
+
     print(f"--- 📡 DATA SIMULATOR STARTED ---")
-    print(f"Writing to {DATA_FILE} every 3 seconds...")
+    print(f"{'Pushing to ' + args.push if args.push else 'Writing to ' + DATA_FILE} every {args.interval:g} seconds...")
     
     while True:
         live_data = generate_live_data()
-        
-        # Atomic write to avoid reading partial files
-        with open(DATA_FILE, "w") as f:
-            json.dump(live_data, f, indent=2)
-            
-        print(f"⚡ Updated {DATA_FILE} at {time.ctime()}")
-        time.sleep(3)
\ No newline at end of file
+
+        if args.push:
+            try:
+                seq = push(args.push, live_data)["seq"]
+                # seq is null behind serve.py: the update is relayed to every worker first
+                print(f"⚡ Published update {'#' + str(seq) if seq is not None else '(relayed)'} at {time.ctime()}")
+            except OSError as e:
+                print(f"⚠️ Push failed: {e}")
+        else:
+            write_atomic(DATA_FILE, live_data)
+            print(f"⚡ Updated {DATA_FILE} at {time.ctime()}")
+        time.sleep(args.interval)
\ No newline at end of file
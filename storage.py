@@ -0,0 +1,611 @@
+import os
+import sys
+import json
+import queue
+import sqlite3
+import tempfile
+import threading
+from array import array
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process sidecar locking (single process there anyway)
+    fcntl = None
+
+
+def file_fingerprint(path):
+    """Identity of the file on disk: (inode, mtime_ns, size), or None if missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+# --- HISTORY PACKING ---
+# Daily sales are stored as a typed little-endian array instead of a JSON list:
+# b'i' + int32s when every value is an int that fits, otherwise b'd' + float64s.
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def pack_history(history):
+    if all(isinstance(v, int) and not isinstance(v, bool) and INT32_MIN <= v <= INT32_MAX for v in history):
+        arr, tag = array('i', history), b'i'
+    else:
+        arr, tag = array('d', history), b'd'
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return tag + arr.tobytes()
+
+
+def unpack_history(blob):
+    if not blob:
+        return []
+    arr = array(chr(blob[0]))
+    arr.frombytes(blob[1:])
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr.tolist()
+
+
+def atomic_write_json(path, data):
+    """Atomic replace: write a temp file next to the target, fsync, rename."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix='.db-', suffix='.json', dir=directory)
+    try:
+        # Keep the existing file's permissions (mkstemp creates 0600)
+        os.chmod(tmp, os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+# --- SIDECAR LOGS ---
+# Derived per-release rows (forecast state, backtest scores, shared forecasts) next to a JSON catalog.
+# A sidecar is an optional compacted base object followed by one [release id, row or null] line per
+# change, so a flush appends only the changed rows; it is rewritten once the log outgrows the rows.
+SIDECAR_COMPACT_MIN = 1000   # log lines a sidecar may collect before it is compacted
+
+
+def read_sidecar(path):
+    """(rows, log lines) of a sidecar file; a missing file is empty."""
+    rows, entries = {}, 0
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue  # torn last line of a writer that died mid-append
+                if isinstance(item, dict):
+                    rows = item
+                    continue
+                release_id, row = item
+                entries += 1
+                if row is None:
+                    rows.pop(release_id, None)
+                else:
+                    rows[release_id] = row
+    except OSError:
+        pass
+    return rows, entries
+
+
+@contextmanager
+def _locked_sidecar(path):
+    """The sidecar opened for appending under an exclusive lock (re-opened if compaction replaced it)."""
+    while True:
+        f = open(path, 'a+b')
+        if fcntl is None:
+            break
+        fcntl.flock(f, fcntl.LOCK_EX)
+        if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+            break
+        f.close()
+    try:
+        yield f
+    finally:
+        f.close()
+
+
+def append_sidecar(path, changed, removed=()):
+    """Append one line per changed / removed release; returns the number of lines."""
+    lines = [json.dumps([rid, row], separators=(',', ':')) for rid, row in changed.items()]
+    lines += [json.dumps([rid, None]) for rid in removed]
+    if not lines:
+        return 0
+    data = ("\n".join(lines) + "\n").encode()
+    with _locked_sidecar(path) as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                data = b"\n" + data  # compacted base (or an older sidecar) has no trailing newline
+        f.write(data)
+        f.flush()
+    return len(lines)
+
+
+def compact_sidecar(path):
+    """Rewrite a sidecar as just its current rows; returns how many there are."""
+    with _locked_sidecar(path):
+        rows, _ = read_sidecar(path)
+        atomic_write_json(path, rows)
+    return len(rows)
+
+
+# --- JSON BACKEND ---
+class JsonBackend:
+    """The original single-file database.json. Good for demos and small catalogs."""
+
+    kind = "json"
+
+    def __init__(self, path):
+        self.path = path
+        self._sidecars = {}   # sidecar path -> [rows when last read or compacted, lines appended since]
+
+    def fingerprint(self):
+        return file_fingerprint(self.path)
+
+    def load(self):
+        before = self.fingerprint()
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+        if self.fingerprint() != before:
+            # A writer touched the file mid-read; let the next poll pick it up.
+            raise RuntimeError(f"{self.path} changed while being read")
+        return data
+
+    def get_release(self, release_id):
+        return next((r for r in self.load().get('releases', []) if r['id'] == release_id), None)
+
+    def save(self, data):
+        atomic_write_json(self.path, data)
+
+    def upsert_releases(self, releases):
+        by_id = {r['id']: r for r in releases}
+        data = self.load()
+        rows = data.setdefault('releases', [])
+        for i, r in enumerate(rows):
+            if r['id'] in by_id:
+                rows[i] = by_id.pop(r['id'])
+        rows.extend(by_id.values())
+        self.save(data)
+
+    def modify_releases(self, ids, update, check=None):
+        """
+        Read-modify-write of the releases in `ids` as one atomic file replace.
+        `update(release)` returns the new record, or None to leave it as is;
+        `check(found_ids)` runs before the write. If either raises, nothing
+        is written. Returns the ids that changed.
+        """
+        ids = set(ids)
+        data = self.load()
+        rows = data.get('releases', [])
+        found, changed = set(), []
+        for i, r in enumerate(rows):
+            if r['id'] in ids:
+                found.add(r['id'])
+                new = update(r)
+                if new is not None:
+                    rows[i] = new
+                    changed.append(r['id'])
+        if check:
+            check(found)
+        if changed:
+            self.save(data)
+        return changed
+
+    # --- SIDECARS ---
+    # Kept next to the catalog so writing them never changes its fingerprint (see SIDECAR LOGS)
+    def _load_sidecar(self, path):
+        rows, entries = read_sidecar(path)
+        self._sidecars[path] = [len(rows), entries]
+        return rows
+
+    def _save_sidecar(self, path, changed, removed):
+        counts = self._sidecars.setdefault(path, [0, 0])
+        counts[1] += append_sidecar(path, changed, removed)
+        if counts[1] > max(SIDECAR_COMPACT_MIN, counts[0]):
+            self._sidecars[path] = [compact_sidecar(path), 0]
+
+    # --- FORECAST STATE ---
+    @property
+    def state_path(self):
+        return self.path + '.forecast-state'
+
+    def load_forecast_state(self):
+        return self._load_sidecar(self.state_path)
+
+    def save_forecast_state(self, changed, removed=()):
+        self._save_sidecar(self.state_path, changed, removed)
+
+    # --- BACKTEST SCORES ---
+    @property
+    def backtest_path(self):
+        return self.path + '.backtest'
+
+    def load_backtest_scores(self):
+        return self._load_sidecar(self.backtest_path)
+
+    def save_backtest_scores(self, changed, removed=()):
+        self._save_sidecar(self.backtest_path, changed, removed)
+
+    # --- SHARED FORECASTS ---
+    # Precomputed gradient boosting rows, written by the one process that computes them (serve.py)
+    @property
+    def forecasts_path(self):
+        return self.path + '.forecasts'
+
+    def load_forecasts(self):
+        return self._load_sidecar(self.forecasts_path)
+
+    def save_forecasts(self, changed, removed=()):
+        self._save_sidecar(self.forecasts_path, changed, removed)
+
+    def shared_fingerprint(self, name):
+        """Changes whenever the 'backtest' scores or shared 'forecasts' are written."""
+        return file_fingerprint(f"{self.path}.{name}")
+
+    def close(self):
+        pass
+
+
+# --- SQLITE BACKEND ---
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('backtest', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('forecasts', 0);
+
+CREATE TABLE IF NOT EXISTS releases (
+    id TEXT PRIMARY KEY,
+    pos INTEGER NOT NULL,
+    artist TEXT, track_name TEXT, genre TEXT, bpm NUMERIC, image TEXT,
+    revenue NUMERIC, budget NUMERIC, sentiment NUMERIC,
+    history BLOB,
+    competitor_drop INTEGER, tiktok_trend TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS releases_pos ON releases (pos);
+CREATE INDEX IF NOT EXISTS releases_artist ON releases (artist);
+CREATE INDEX IF NOT EXISTS releases_genre ON releases (genre);
+CREATE INDEX IF NOT EXISTS releases_trend ON releases (tiktok_trend);
+
+CREATE TABLE IF NOT EXISTS customers (
+    id TEXT PRIMARY KEY,
+    pos INTEGER NOT NULL,
+    name TEXT, region TEXT, avg_order_val NUMERIC, bpm NUMERIC,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS customers_pos ON customers (pos);
+CREATE INDEX IF NOT EXISTS customers_region ON customers (region);
+
+CREATE TABLE IF NOT EXISTS forecast_state (release_id TEXT PRIMARY KEY, state TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS backtest_scores (release_id TEXT PRIMARY KEY, scores TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS forecasts (release_id TEXT PRIMARY KEY, forecast TEXT NOT NULL);
+"""
+
+# Fixed SQL strings so sqlite3's per-connection statement cache reuses the compiled plans
+SQL_VERSION = "SELECT value FROM meta WHERE key = 'version'"
+SQL_BUMP_VERSION = "UPDATE meta SET value = value + 1 WHERE key = 'version'"
+SQL_SHARED_VERSION = "SELECT value FROM meta WHERE key = ?"
+SQL_BUMP_SHARED = "UPDATE meta SET value = value + 1 WHERE key = ?"
+SQL_ALL_RELEASES = "SELECT * FROM releases ORDER BY pos"
+SQL_ALL_CUSTOMERS = "SELECT * FROM customers ORDER BY pos"
+SQL_RELEASE_BY_ID = "SELECT * FROM releases WHERE id = ?"
+SQL_CUSTOMER_BY_ID = "SELECT * FROM customers WHERE id = ?"
+SQL_MAX_PARAMS = 500   # ids per `IN (...)` query, well under SQLite's variable limit
+SQL_MAX_RELEASE_POS = "SELECT COALESCE(MAX(pos), -1) FROM releases"
+SQL_UPSERT_RELEASE = """
+INSERT INTO releases (id, pos, artist, track_name, genre, bpm, image, revenue, budget, sentiment,
+                      history, competitor_drop, tiktok_trend, extra)
+VALUES (:id, :pos, :artist, :track_name, :genre, :bpm, :image, :revenue, :budget, :sentiment,
+        :history, :competitor_drop, :tiktok_trend, :extra)
+ON CONFLICT(id) DO UPDATE SET
+    artist = excluded.artist, track_name = excluded.track_name, genre = excluded.genre,
+    bpm = excluded.bpm, image = excluded.image, revenue = excluded.revenue, budget = excluded.budget,
+    sentiment = excluded.sentiment, history = excluded.history,
+    competitor_drop = excluded.competitor_drop, tiktok_trend = excluded.tiktok_trend, extra = excluded.extra
+"""
+SQL_ALL_FORECAST_STATE = "SELECT release_id, state FROM forecast_state"
+SQL_UPSERT_FORECAST_STATE = """
+INSERT INTO forecast_state (release_id, state) VALUES (?, ?)
+ON CONFLICT(release_id) DO UPDATE SET state = excluded.state
+"""
+SQL_DELETE_FORECAST_STATE = "DELETE FROM forecast_state WHERE release_id = ?"
+SQL_ALL_BACKTEST_SCORES = "SELECT release_id, scores FROM backtest_scores"
+SQL_UPSERT_BACKTEST_SCORES = """
+INSERT INTO backtest_scores (release_id, scores) VALUES (?, ?)
+ON CONFLICT(release_id) DO UPDATE SET scores = excluded.scores
+"""
+SQL_DELETE_BACKTEST_SCORES = "DELETE FROM backtest_scores WHERE release_id = ?"
+SQL_ALL_FORECASTS = "SELECT release_id, forecast FROM forecasts"
+SQL_UPSERT_FORECAST = """
+INSERT INTO forecasts (release_id, forecast) VALUES (?, ?)
+ON CONFLICT(release_id) DO UPDATE SET forecast = excluded.forecast
+"""
+SQL_DELETE_FORECAST = "DELETE FROM forecasts WHERE release_id = ?"
+SQL_INSERT_CUSTOMER = """
+INSERT INTO customers (id, pos, name, region, avg_order_val, bpm, extra)
+VALUES (:id, :pos, :name, :region, :avg_order_val, :bpm, :extra)
+"""
+
+RELEASE_COLUMNS = ("id", "artist", "track_name", "genre", "bpm", "image")
+STAT_COLUMNS = ("revenue", "budget", "sentiment")
+CUSTOMER_COLUMNS = ("id", "name", "region", "avg_order_val", "bpm")
+
+
+def release_to_row(release, pos):
+    stats = dict(release.get('stats', {}))
+    signals = dict(release.get('market_signals', {}))
+    row = {k: release.get(k) for k in RELEASE_COLUMNS}
+    row.update({k: stats.pop(k, None) for k in STAT_COLUMNS})
+    row["pos"] = pos
+    row["history"] = pack_history(stats.pop('history', []))
+    drop = signals.pop('competitor_drop', None)
+    row["competitor_drop"] = None if drop is None else int(bool(drop))
+    row["tiktok_trend"] = signals.pop('tiktok_trend', None)
+    # Anything without a column of its own round-trips through `extra`
+    extra = {k: v for k, v in release.items() if k not in RELEASE_COLUMNS and k not in ('stats', 'market_signals')}
+    if stats:
+        extra['stats'] = stats
+    if signals:
+        extra['market_signals'] = signals
+    row["extra"] = json.dumps(extra) if extra else None
+    return row
+
+
+def row_to_release(row):
+    release = {k: row[k] for k in RELEASE_COLUMNS if row[k] is not None}
+    extra = json.loads(row["extra"]) if row["extra"] else {}
+    stats = {k: row[k] for k in STAT_COLUMNS if row[k] is not None}
+    stats["history"] = unpack_history(row["history"])
+    stats.update(extra.pop('stats', {}))
+    signals = {}
+    if row["competitor_drop"] is not None:
+        signals["competitor_drop"] = bool(row["competitor_drop"])
+    if row["tiktok_trend"] is not None:
+        signals["tiktok_trend"] = row["tiktok_trend"]
+    signals.update(extra.pop('market_signals', {}))
+    release.update(extra)
+    release["stats"] = stats
+    release["market_signals"] = signals
+    return release
+
+
+def customer_to_row(customer, pos):
+    row = {k: customer.get(k) for k in CUSTOMER_COLUMNS}
+    row["pos"] = pos
+    extra = {k: v for k, v in customer.items() if k not in CUSTOMER_COLUMNS}
+    row["extra"] = json.dumps(extra) if extra else None
+    return row
+
+
+def row_to_customer(row):
+    customer = {k: row[k] for k in CUSTOMER_COLUMNS if row[k] is not None}
+    if row["extra"]:
+        customer.update(json.loads(row["extra"]))
+    return customer
+
+
+class SQLiteBackend:
+    """
+    Indexed SQLite storage (WAL mode) with a small connection pool.
+
+    Every write bumps meta.version inside its transaction, which is what
+    fingerprint() watches, so the DataStore reloads after any committed write
+    from any process, and never sees a half-applied one.
+    """
+
+    kind = "sqlite"
+
+    def __init__(self, path, pool_size=4):
+        self.path = path
+        self._pool = queue.Queue()
+        self._lock = threading.Lock()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30,
+                               isolation_level=None, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT with a version bump; rolls back on error."""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute(SQL_BUMP_VERSION)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    # --- READS ---
+    def fingerprint(self):
+        with self.connection() as conn:
+            return (self.path, conn.execute(SQL_VERSION).fetchone()[0])
+
+    def load(self):
+        with self.connection() as conn:
+            # One read transaction so releases and customers come from the same commit
+            conn.execute("BEGIN")
+            try:
+                releases = [row_to_release(r) for r in conn.execute(SQL_ALL_RELEASES)]
+                customers = [row_to_customer(r) for r in conn.execute(SQL_ALL_CUSTOMERS)]
+            finally:
+                conn.execute("COMMIT")
+        return {"releases": releases, "customers": customers}
+
+    def get_release(self, release_id):
+        with self.connection() as conn:
+            row = conn.execute(SQL_RELEASE_BY_ID, (release_id,)).fetchone()
+        return row_to_release(row) if row else None
+
+    def get_customer(self, customer_id):
+        with self.connection() as conn:
+            row = conn.execute(SQL_CUSTOMER_BY_ID, (customer_id,)).fetchone()
+        return row_to_customer(row) if row else None
+
+    # --- WRITES ---
+    def save(self, data):
+        """Replace the whole catalog in one transaction."""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM releases")
+            conn.execute("DELETE FROM customers")
+            self.insert_chunk(conn, data.get('releases', []), data.get('customers', []))
+
+    def insert_chunk(self, conn, releases=(), customers=(), release_pos=0, customer_pos=0):
+        conn.executemany(SQL_UPSERT_RELEASE, (release_to_row(r, release_pos + i) for i, r in enumerate(releases)))
+        conn.executemany(SQL_INSERT_CUSTOMER, (customer_to_row(c, customer_pos + i) for i, c in enumerate(customers)))
+
+    def upsert_releases(self, releases):
+        """Insert or update individual releases; untouched rows are not rewritten."""
+        with self.transaction() as conn:
+            next_pos = conn.execute(SQL_MAX_RELEASE_POS).fetchone()[0] + 1
+            rows = []
+            for release in releases:
+                existing = conn.execute("SELECT pos FROM releases WHERE id = ?", (release['id'],)).fetchone()
+                if existing:
+                    pos = existing[0]
+                else:
+                    pos, next_pos = next_pos, next_pos + 1
+                rows.append(release_to_row(release, pos))
+            conn.executemany(SQL_UPSERT_RELEASE, rows)
+
+    def modify_releases(self, ids, update, check=None):
+        """
+        Read-modify-write of the releases in `ids` inside one transaction (see
+        JsonBackend.modify_releases); only the changed rows are rewritten.
+        """
+        ids = list(dict.fromkeys(ids))
+        with self.transaction() as conn:
+            found, rows = set(), []
+            for start in range(0, len(ids), SQL_MAX_PARAMS):
+                chunk = ids[start:start + SQL_MAX_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                for row in conn.execute(f"SELECT * FROM releases WHERE id IN ({placeholders})", chunk):
+                    found.add(row["id"])
+                    new = update(row_to_release(row))
+                    if new is not None:
+                        rows.append(release_to_row(new, row["pos"]))
+            if check:
+                check(found)
+            conn.executemany(SQL_UPSERT_RELEASE, rows)
+        return [row["id"] for row in rows]
+
+    # --- FORECAST STATE ---
+    def load_forecast_state(self):
+        with self.connection() as conn:
+            return {rid: json.loads(state) for rid, state in conn.execute(SQL_ALL_FORECAST_STATE)}
+
+    def save_forecast_state(self, changed, removed=()):
+        """Only changed rows are written. Derived data: no version bump, so no catalog reload."""
+        self._save_derived(SQL_UPSERT_FORECAST_STATE, SQL_DELETE_FORECAST_STATE, changed, removed)
+
+    def _save_derived(self, upsert, delete, changed, removed, shared=None):
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(upsert, ((rid, json.dumps(row, separators=(',', ':'))) for rid, row in changed.items()))
+                conn.executemany(delete, ((rid,) for rid in removed))
+                if shared:
+                    conn.execute(SQL_BUMP_SHARED, (shared,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    # --- BACKTEST SCORES ---
+    def load_backtest_scores(self):
+        with self.connection() as conn:
+            return {rid: json.loads(scores) for rid, scores in conn.execute(SQL_ALL_BACKTEST_SCORES)}
+
+    def save_backtest_scores(self, changed, removed=()):
+        self._save_derived(SQL_UPSERT_BACKTEST_SCORES, SQL_DELETE_BACKTEST_SCORES, changed, removed, shared="backtest")
+
+    # --- SHARED FORECASTS ---
+    def load_forecasts(self):
+        with self.connection() as conn:
+            return {rid: json.loads(forecast) for rid, forecast in conn.execute(SQL_ALL_FORECASTS)}
+
+    def save_forecasts(self, changed, removed=()):
+        self._save_derived(SQL_UPSERT_FORECAST, SQL_DELETE_FORECAST, changed, removed, shared="forecasts")
+
+    def shared_fingerprint(self, name):
+        """Bumped by every write of the 'backtest' scores or shared 'forecasts' (not a catalog change)."""
+        with self.connection() as conn:
+            return conn.execute(SQL_SHARED_VERSION, (name,)).fetchone()[0]
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+# --- FACTORY ---
+BACKENDS = {"json": JsonBackend, "sqlite": SQLiteBackend}
+DEFAULT_PATHS = {"json": "database.json", "sqlite": "database.db"}
+
+
+def open_backend(kind="json", path=None):
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{kind}' (expected one of {', '.join(BACKENDS)})")
+    return BACKENDS[kind](path or DEFAULT_PATHS[kind])
+
+
+def import_json(json_path, sqlite_path):
+    """One-shot import of the current database.json schema into SQLite."""
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+    backend = SQLiteBackend(sqlite_path)
+    backend.save(data)
+    backend.close()
+    return len(data.get('releases', [])), len(data.get('customers', []))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Storage backend tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="Import database.json into SQLite")
+    imp.add_argument("json_path", nargs="?", default="database.json")
+    imp.add_argument("sqlite_path", nargs="?", default="database.db")
+    exp = sub.add_parser("export", help="Export SQLite back to database.json")
+    exp.add_argument("sqlite_path", nargs="?", default="database.db")
+    exp.add_argument("json_path", nargs="?", default="database.json")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        n_rel, n_cust = import_json(args.json_path, args.sqlite_path)
+        print(f"✅ Imported {n_rel} releases and {n_cust} customers into {args.sqlite_path}")
+    else:
+        JsonBackend(args.json_path).save(SQLiteBackend(args.sqlite_path).load())
+        print(f"✅ Exported {args.sqlite_path} to {args.json_path}")
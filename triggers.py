@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import string
+import threading
+from collections import defaultdict, deque
+
+import numpy as np
+
+SLOPE_WINDOW = 7   # days of history behind the slope signal
+
+# --- RULES ---
+# Declared as data (TRIGGER_RULES=path/to/rules.json replaces this list).
+# `when` is a list of [signal, op, value] conditions that must all hold;
+# `msg` may reference signals, e.g. "{slope_7d:+.1%}".
+DEFAULT_RULES = [
+    {"id": "competitor_drop", "type": "Competition Alert", "color": "red",
+     "msg": "Major competitor released today.",
+     "when": [["competitor_drop", "==", True]]},
+    {"id": "tiktok_trend", "type": "Viral Signal", "color": "green",
+     "msg": "Genre trending on TikTok.",
+     "when": [["tiktok_trend", "in", ["High", "Viral"]]]},
+    {"id": "momentum_up", "type": "Momentum", "color": "green",
+     "msg": "Daily sales up {slope_7d:+.1%} per day this week.",
+     "when": [["slope_7d", ">=", 0.05]]},
+    {"id": "momentum_down", "type": "Momentum Alert", "color": "red",
+     "msg": "Daily sales down {slope_7d:+.1%} per day this week.",
+     "when": [["slope_7d", "<=", -0.03]]},
+    {"id": "low_sentiment", "type": "Sentiment Alert", "color": "red",
+     "msg": "Audience sentiment at {sentiment:.1f}/10.",
+     "when": [["sentiment", "<", 5]]},
+    {"id": "under_budget", "type": "Budget Alert", "color": "red",
+     "msg": "Revenue covers {roi:.0%} of budget.",
+     "when": [["roi", "<", 1]]},
+]
+
+
+# --- SIGNALS ---
+# name -> kind; every signal is a column over the releases being evaluated
+SIGNALS = {
+    "slope_7d": "number",       # OLS slope of the last SLOPE_WINDOW days / their mean
+    "sentiment": "number",
+    "revenue": "number",
+    "budget": "number",
+    "roi": "number",            # revenue / budget
+    "last_day": "number",
+    "competitor_drop": "bool",
+    "tiktok_trend": "text",
+}
+
+
+def relative_slopes(histories, window=SLOPE_WINDOW):
+    """Per-series OLS slope over the last `window` points, as a fraction of their mean (0 if undefined)."""
+    n = len(histories)
+    y = np.full((n, window), np.nan)
+    for i, history in enumerate(histories):
+        tail = history[-window:]
+        if tail:
+            y[i, window - len(tail):] = tail
+    return tail_slopes(y)
+
+
+def tail_slopes(y):
+    """relative_slopes of an (n, window) matrix of series tails, NaN-padded on the left."""
+    window = y.shape[1]
+    valid = ~np.isnan(y)
+    count = valid.sum(axis=1)
+    x = np.broadcast_to(np.arange(window, dtype=float), y.shape)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean = np.where(valid, x, 0).sum(axis=1) / count
+        y_mean = np.where(valid, y, 0).sum(axis=1) / count
+        dx = np.where(valid, x - x_mean[:, None], 0)
+        dy = np.where(valid, y - y_mean[:, None], 0)
+        var = (dx * dx).sum(axis=1)
+        slope = (dx * dy).sum(axis=1) / var
+        relative = slope / y_mean
+    return np.where((count >= 2) & (var > 0) & (y_mean > 0), relative, 0.0)
+
+
+def extract_signals(releases):
+    """Signal columns for a list of release records."""
+    stats = [r.get('stats', {}) for r in releases]
+    markets = [r.get('market_signals', {}) or {} for r in releases]
+    histories = [s.get('history', []) for s in stats]
+    revenue = np.array([s.get('revenue') or 0 for s in stats], dtype=float)
+    budget = np.array([s.get('budget') or 0 for s in stats], dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        roi = np.where(budget > 0, revenue / budget, np.inf)
+    return {
+        "slope_7d": relative_slopes(histories),
+        "sentiment": np.array([s.get('sentiment', np.nan) for s in stats], dtype=float),
+        "revenue": revenue,
+        "budget": budget,
+        "roi": roi,
+        "last_day": np.array([h[-1] if h else 0 for h in histories], dtype=float),
+        "competitor_drop": np.array([bool(m.get('competitor_drop')) for m in markets]),
+        "tiktok_trend": np.array([str(m.get('tiktok_trend') or '') for m in markets], dtype=object),
+    }
+
+
+def signal_key(release):
+    """Changes whenever any input of any signal changes."""
+    stats = release.get('stats', {})
+    markets = release.get('market_signals', {}) or {}
+    return (tuple(stats.get('history', [])[-SLOPE_WINDOW:]),
+            stats.get('revenue'), stats.get('budget'), stats.get('sentiment'),
+            bool(markets.get('competitor_drop')), markets.get('tiktok_trend'))
+
+
+# --- COMPILATION ---
+_OPS = {
+    "==": lambda col, v: col == v,
+    "!=": lambda col, v: col != v,
+    ">": lambda col, v: col > v,
+    ">=": lambda col, v: col >= v,
+    "<": lambda col, v: col < v,
+    "<=": lambda col, v: col <= v,
+    "in": lambda col, v: np.isin(col, list(v)),
+    "not in": lambda col, v: ~np.isin(col, list(v)),
+}
+
+
+class Rule:
+    """One declared rule compiled to a vectorized predicate: columns -> bool mask."""
+
+    def __init__(self, spec):
+        try:
+            self.id = spec["id"]
+            self.type = spec.get("type", self.id)
+            self.color = spec.get("color", "red")
+            self.msg = spec.get("msg", "")
+            conditions = spec["when"]
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid rule {spec!r}: missing {e}") from None
+        self.conditions = []
+        for condition in conditions:
+            signal, op, value = condition
+            if signal not in SIGNALS:
+                raise ValueError(f"Rule {self.id}: unknown signal '{signal}'. Available: {', '.join(SIGNALS)}")
+            if op not in _OPS:
+                raise ValueError(f"Rule {self.id}: unknown operator '{op}'")
+            self.conditions.append((signal, _OPS[op], value))
+        self.fields = sorted({f for _, f, _, _ in string.Formatter().parse(self.msg) if f})
+        unknown = [f for f in self.fields if f not in SIGNALS]
+        if unknown:
+            raise ValueError(f"Rule {self.id}: msg references unknown signal(s) {', '.join(unknown)}")
+
+    def evaluate(self, columns, n):
+        mask = np.ones(n, dtype=bool)
+        for signal, op, value in self.conditions:
+            mask &= op(columns[signal], value)
+        return mask
+
+    def alerts(self, columns, rows):
+        """Alert dicts for the matching `rows`; a static msg shares one (read-only) dict."""
+        if not self.fields:
+            return [{"rule": self.id, "type": self.type, "color": self.color, "msg": self.msg}] * len(rows)
+        values = [columns[f][rows].tolist() for f in self.fields]
+        out = []
+        for row_values in zip(*values):
+            try:
+                msg = self.msg.format(**dict(zip(self.fields, row_values)))
+            except (ValueError, TypeError):
+                msg = self.msg
+            out.append({"rule": self.id, "type": self.type, "color": self.color, "msg": msg})
+        return out
+
+
+def compile_rules(specs):
+    rules = [Rule(spec) for spec in specs]
+    ids = [rule.id for rule in rules]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Rule ids must be unique")
+    return rules
+
+
+# --- ENGINE ---
+class TriggerEngine:
+    """
+    Evaluates every rule over the whole catalog on each new data snapshot.
+
+    - Signals are extracted as columns and each rule is one vectorized mask
+      over them, so a pass is a handful of numpy ops whatever the catalog size.
+    - Only releases whose signal inputs changed (see signal_key) are
+      re-evaluated; the rest keep their alerts from the previous pass.
+    - Active alerts are queryable (active), as are raised / cleared events
+      after the first pass (events); each change is also
+      handed to `notify` as a merge patch on {"active": {release: {rule: alert}}}
+      for the push stream.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, history=1000, notify=None):
+        self.rules = compile_rules(rules)
+        self.notify = notify
+        self.version = None
+        self.active = {}        # release id -> {rule id: alert}
+        self.events = deque(maxlen=history)
+        self.seq = 0
+        self.evaluations = 0
+        self.last_evaluated = 0
+        self.last_eval_s = None
+        self._keys = {}         # release id -> signal_key at the last evaluation
+        self._lock = threading.Lock()
+
+    def evaluate(self, snap):
+        """Bring alerts up to date with `snap`; returns the number of releases re-evaluated."""
+        with self._lock:
+            if snap.version == self.version:
+                return 0
+            started = time.perf_counter()
+            releases = snap.data.get('releases', [])
+            keys = {}
+            changed = []
+            for r in releases:
+                key = keys[r['id']] = signal_key(r)
+                if self._keys.get(r['id']) != key:
+                    changed.append(r)
+            removed = self._keys.keys() - keys.keys()
+            patch = {}
+            if changed:
+                self._evaluate(changed, patch)
+            for rid in removed:
+                for rule_id in self.active.pop(rid, {}):
+                    self._event("cleared", rid, rule_id)
+                patch[rid] = None
+            self._keys = keys
+            self.version = snap.version
+            self.evaluations += 1
+            self.last_evaluated = len(changed)
+            self.last_eval_s = round(time.perf_counter() - started, 4)
+        if patch and self.notify:
+            self.notify({"active": patch})
+        return len(changed)
+
+    def _evaluate(self, releases, patch):
+        n = len(releases)
+        columns = extract_signals(releases)
+        baseline = self.version is None  # the first pass sets the initial state; no events for it
+        matched = defaultdict(dict)
+        for rule in self.rules:
+            rows = np.flatnonzero(rule.evaluate(columns, n))
+            for row, alert in zip(rows.tolist(), rule.alerts(columns, rows)):
+                matched[row][rule.id] = alert
+
+        for row, r in enumerate(releases):
+            rid = r['id']
+            new = matched.get(row, {})
+            old = self.active.get(rid, {})
+            if new == old:
+                continue
+            if baseline:
+                self.active[rid] = patch[rid] = new
+                continue
+            for rule_id in old.keys() - new.keys():
+                self._event("cleared", rid, rule_id)
+            for rule_id, alert in new.items():
+                if rule_id not in old:  # a still-matching rule with a new msg is an update, not an event
+                    self._event("raised", rid, rule_id, alert)
+            if new:
+                self.active[rid] = new
+                patch[rid] = merge_alerts(old, new) if old else new
+            else:
+                self.active.pop(rid, None)
+                patch[rid] = None
+
+    def _event(self, kind, release_id, rule_id, alert=None):
+        self.seq += 1
+        event = {"seq": self.seq, "at": time.time(), "event": kind, "release_id": release_id, "rule": rule_id}
+        if alert:
+            event.update(alert)
+        self.events.append(event)
+
+    # --- QUERIES ---
+    def alerts_for(self, release_id):
+        return list(self.active.get(release_id, {}).values())
+
+    def query(self, rule=None, color=None, release_ids=None, limit=100):
+        """Active alerts filtered by rule id / color / release ids, at most `limit`."""
+        out = []
+        if release_ids is None:
+            source = self.active.items()
+        else:
+            source = ((rid, self.active.get(rid, {})) for rid in release_ids)
+        for rid, alerts in source:
+            for alert in alerts.values():
+                if (rule is None or alert["rule"] == rule) and (color is None or alert["color"] == color):
+                    out.append({"release_id": rid, **alert})
+                    if len(out) >= limit:
+                        return out
+        return out
+
+    def events_since(self, seq=0, limit=100):
+        return [e for e in self.events if e["seq"] > seq][:limit]
+
+    def stats(self):
+        return {
+            "rules": [rule.id for rule in self.rules],
+            "version": self.version,
+            "releases_with_alerts": len(self.active),
+            "active_alerts": sum(len(a) for a in self.active.values()),
+            "evaluations": self.evaluations,
+            "last_evaluated": self.last_evaluated,
+            "last_eval_s": self.last_eval_s,
+            "event_seq": self.seq,
+        }
+
+
+def merge_alerts(old, new):
+    """Merge patch turning one release's {rule: alert} into another."""
+    patch = {rule_id: None for rule_id in old.keys() - new.keys()}
+    patch.update({rule_id: alert for rule_id, alert in new.items() if old.get(rule_id) != alert})
+    return patch
+
+
+def from_env(notify=None):
+    """TRIGGER_RULES: JSON file with a list of rules (default DEFAULT_RULES); TRIGGER_HISTORY: events kept."""
+    rules = DEFAULT_RULES
+    path = os.getenv("TRIGGER_RULES")
+    if path:
+        with open(path) as f:
+            rules = json.load(f)
+    return TriggerEngine(rules, history=int(os.getenv("TRIGGER_HISTORY", "1000")), notify=notify)
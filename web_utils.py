@@ -0,0 +1,203 @@
+import json
+import gzip
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+
+from metrics import span
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+# --- FIELD PROJECTION ---
+def parse_fields(fields):
+    """'id,artist,stats.revenue' -> [('id',), ('artist',), ('stats', 'revenue')]"""
+    if not fields:
+        return None
+    return [tuple(part for part in f.strip().split('.') if part) for f in fields.split(',') if f.strip()]
+
+
+def project(record, paths):
+    """Copy only the requested (possibly nested) keys of a record."""
+    if not paths:
+        return record
+    out = {}
+    for path in paths:
+        src, dst = record, out
+        for i, key in enumerate(path):
+            if not isinstance(src, dict) or key not in src:
+                break
+            if i == len(path) - 1:
+                dst[key] = src[key]
+            else:
+                src = src[key]
+                dst = dst.setdefault(key, {})
+    return out
+
+
+# --- CURSORS ---
+# Opaque to the client: base64 of {"o": next offset, "id": last id served}.
+# The id lets us resume at the right row even if a reload shifted positions.
+def encode_cursor(offset, last_id):
+    raw = json.dumps({"o": offset, "id": last_id}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        return int(payload["o"]), payload.get("id")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# --- ETAGS & ENCODING ---
+def make_etag(*parts):
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(',')]
+    return "*" in candidates or etag in candidates or etag.removeprefix("W/") in candidates
+
+
+def pick_encoding(request):
+    accepted = request.headers.get("accept-encoding", "").lower()
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+class BodyCache:
+    """LRU of serialized (and compressed) response bodies keyed by ETag, bounded in bytes."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        body = build()
+        if len(body) > self.max_bytes:
+            return body
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = body
+                self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+        return body
+
+
+body_cache = BodyCache()
+
+MIN_COMPRESS_SIZE = 1024
+
+
+def cached_json_response(request, etag, build_payload):
+    """
+    JSON response with ETag / If-None-Match support. The payload is only built,
+    serialized and compressed on a cache miss, so repeat hits on the same
+    snapshot cost a dict lookup.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    with span("serialize"):
+        raw = body_cache.get_or_build((etag, None), lambda: json.dumps(build_payload(), separators=(',', ':')).encode())
+        encoding = pick_encoding(request) if len(raw) >= MIN_COMPRESS_SIZE else None
+        body = body_cache.get_or_build((etag, encoding), lambda: _compress(raw, encoding)) if encoding else raw
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# --- NDJSON STREAMING ---
+def ndjson_response(rows, etag=None, chunk_rows=500):
+    """
+    Stream one JSON document per line. Rows are serialized in small batches as
+    the client reads, so the full body is never held in memory.
+    (Compression for streams is handled by the GZip middleware.)
+    """
+    def generate():
+        buf = []
+        for row in rows:
+            buf.append(json.dumps(row, separators=(',', ':')))
+            if len(buf) >= chunk_rows:
+                yield ('\n'.join(buf) + '\n').encode()
+                buf = []
+        if buf:
+            yield ('\n'.join(buf) + '\n').encode()
+
+    headers = {"ETag": etag} if etag else {}
+    return StreamingResponse(generate(), media_type="application/x-ndjson", headers=headers)
+
+
+# --- SERVER-SENT EVENTS ---
+async def _timed(chunks, stage):
+    iterator = chunks.__aiter__()
+    while True:
+        with span(stage):
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+        yield chunk
+
+
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n".encode()
+
+
+def sse_response(chunks, error_html=None):
+    """
+    Relay an async iterator of text chunks as SSE. If the client disconnects,
+    Starlette cancels this generator and closing `chunks` stops the upstream call.
+    """
+    async def generate():
+        try:
+            # Time only the waits on the upstream, not the writes to the client
+            async for chunk in _timed(chunks, "llm"):
+                yield sse_event({"delta": chunk})
+            yield sse_event({}, event="done")
+        except Exception as e:
+            yield sse_event({"error": str(e), "html": error_html}, event="error")
+        finally:
+            await chunks.aclose()
+
+    return sse_frames_response(generate())
+
+
+def sse_frames_response(frames):
+    """Stream already-encoded SSE frames (bytes) as-is."""
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(frames, media_type="text/event-stream", headers=headers)